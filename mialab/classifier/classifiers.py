@@ -0,0 +1,190 @@
+"""This module contains the classifiers, which segment the brain tissues from the feature matrices.
+
+The classifiers are scikit-learn estimators created by name (see :data:`CLASSIFIERS`):
+
+- ``forest``: The random forest (:class:`sklearn.ensemble.RandomForestClassifier`), which can also be trained
+  out-of-core (see :mod:`mialab.classifier.out_of_core`).
+- ``hist_gradient_boosting``: The histogram-based gradient boosting
+  (:class:`sklearn.ensemble.HistGradientBoostingClassifier`). It bins the features into at most 255 bins, which is
+  the identity for features quantized to at most 255 bins (see :mod:`mialab.classifier.quantization`), and stops
+  early on held-out subjects if given.
+"""
+import contextlib
+import typing as t
+
+import numpy as np
+import sklearn.base as sk_base
+import sklearn.ensemble as sk_ensemble
+import sklearn.metrics as sk_metrics
+import sklearn.utils as sk_utils
+import threadpoolctl
+
+FOREST_PARAMS = {'n_estimators': 50,
+                 'max_depth': 5,
+                 'criterion': 'gini',
+                 'min_samples_leaf': 3,
+                 'min_samples_split': 2,
+                 'bootstrap': True}
+
+HIST_GRADIENT_BOOSTING_PARAMS = {'max_iter': 200,
+                                 'learning_rate': 0.1,
+                                 'max_leaf_nodes': 31,
+                                 'min_samples_leaf': 20,
+                                 'l2_regularization': 0.0,
+                                 'categorical_features': None,
+                                 'n_iter_no_change': 10}
+
+
+def _create_forest(n_features: int, **params) -> sk_ensemble.RandomForestClassifier:
+    # all features are considered at each split
+    return sk_ensemble.RandomForestClassifier(**{'max_features': n_features, **FOREST_PARAMS, **params})
+
+
+def _create_hist_gradient_boosting(n_features: int, **params) -> sk_ensemble.HistGradientBoostingClassifier:
+    # fit_classifier stops early if there is validation data
+    return sk_ensemble.HistGradientBoostingClassifier(**{'early_stopping': False, **HIST_GRADIENT_BOOSTING_PARAMS,
+                                                         **params})
+
+
+CLASSIFIERS = {'forest': _create_forest,
+               'hist_gradient_boosting': _create_hist_gradient_boosting}
+
+
+def create_classifier(name: str, n_features: int, **params) -> sk_base.ClassifierMixin:
+    """Creates a classifier.
+
+    Args:
+        name (str): The name of the classifier (see :data:`CLASSIFIERS`).
+        n_features (int): The number of features.
+        **params: Parameters of the classifier, which override the defaults (e.g. :data:`FOREST_PARAMS`).
+
+    Returns:
+        sk_base.ClassifierMixin: The unfitted classifier.
+    """
+    if name not in CLASSIFIERS:
+        raise ValueError('Unknown classifier {}, expected one of {}'.format(name, ', '.join(CLASSIFIERS)))
+    return CLASSIFIERS[name](n_features, **params)
+
+
+@contextlib.contextmanager
+def limit_threads(classifier, n_jobs: int) -> t.Iterator:
+    """Limits the parallelism of a classifier to a number of jobs.
+
+    Classifiers with ``n_jobs`` (e.g. the forest and the :class:`FlatForest
+    <mialab.classifier.flat_forest.FlatForest>`) get the number of jobs, which is restored afterwards. The others (e.g.
+    the gradient boosting) are limited to as many OpenMP threads.
+
+    Args:
+        classifier: The classifier.
+        n_jobs (int): The number of jobs.
+
+    Yields:
+        The classifier.
+    """
+    if hasattr(classifier, 'n_jobs'):
+        classifier_n_jobs = classifier.n_jobs
+        classifier.n_jobs = n_jobs
+        try:
+            yield classifier
+        finally:
+            classifier.n_jobs = classifier_n_jobs
+    else:
+        with threadpoolctl.threadpool_limits(limits=n_jobs, user_api='openmp'):
+            yield classifier
+
+
+def fit_classifier(classifier: sk_base.ClassifierMixin, data: np.ndarray, labels: np.ndarray,
+                   data_val: np.ndarray = None, labels_val: np.ndarray = None) -> sk_base.ClassifierMixin:
+    """Fits a classifier.
+
+    The gradient boosting stops early if its loss on the validation data does not improve for ``n_iter_no_change``
+    iterations. For the other classifiers, the validation data is only used to report the accuracy.
+
+    Args:
+        classifier (sk_base.ClassifierMixin): The classifier.
+        data (np.ndarray): The features of shape (n_samples, n_features).
+        labels (np.ndarray): The labels of shape (n_samples,).
+        data_val (np.ndarray): The features of the held-out subjects (no validation if None).
+        labels_val (np.ndarray): The labels of the held-out subjects.
+
+    Returns:
+        sk_base.ClassifierMixin: The fitted classifier.
+    """
+    if isinstance(classifier, sk_ensemble.HistGradientBoostingClassifier) and data_val is not None:
+        _fit_early_stopping(classifier, data, labels, data_val, labels_val)
+    else:
+        classifier.fit(data, labels)
+
+    if data_val is not None:
+        print(' Validation accuracy: {:.4f}'.format(classifier.score(data_val, labels_val)))
+    return classifier
+
+
+def _fit_early_stopping(classifier: sk_ensemble.HistGradientBoostingClassifier, data: np.ndarray, labels: np.ndarray,
+                        data_val: np.ndarray, labels_val: np.ndarray):
+    """Fits the gradient boosting with the number of iterations, after which the validation loss stops improving.
+
+    The boosting grows by ``n_iter_no_change`` iterations at a time (warm start) until the validation loss of
+    ``staged_predict_proba`` did not improve by more than ``tol`` for ``n_iter_no_change`` iterations, and is then
+    refitted with the best number of iterations. Passing the validation data to ``fit`` instead would require
+    scikit-learn 1.7 or later.
+    """
+    # the refit must bin the features as the first fit
+    if classifier.random_state is None:
+        classifier.set_params(random_state=sk_utils.check_random_state(None).randint(np.iinfo(np.int32).max))
+
+    max_iter, n_iter_no_change = classifier.max_iter, classifier.n_iter_no_change
+    classifier.set_params(early_stopping=False, warm_start=True)
+    n_iter, best_iter, best_loss = 0, 0, np.inf
+    while n_iter < max_iter and n_iter - best_iter < n_iter_no_change:
+        classifier.set_params(max_iter=min(n_iter + n_iter_no_change, max_iter))
+        classifier.fit(data, labels)
+        for stage, probabilities in enumerate(classifier.staged_predict_proba(data_val), 1):
+            if stage <= n_iter:
+                continue
+            loss = sk_metrics.log_loss(labels_val, probabilities, labels=classifier.classes_)
+            if loss < best_loss - classifier.tol:
+                best_iter, best_loss = stage, loss
+        n_iter = classifier.n_iter_
+
+    classifier.set_params(max_iter=best_iter, warm_start=False)
+    if best_iter < n_iter:
+        classifier.fit(data, labels)
+    print(' Stopped after {} of {} iterations'.format(classifier.n_iter_, max_iter))
+
+
+def predict(classifier, data: np.ndarray, probability_dtype=np.uint8) -> t.Tuple[np.ndarray, np.ndarray]:
+    """Predicts the classes and the class probabilities in a single pass.
+
+    The classes are the ones with the largest probability (as by ``predict`` of the classifiers), such that the
+    trees are only evaluated once. The probabilities are quantized to the range of an unsigned integer type (see
+    :func:`quantize_probabilities`) to save memory.
+
+    Args:
+        classifier: The fitted classifier.
+        data (np.ndarray): The features of shape (n_samples, n_features).
+        probability_dtype: The type of the probabilities (an unsigned integer or a floating point type).
+
+    Returns:
+        tuple: The classes of shape (n_samples,) and the probabilities of shape (n_samples, n_classes).
+    """
+    probabilities = classifier.predict_proba(data)
+    predictions = classifier.classes_.take(np.argmax(probabilities, axis=1), axis=0)
+    return predictions, quantize_probabilities(probabilities, probability_dtype)
+
+
+def quantize_probabilities(probabilities: np.ndarray, dtype=np.uint8) -> np.ndarray:
+    """Quantizes probabilities in [0, 1] to the range of an unsigned integer type.
+
+    Args:
+        probabilities (np.ndarray): The probabilities.
+        dtype: The unsigned integer type (floating point types only convert the probabilities).
+
+    Returns:
+        np.ndarray: The probabilities scaled by the maximum of the type and rounded.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return probabilities.astype(dtype, copy=False)
+    scale = np.iinfo(dtype).max
+    return np.rint(probabilities * scale).astype(dtype)
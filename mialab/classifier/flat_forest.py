@@ -0,0 +1,171 @@
+"""This module contains the inference of random forests on flat node arrays.
+
+A :class:`FlatForest` evaluates all trees of a forest at once: the nodes of the trees are concatenated into contiguous
+arrays (see :func:`mialab.classifier.persistence.get_flat_forest_arrays`) and a chunk of samples descends one level
+of all trees per step with vectorized numpy operations. The chunks are evaluated by a pool of threads, since numpy
+releases the GIL. The probabilities are identical to the ones of
+:meth:`sklearn.ensemble.RandomForestClassifier.predict_proba` (with ``n_jobs=1``).
+"""
+import concurrent.futures
+import typing as t
+
+import joblib
+import numpy as np
+import sklearn.ensemble as sk_ensemble
+
+import mialab.classifier.persistence as pers
+
+
+class FlatForest:
+    """Represents a random forest, which is evaluated on flat node arrays."""
+
+    def __init__(self, arrays: t.Dict[str, np.ndarray], classes: np.ndarray, n_jobs: int = 1,
+                 chunk_size: int = 4096):
+        """Initializes a new instance of the FlatForest class.
+
+        Args:
+            arrays (dict): The node arrays of the trees (see
+                :func:`mialab.classifier.persistence.get_flat_forest_arrays`).
+            classes (np.ndarray): The classes.
+            n_jobs (int): The number of threads as in scikit-learn, i.e. None means 1 and negative values count back
+                from the number of cores (-1 uses all cores).
+            chunk_size (int): The number of samples per chunk.
+        """
+        self.classes_ = np.asarray(classes)
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+
+        offsets = np.asarray(arrays['tree_offsets'])
+        self.n_trees = len(offsets) - 1
+        self.depth = int(np.max(arrays['max_depth'])) if self.n_trees > 0 else 0
+        self.roots = offsets[:-1, np.newaxis].astype(np.int32)
+
+        # the children of node i are at 2 * i and 2 * i + 1 (left and right) as global node indices, where leaves are
+        # their own children, such that samples stay in a leaf until all samples reached a leaf
+        node_tree = np.repeat(np.arange(self.n_trees), np.diff(offsets))
+        is_leaf = np.asarray(arrays['left_child']) < 0
+        node_ids = np.arange(len(node_tree))
+        self.children = np.stack([np.where(is_leaf, node_ids, np.asarray(arrays['left_child']) + offsets[node_tree]),
+                                  np.where(is_leaf, node_ids, np.asarray(arrays['right_child']) + offsets[node_tree])],
+                                 axis=-1).astype(np.int32).ravel()
+        self.feature = np.where(is_leaf, 0, arrays['feature']).astype(np.int32)
+        self.missing_go_to_left = np.asarray(arrays['missing_go_to_left']).astype(bool)
+
+        # the trees compare the float32 features with double thresholds, which is equal to a comparison with the largest
+        # float32 not greater than the threshold
+        threshold = np.where(is_leaf, 0, arrays['threshold'])
+        self.threshold = threshold.astype(np.float32)
+        rounded_up = self.threshold.astype(np.float64) > threshold
+        self.threshold[rounded_up] = np.nextafter(self.threshold[rounded_up], np.float32(-np.inf))
+
+        # older versions of scikit-learn store the class counts instead of the fractions in the nodes
+        value = np.asarray(arrays['value'], np.float64)
+        normalizer = value.sum(axis=1, keepdims=True)
+        if not np.allclose(normalizer[~is_leaf | (normalizer[:, 0] > 0)], 1):
+            normalizer[normalizer == 0.0] = 1.0
+            value = value / normalizer
+        self.probabilities = value
+
+    @classmethod
+    def from_forest(cls, forest: sk_ensemble.RandomForestClassifier, **kwargs) -> 'FlatForest':
+        """Creates the flat forest of a fitted forest.
+
+        Args:
+            forest (sk_ensemble.RandomForestClassifier): The fitted forest.
+            **kwargs: The arguments of :class:`FlatForest` (``n_jobs`` defaults to the one of the forest).
+
+        Returns:
+            FlatForest: The flat forest.
+        """
+        kwargs.setdefault('n_jobs', forest.n_jobs)
+        return cls(pers.get_flat_forest_arrays(forest), forest.classes_, **kwargs)
+
+    def apply(self, data: np.ndarray) -> np.ndarray:
+        """Gets the leaf of each tree the samples end up in.
+
+        Args:
+            data (np.ndarray): The features of shape (n_samples, n_features).
+
+        Returns:
+            np.ndarray: The global node indices of shape (n_trees, n_samples).
+        """
+        # the features are compared as float32 like by the trees
+        data = np.ascontiguousarray(data, np.float32)
+        has_missing = np.isnan(data).any()
+        if self.depth == 0 or data.shape[0] == 0:
+            return np.broadcast_to(self.roots, (self.n_trees, data.shape[0])).copy()
+
+        # all samples start at the roots, whose features are contiguous rows of the transposed data
+        go_right = data.T[self.feature[self.roots[:, 0]]] > self.threshold[self.roots]
+        if has_missing:
+            go_right |= np.isnan(data.T[self.feature[self.roots[:, 0]]]) & ~self.missing_go_to_left[self.roots]
+        nodes = self.children.take(2 * self.roots + go_right)
+
+        flat_data = data.ravel()
+        row_offsets = np.arange(data.shape[0], dtype=np.int32) * data.shape[1]
+        for _ in range(self.depth - 1):
+            values = flat_data.take(self.feature.take(nodes) + row_offsets)
+            go_right = values > self.threshold.take(nodes)
+            if has_missing:
+                # missing values go to the side seen during training
+                go_right |= np.isnan(values) & ~self.missing_go_to_left.take(nodes)
+            nodes *= 2
+            nodes += go_right
+            nodes = self.children.take(nodes)
+        return nodes
+
+    def _predict_proba_chunk(self, data: np.ndarray, out: np.ndarray):
+        leaves = self.apply(data)
+        probabilities = np.empty_like(out)
+        out[:] = 0
+        # the trees are summed up in the order of the forest to get the same rounding
+        for tree_leaves in leaves:
+            self.probabilities.take(tree_leaves, axis=0, out=probabilities)
+            out += probabilities
+        out /= self.n_trees
+
+    def predict_proba(self, data: np.ndarray) -> np.ndarray:
+        """Predicts the class probabilities.
+
+        Args:
+            data (np.ndarray): The features of shape (n_samples, n_features).
+
+        Returns:
+            np.ndarray: The probabilities of shape (n_samples, n_classes) in the order of :attr:`classes_`.
+        """
+        out = np.empty((data.shape[0], len(self.classes_)), np.float64)
+        chunks = [slice(start, start + self.chunk_size) for start in range(0, data.shape[0], self.chunk_size)]
+        n_jobs = joblib.effective_n_jobs(self.n_jobs)
+        if n_jobs == 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                self._predict_proba_chunk(data[chunk], out[chunk])
+        else:
+            with concurrent.futures.ThreadPoolExecutor(n_jobs) as executor:
+                # consume the results to raise the exceptions of the threads
+                list(executor.map(lambda chunk: self._predict_proba_chunk(data[chunk], out[chunk]), chunks))
+        return out
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        """Predicts the classes.
+
+        Args:
+            data (np.ndarray): The features of shape (n_samples, n_features).
+
+        Returns:
+            np.ndarray: The classes of shape (n_samples,).
+        """
+        return self.classes_.take(np.argmax(self.predict_proba(data), axis=1), axis=0)
+
+
+def flatten(classifier):
+    """Gets the flat forest of a random forest for the inference.
+
+    Args:
+        classifier: The fitted classifier.
+
+    Returns:
+        The :class:`FlatForest` of a random forest or the classifier itself for other classifiers.
+    """
+    if isinstance(classifier, sk_ensemble.RandomForestClassifier):
+        return FlatForest.from_forest(classifier)
+    return classifier
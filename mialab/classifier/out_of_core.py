@@ -0,0 +1,85 @@
+"""This module contains the out-of-core training of decision forests on the subjects of a feature store.
+
+The training data is split into chunks of whole subjects, which are assembled one after another from the
+:class:`FeatureStore <mialab.utilities.cache.FeatureStore>`. Each chunk grows a share of the forest's trees with
+``warm_start``, where the trees draw their bootstrap samples from the chunk. The memory is therefore bounded by the
+size of a chunk instead of the size of the training set.
+"""
+import timeit
+import typing as t
+
+import numpy as np
+import sklearn.ensemble as sk_ensemble
+
+import mialab.utilities.cache as cache_
+
+
+def get_trees_per_chunk(chunk_sizes: t.Sequence[int], n_estimators: int) -> np.ndarray:
+    """Distributes the trees of a forest proportionally to the number of samples of the chunks.
+
+    Args:
+        chunk_sizes (Sequence[int]): The number of samples of each chunk.
+        n_estimators (int): The number of trees.
+
+    Returns:
+        np.ndarray: The number of trees of each chunk, which sum up to ``n_estimators``. Every chunk gets at least one
+        tree, such that every chunk contributes, and the remaining trees are distributed proportionally.
+
+    Raises:
+        ValueError: If there are more chunks than trees.
+    """
+    if len(chunk_sizes) > n_estimators:
+        raise ValueError('{} chunks cannot share {} trees. Increase the chunk size.'.format(
+            len(chunk_sizes), n_estimators))
+
+    n_remaining = n_estimators - len(chunk_sizes)
+    boundaries = np.round(np.cumsum(chunk_sizes) / np.sum(chunk_sizes) * n_remaining).astype(int)
+    return np.diff(boundaries, prepend=0) + 1
+
+
+def fit_forest_out_of_core(forest: sk_ensemble.RandomForestClassifier, feature_store: cache_.FeatureStore,
+                           keys: t.Sequence[str], chunk_size: int,
+                           transform: t.Callable[[np.ndarray, np.ndarray], np.ndarray] = None, dtype=None):
+    """Fits a forest chunk by chunk on the subjects of a feature store.
+
+    The ``n_estimators`` of the forest are distributed among the chunks (see :func:`get_trees_per_chunk`), i.e. there
+    must not be more chunks than trees. Every chunk must contain all classes, since the trees of all chunks share the
+    classes of the forest.
+
+    Args:
+        forest (sk_ensemble.RandomForestClassifier): The forest to fit.
+        feature_store (cache_.FeatureStore): The feature store.
+        keys (Sequence[str]): The keys of the training subjects.
+        chunk_size (int): The number of samples per chunk (see :meth:`FeatureStore.get_subject_chunks
+            <mialab.utilities.cache.FeatureStore.get_subject_chunks>`).
+        transform (callable): An optional transformation of the features (see :meth:`FeatureStore.assemble
+            <mialab.utilities.cache.FeatureStore.assemble>`).
+        dtype: The type of the transformed features.
+    """
+    chunks = feature_store.get_subject_chunks(keys, chunk_size)
+    chunk_sizes = [sum(feature_store.load(key)[0].shape[0] for key in chunk) for chunk in chunks]
+    trees_per_chunk = get_trees_per_chunk(chunk_sizes, forest.n_estimators)
+
+    classes = None
+    warm_start = forest.warm_start
+    forest.warm_start = True
+    forest.n_estimators = 0
+    try:
+        for i, (chunk, n_trees) in enumerate(zip(chunks, trees_per_chunk)):
+            start_time = timeit.default_timer()
+            data, labels = feature_store.assemble(chunk, transform, dtype)
+
+            chunk_classes = np.unique(labels)
+            if classes is None:
+                classes = chunk_classes
+            elif not np.array_equal(chunk_classes, classes):
+                raise ValueError('Chunk {} contains the classes {}, but the first chunk {}. Increase the chunk size.'
+                                 .format(i, chunk_classes, classes))
+
+            forest.n_estimators += int(n_trees)
+            forest.fit(data, labels)
+            print(' Chunk {}/{}: {} subjects, {} samples, {} trees, {:.2f} s'.format(
+                i + 1, len(chunks), len(chunk), len(labels), n_trees, timeit.default_timer() - start_time))
+            del data, labels
+    finally:
+        forest.warm_start = warm_start
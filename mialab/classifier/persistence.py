@@ -0,0 +1,197 @@
+"""This module contains the persistence of trained forests in a compact, array-backed format.
+
+A forest is saved as an uncompressed ``.npz`` file, which holds the nodes of all trees as flat arrays (see
+:func:`get_flat_forest_arrays`) with their impurity and sample counts (for the feature importances), the column names of the features, the fingerprint of the pre-processing parameters,
+and the bin edges of the feature quantization, if any. Nothing is pickled. Since the arrays are stored uncompressed,
+they can be memory-mapped when loading. A model is refused if the features or the pre-processing parameters differ
+from the ones it has been trained with.
+"""
+import json
+import typing as t
+import zipfile
+
+import numpy as np
+import sklearn.ensemble as sk_ensemble
+import sklearn.tree as sk_tree
+import sklearn.tree._tree as sk_tree_internal
+
+import mialab.classifier.quantization as quant
+
+MODEL_FORMAT_VERSION = 2  # increase if the layout of the model file changes
+
+_NODE_ARRAYS = ('left_child', 'right_child', 'feature', 'threshold', 'missing_go_to_left')
+_NODE_TYPES = (np.int32, np.int32, np.int32, np.float64, np.uint8)
+_NODE_STATISTICS = ('impurity', 'n_node_samples', 'weighted_n_node_samples')
+_NODE_STATISTICS_TYPES = (np.float64, np.int64, np.float64)
+_READ_ARRAY_HEADER = {(1, 0): np.lib.format.read_array_header_1_0, (2, 0): np.lib.format.read_array_header_2_0}
+
+
+def get_flat_forest_arrays(forest: sk_ensemble.RandomForestClassifier) -> t.Dict[str, np.ndarray]:
+    """Gets the nodes of all trees of a forest as contiguous arrays.
+
+    The nodes of the trees are concatenated, where ``tree_offsets[i]`` is the index of the root of tree ``i``. The
+    child indices are relative to the tree's root (-1 for leaves).
+
+    Args:
+        forest (sk_ensemble.RandomForestClassifier): The fitted forest.
+
+    Returns:
+        dict: The arrays ``tree_offsets``, ``left_child``, ``right_child``, ``feature``, ``threshold``,
+        ``missing_go_to_left``, ``value`` (n_nodes, n_classes), and ``max_depth`` (per tree).
+    """
+    trees = [estimator.tree_ for estimator in forest.estimators_]
+    if forest.n_outputs_ != 1:
+        raise ValueError('Only forests with a single output are supported')
+
+    arrays = {'tree_offsets': np.cumsum([0] + [tree.node_count for tree in trees]).astype(np.int64),
+              'max_depth': np.array([tree.max_depth for tree in trees], np.int32)}
+    states = [tree.__getstate__() for tree in trees]
+    for name, dtype in zip(_NODE_ARRAYS, _NODE_TYPES):
+        arrays[name] = np.concatenate([state['nodes'][name] for state in states]).astype(dtype)
+    arrays['value'] = np.concatenate([state['values'][:, 0, :] for state in states])
+    return arrays
+
+
+def _get_forest(arrays: t.Dict[str, np.ndarray], meta: dict) -> sk_ensemble.RandomForestClassifier:
+    """Rebuilds a forest from its flat arrays (see :func:`get_flat_forest_arrays`)."""
+    classes = np.array(meta['classes'])
+    n_features = len(meta['columns'])
+    forest = sk_ensemble.RandomForestClassifier(**meta['params'])
+    forest.estimator_ = sk_tree.DecisionTreeClassifier()
+    forest.estimators_ = []
+
+    offsets = arrays['tree_offsets']
+    for i in range(len(offsets) - 1):
+        node_count = int(offsets[i + 1] - offsets[i])
+        nodes = np.zeros(node_count, sk_tree_internal.NODE_DTYPE)
+        for name in _NODE_ARRAYS + _NODE_STATISTICS:
+            nodes[name] = arrays[name][offsets[i]:offsets[i + 1]]
+        tree = sk_tree_internal.Tree(n_features, np.array([len(classes)], np.intp), 1)
+        tree.__setstate__({'max_depth': int(arrays['max_depth'][i]), 'node_count': node_count, 'nodes': nodes,
+                           'values': np.ascontiguousarray(arrays['value'][offsets[i]:offsets[i + 1], np.newaxis])})
+
+        estimator = sk_tree.DecisionTreeClassifier(**{name: getattr(forest, name) for name in forest.estimator_params})
+        estimator.tree_ = tree
+        estimator.n_features_in_ = n_features
+        estimator.n_outputs_ = 1
+        estimator.classes_ = classes
+        estimator.n_classes_ = len(classes)
+        estimator.max_features_ = meta['max_features']
+        forest.estimators_.append(estimator)
+
+    forest.n_features_in_ = n_features
+    forest.n_outputs_ = 1
+    forest.classes_ = classes
+    forest.n_classes_ = len(classes)
+    return forest
+
+
+def save_model(path: str, forest: sk_ensemble.RandomForestClassifier, columns: t.Sequence[str],
+               params_fingerprint: str, quantizer: quant.FeatureQuantizer = None):
+    """Saves a trained forest.
+
+    Args:
+        path (str): The path to the ``.npz`` file.
+        forest (sk_ensemble.RandomForestClassifier): The fitted forest.
+        columns (Sequence[str]): The column names of the features the forest has been trained on.
+        params_fingerprint (str): The fingerprint of the pre-processing parameters (see
+            :func:`mialab.utilities.cache.get_params_fingerprint`).
+        quantizer (quant.FeatureQuantizer): The quantizer of the features, if any.
+    """
+    if not isinstance(forest, sk_ensemble.RandomForestClassifier):
+        raise ValueError('Only random forests can be saved, but the classifier is a {}'.format(type(forest).__name__))
+
+    arrays = get_flat_forest_arrays(forest)
+    # the node statistics are not required for the prediction, but for the feature importances
+    states = [estimator.tree_.__getstate__() for estimator in forest.estimators_]
+    for name, dtype in zip(_NODE_STATISTICS, _NODE_STATISTICS_TYPES):
+        arrays[name] = np.concatenate([state['nodes'][name] for state in states]).astype(dtype)
+    meta = {'format_version': MODEL_FORMAT_VERSION,
+            'classes': forest.classes_.tolist(),
+            'columns': [str(column) for column in columns],
+            'params_fingerprint': params_fingerprint,
+            'params': {key: value for key, value in forest.get_params().items() if key != 'n_jobs'},
+            'max_features': int(forest.estimators_[0].max_features_),
+            'quantizer': None}
+    if quantizer is not None:
+        meta['quantizer'] = {'n_bins': quantizer.n_bins, 'subsample': quantizer.subsample, 'seed': quantizer.seed}
+        arrays['quantizer_offsets'] = np.cumsum([0] + [len(edges) for edges in quantizer.edges]).astype(np.int64)
+        arrays['quantizer_edges'] = np.concatenate(quantizer.edges).astype(np.float32)
+
+    # uncompressed, such that the arrays can be memory-mapped
+    with open(path, 'wb') as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def _load_arrays(path: str, mmap: bool) -> t.Dict[str, np.ndarray]:
+    """Loads all arrays of an uncompressed ``.npz`` file, optionally as memory maps of the file's members."""
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')]
+            if mmap and info.compress_type == zipfile.ZIP_STORED:
+                # skip the member's local header to the .npy data
+                f.seek(info.header_offset + 26)
+                name_length, extra_length = np.frombuffer(f.read(4), '<u2')
+                f.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+                version = np.lib.format.read_magic(f)
+                if version in _READ_ARRAY_HEADER:
+                    shape, fortran_order, dtype = _READ_ARRAY_HEADER[version](f)
+                    if not dtype.hasobject:
+                        arrays[name] = np.memmap(f, dtype, 'r', f.tell(), shape, 'F' if fortran_order else 'C')
+                        continue
+
+            with archive.open(info) as member:
+                arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+    return arrays
+
+
+def check_columns(expected: t.Sequence[str], actual: t.Sequence[str]):
+    """Checks whether the features have the layout a model has been trained with.
+
+    Args:
+        expected (Sequence[str]): The column names of the model's features.
+        actual (Sequence[str]): The column names of the features.
+
+    Raises:
+        ValueError: If the column names differ.
+    """
+    if list(expected) != [str(column) for column in actual]:
+        raise ValueError('The features {} differ from the features {} of the model'.format(list(actual),
+                                                                                          list(expected)))
+
+
+def load_model(path: str, params_fingerprint: str = None, columns: t.Sequence[str] = None,
+               mmap: bool = True) -> t.Tuple[sk_ensemble.RandomForestClassifier, t.Optional[quant.FeatureQuantizer],
+                                             t.List[str]]:
+    """Loads a trained forest.
+
+    Args:
+        path (str): The path to the ``.npz`` file.
+        params_fingerprint (str): The fingerprint of the pre-processing parameters (not checked if None).
+        columns (Sequence[str]): The column names of the features (not checked if None, see :func:`check_columns`).
+        mmap (bool): Whether to memory-map the arrays instead of reading them.
+
+    Returns:
+        tuple: The forest, the quantizer (None if the features are not quantized), and the column names.
+
+    Raises:
+        ValueError: If the pre-processing parameters or the features differ from the ones of the model.
+    """
+    arrays = _load_arrays(path, mmap)
+    meta = json.loads(str(arrays.pop('meta')))
+    if meta['format_version'] != MODEL_FORMAT_VERSION:
+        raise ValueError('The model {} has the format version {}, but {} is expected'.format(
+            path, meta['format_version'], MODEL_FORMAT_VERSION))
+    if params_fingerprint is not None and meta['params_fingerprint'] != params_fingerprint:
+        raise ValueError('The model {} has been trained with different pre-processing parameters'.format(path))
+    if columns is not None:
+        check_columns(meta['columns'], columns)
+
+    quantizer = None
+    if meta['quantizer'] is not None:
+        quantizer = quant.FeatureQuantizer(**meta['quantizer'])
+        offsets = arrays['quantizer_offsets']
+        quantizer.edges = [arrays['quantizer_edges'][offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    return _get_forest(arrays, meta), quantizer, meta['columns']
@@ -0,0 +1,92 @@
+"""This module contains the quantization of feature matrices into small integer bins.
+
+A :class:`FeatureQuantizer` learns per-feature bin edges on the training data and maps the features of the training
+and testing data to uint8 or uint16 codes. The codes preserve the order of the feature values, such that tree-based
+classifiers find the same splits up to the bin resolution, but the design matrix is two to four times smaller and the
+split search only needs to consider as many thresholds as there are bins.
+"""
+import typing as t
+
+import numpy as np
+
+
+class FeatureQuantizer:
+    """Represents a quantizer, which maps each feature to the index of its quantile bin."""
+
+    def __init__(self, n_bins: int = 256, subsample: int = 200000, seed: int = 0):
+        """Initializes a new instance of the FeatureQuantizer class.
+
+        Args:
+            n_bins (int): The maximum number of bins per feature (at most 256 results in uint8 codes, otherwise uint16).
+            subsample (int): The maximum number of samples used to determine the quantiles.
+            seed (int): The seed of the subsampling.
+        """
+        if not 2 <= n_bins <= 2 ** 16:
+            raise ValueError('The number of bins must be in [2, 65536], but is {}'.format(n_bins))
+        self.n_bins = n_bins
+        self.subsample = subsample
+        self.seed = seed
+        self.dtype = np.uint8 if n_bins <= 2 ** 8 else np.uint16
+        self.edges = None  # type: t.List[np.ndarray]
+
+    def fit(self, data: np.ndarray) -> 'FeatureQuantizer':
+        """Learns the bin edges of each feature from the quantiles of the data.
+
+        Features with fewer distinct values than bins get fewer edges, such that equal values share a bin.
+
+        Args:
+            data (np.ndarray): The features of shape (n_samples, n_features).
+
+        Returns:
+            FeatureQuantizer: The quantizer itself.
+        """
+        if data.shape[0] > self.subsample:
+            rng = np.random.default_rng(self.seed)
+            data = data[np.sort(rng.choice(data.shape[0], self.subsample, replace=False))]
+
+        quantiles = np.linspace(0, 1, self.n_bins + 1)[1:-1]
+        self.edges = []
+        for column in np.asarray(data, np.float32).T:
+            column = column[~np.isnan(column)]
+            if column.size == 0:
+                self.edges.append(np.empty(0, np.float32))
+                continue
+            # the quantiles are the bin's upper edges, such that the largest training value is in the last bin
+            edges = np.unique(np.quantile(column, quantiles, method='lower'))
+            self.edges.append(edges[edges < column.max()].astype(np.float32))
+        return self
+
+    def transform(self, data: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """Maps the features to the indices of their bins.
+
+        Values outside the training range fall into the first or the last bin, NaN into the last bin.
+
+        Args:
+            data (np.ndarray): The features of shape (n_samples, n_features).
+            out (np.ndarray): An optional output array of shape (n_samples, n_features) and type :attr:`dtype`.
+
+        Returns:
+            np.ndarray: The codes of shape (n_samples, n_features).
+        """
+        if self.edges is None:
+            raise ValueError('The quantizer has not been fitted')
+        if data.shape[1] != len(self.edges):
+            raise ValueError('The quantizer has been fitted to {} features, but the data has {}'.format(
+                len(self.edges), data.shape[1]))
+
+        if out is None:
+            out = np.empty(data.shape, self.dtype)
+        for j, edges in enumerate(self.edges):
+            out[:, j] = np.searchsorted(edges, data[:, j], side='left')
+        return out
+
+    def fit_transform(self, data: np.ndarray) -> np.ndarray:
+        """Learns the bin edges and maps the features to the indices of their bins.
+
+        Args:
+            data (np.ndarray): The features of shape (n_samples, n_features).
+
+        Returns:
+            np.ndarray: The codes of shape (n_samples, n_features).
+        """
+        return self.fit(data).transform(data)
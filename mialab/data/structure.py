@@ -1,6 +1,7 @@
 """The data structure module holds model classes."""
 import enum
 
+import numpy as np
 import pymia.data.conversion as conversion
 import SimpleITK as sitk
 
@@ -14,6 +15,40 @@ class BrainImageTypes(enum.Enum):
     RegistrationTransform = 5  #: The registration transformation
 
 
+class CroppedImageProperties(conversion.ImageProperties):
+    """Represents the image properties of a cropped image.
+
+    Besides the properties of the cropped image, the uncropped image properties and the offset of the cropped image in
+    the uncropped image are held to restore images to the uncropped image grid.
+    """
+
+    def __init__(self, image: sitk.Image, uncropped: conversion.ImageProperties):
+        """Initializes a new instance of the CroppedImageProperties class.
+
+        Args:
+            image (sitk.Image): The cropped image, which needs to lie on the grid of the uncropped image.
+            uncropped (conversion.ImageProperties): The properties of the uncropped image.
+        """
+        super().__init__(image)
+        self.uncropped = uncropped
+
+        # the index (x, y, z) of the cropped image's origin in the uncropped image
+        direction = np.reshape(uncropped.direction, (uncropped.dimensions, uncropped.dimensions))
+        offset = direction.T @ (np.array(self.origin) - np.array(uncropped.origin)) / np.array(uncropped.spacing)
+        self.offset = tuple(int(o) for o in np.rint(offset))
+
+    def __str__(self):
+        """Gets a printable string representation.
+
+        Returns:
+            str: String representation.
+        """
+        return super().__str__() + \
+            ' offset:                         {self.offset}\n' \
+            ' uncropped size:                 {self.uncropped.size}\n' \
+            .format(self=self)
+
+
 class BrainImage:
     """Represents a brain image."""
 
@@ -38,6 +73,7 @@ class BrainImage:
 
         self.image_properties = conversion.ImageProperties(self.images[list(self.images.keys())[0]])
         self.feature_images = {}
-        self.feature_matrix = None  # a tuple (features, labels),
-        # where the shape of features is (n, number_of_features) and the shape of labels is (n, 1)
-        # with n being the amount of voxels
\ No newline at end of file
+        self.feature_matrix = None  # a tuple (features, labels, indices, columns),
+        # where the shape of features is (n, number_of_features), the shape of labels is (n, 1),
+        # indices are the flat indices of the voxels in the image array (z, y, x) with n being the amount of voxels,
+        # and columns are the names of the features
\ No newline at end of file
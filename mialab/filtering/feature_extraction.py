@@ -1,11 +1,27 @@
 """The feature extraction module contains classes for feature extraction."""
 import sys
+import timeit
+import typing as t
 
 import numpy as np
 import pymia.filtering.filter as fltr
 import SimpleITK as sitk
 
 
+class AtlasCoordinatesParameters(fltr.FilterParams):
+    """Atlas coordinates parameters."""
+
+    def __init__(self, origin: tuple, offset: tuple):
+        """Initializes a new instance of the AtlasCoordinatesParameters class.
+
+        Args:
+            origin (tuple): The origin of the uncropped image.
+            offset (tuple): The index (x, y, z) of the cropped image in the uncropped image.
+        """
+        self.origin = origin
+        self.offset = offset
+
+
 class AtlasCoordinates(fltr.Filter):
     """Represents an atlas coordinates feature extractor."""
 
@@ -13,12 +29,13 @@ class AtlasCoordinates(fltr.Filter):
         """Initializes a new instance of the AtlasCoordinates class."""
         super().__init__()
 
-    def execute(self, image: sitk.Image, params: fltr.FilterParams = None) -> sitk.Image:
+    def execute(self, image: sitk.Image, params: AtlasCoordinatesParameters = None) -> sitk.Image:
         """Executes a atlas coordinates feature extractor on an image.
 
         Args:
             image (sitk.Image): The image.
-            params (fltr.FilterParams): The parameters (unused).
+            params (AtlasCoordinatesParameters): The optional parameters of a cropped image, such that the coordinates
+                equal the ones of the uncropped image.
 
         Returns:
             sitk.Image: The atlas coordinates image
@@ -33,28 +50,67 @@ class AtlasCoordinates(fltr.Filter):
 
         x, y, z = image.GetSize()
 
-        # create matrix with homogenous indices in axis 3
-        coords = np.zeros((x, y, z, 4))
-        coords[..., 0] = np.arange(x)[:, np.newaxis, np.newaxis]
-        coords[..., 1] = np.arange(y)[np.newaxis, :, np.newaxis]
-        coords[..., 2] = np.arange(z)[np.newaxis, np.newaxis, :]
-        coords[..., 3] = 1
+        # each coordinate is the sum of the terms of the z, y, and x index broadcast over the grid
+        atlas_coords = np.empty((z, y, x, 3), np.float32)
+        for axis, (term_x, term_y, term_z) in enumerate(self._get_terms(image, params)):
+            np.add(term_z[:, np.newaxis, np.newaxis], term_y[np.newaxis, :, np.newaxis], out=atlas_coords[..., axis])
+            atlas_coords[..., axis] += term_x[np.newaxis, np.newaxis, :]
 
-        # reshape such that each voxel is one row
-        lin_coords = np.reshape(coords, [coords.shape[0] * coords.shape[1] * coords.shape[2], 4])
+        img_out = sitk.GetImageFromArray(atlas_coords, isVector=True)
+        img_out.CopyInformation(image)
 
-        # generate transformation matrix
-        tmp_mat = image.GetDirection() + image.GetOrigin()
-        tfm = np.reshape(tmp_mat, [3, 4], order='F')
-        tfm = np.vstack((tfm, [0, 0, 0, 1]))
+        return img_out
 
-        atlas_coords = (tfm @ np.transpose(lin_coords))[0:3, :]
-        atlas_coords = np.reshape(np.transpose(atlas_coords), [z, y, x, 3], 'F')
+    def execute_at(self, image: sitk.Image, indices: np.ndarray, params: AtlasCoordinatesParameters = None) \
+            -> np.ndarray:
+        """Executes a atlas coordinates feature extractor at selected voxels of an image.
 
-        img_out = sitk.GetImageFromArray(atlas_coords)
-        img_out.CopyInformation(image)
+        The coordinates equal the ones of :meth:`execute` at the voxels.
 
-        return img_out
+        Args:
+            image (sitk.Image): The image.
+            indices (np.ndarray): The flat indices of the voxels in the image array (z, y, x) in C order.
+            params (AtlasCoordinatesParameters): The optional parameters of a cropped image, such that the coordinates
+                equal the ones of the uncropped image.
+
+        Returns:
+            np.ndarray: The physical x, y, z coordinates in mm (float32) with shape (n, 3).
+
+        Raises:
+            ValueError: If image is not 3-D.
+        """
+
+        if image.GetDimension() != 3:
+            raise ValueError('image needs to be 3-D')
+
+        z, y, x = np.unravel_index(indices, image.GetSize()[::-1])
+
+        atlas_coords = np.empty((len(indices), 3), np.float32)
+        for axis, (term_x, term_y, term_z) in enumerate(self._get_terms(image, params)):
+            atlas_coords[:, axis] = term_z[z] + term_y[y] + term_x[x]
+
+        return atlas_coords
+
+    @staticmethod
+    def _get_terms(image: sitk.Image, params: AtlasCoordinatesParameters) -> list:
+        """Gets the terms (float32) of the x, y, and z index, whose sum is a physical coordinate, per physical axis.
+
+        The terms are the ones of the homogeneous transformation matrix built from the image's direction (in
+        column-major order) and origin. The origin is added to the z term.
+        """
+        size = image.GetSize()
+        origin = image.GetOrigin()
+        offset = (0, 0, 0)
+        if params is not None:
+            origin = params.origin
+            offset = params.offset
+
+        tfm = np.reshape(image.GetDirection(), [3, 3], order='F')
+        indices = [np.arange(size[dim]) + offset[dim] for dim in range(3)]
+
+        return [((tfm[axis, 0] * indices[0]).astype(np.float32),
+                 (tfm[axis, 1] * indices[1]).astype(np.float32),
+                 (tfm[axis, 2] * indices[2] + origin[axis]).astype(np.float32)) for axis in range(3)]
 
     def __str__(self):
         """Gets a printable string representation.
@@ -66,6 +122,11 @@ class AtlasCoordinates(fltr.Filter):
             .format(self=self)
 
 
+FIRST_ORDER_TEXTURE_FEATURE_NAMES = ('mean', 'variance', 'sigma', 'skewness', 'kurtosis', 'entropy', 'energy', 'snr',
+                                     'min', 'max', 'range', 'percentile10th', 'percentile25th', 'percentile50th',
+                                     'percentile75th', 'percentile90th')  # the features of the function below
+
+
 def first_order_texture_features_function(values):
     """Calculates first-order texture features.
 
@@ -121,11 +182,194 @@ def first_order_texture_features_function(values):
                      ])
 
 
+def _get_box_sums(arr: np.ndarray, window_shape: tuple, out_shape: tuple, dtype: type = np.float64) -> np.ndarray:
+    """Gets the sums over all windows of an array by separable summed-area tables (prefix sums along each axis).
+
+    Args:
+        arr (np.ndarray): The array.
+        window_shape (tuple): The window shape.
+        out_shape (tuple): The shape of the output, i.e. the number of windows along each axis starting at index 0.
+        dtype (type): The data type of the summed-area tables, e.g. an integer type for exact counts.
+
+    Returns:
+        np.ndarray: The window sums (of dtype), where the element at an index is the sum of the window starting there.
+    """
+    sums = arr
+    for axis, (k, n) in enumerate(zip(window_shape, out_shape)):
+        # prefix sums along the axis, i.e. the summed-area table of the previous axes' window sums
+        table_shape = list(sums.shape)
+        table_shape[axis] += 1
+        table = np.zeros(table_shape, dtype)
+        np.cumsum(sums, axis=axis, out=table[(slice(None),) * axis + (slice(1, None),)])
+        sums = table[(slice(None),) * axis + (slice(k, k + n),)] - table[(slice(None),) * axis + (slice(0, n),)]
+    return sums
+
+
+def _get_sorted_percentile(sorted_values: np.ndarray, percentile: float) -> np.ndarray:
+    """Gets a percentile of values sorted along the last axis like :func:`np.percentile` (linear interpolation)."""
+    virtual_index = (sorted_values.shape[-1] - 1) * (percentile / 100)
+    lower = int(np.floor(virtual_index))
+    upper = min(lower + 1, sorted_values.shape[-1] - 1)
+    gamma = virtual_index - lower
+    a = sorted_values[..., lower]
+    diff_b_a = sorted_values[..., upper] - a
+    if gamma >= 0.5:
+        return sorted_values[..., upper] - diff_b_a * (1 - gamma)
+    return a + diff_b_a * gamma
+
+
+def first_order_texture_features(img_arr: np.ndarray, kernel: tuple = (3, 3, 3), chunk_size: int = 8) -> np.ndarray:
+    """Calculates the first-order texture features of all neighborhoods of a 3-D array at once.
+
+    The result equals applying :func:`first_order_texture_features_function` in float64 to each neighborhood as done by
+    :class:`NeighborhoodFeatureExtractor`, i.e. to the window starting at a voxel in the array padded symmetrically at
+    the end of each axis. Like the function, the skewness and kurtosis use the window's first axis length as number
+    of values and the entropy is nan if a window contains a value less than or equal to zero. The moments and the
+    energy are calculated from summed-area tables of the powers of the values, the minimum, maximum, and percentiles
+    from the windows of ``chunk_size`` slices sorted at a time.
+
+    Args:
+        img_arr (np.ndarray): The array with shape (z, y, x).
+        kernel (tuple): The window size (x, y, z).
+        chunk_size (int): The number of slices (z) whose windows are sorted at once.
+
+    Returns:
+        np.ndarray: The features with shape (z, y, x, 16) in the order of :func:`first_order_texture_features_function`.
+    """
+    eps = sys.float_info.epsilon  # to avoid division by zero
+
+    window_shape = (kernel[2], kernel[1], kernel[0])
+    shape = img_arr.shape
+    padded = np.pad(img_arr.astype(np.float64), [(0, k) for k in window_shape], 'symmetric')
+    num_values = window_shape[0]  # len(values) of the window
+    size = np.prod(window_shape)
+
+    # the raw moments of the windows
+    s1 = _get_box_sums(padded, window_shape, shape)
+    s2 = _get_box_sums(padded ** 2, window_shape, shape)
+    s3 = _get_box_sums(padded ** 3, window_shape, shape)
+    s4 = _get_box_sums(padded ** 4, window_shape, shape)
+
+    features = np.empty(shape + (16,), np.float32)
+
+    # min, max and percentiles of the sorted windows
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window_shape)
+    for start in range(0, shape[0], chunk_size):
+        chunk = slice(start, min(start + chunk_size, shape[0]))
+        chunk_windows = windows[chunk, :shape[1], :shape[2]].reshape(chunk.stop - start, shape[1], shape[2], -1)
+        chunk_windows = np.sort(chunk_windows, axis=-1)
+        features[chunk, ..., 8] = chunk_windows[..., 0]
+        features[chunk, ..., 9] = chunk_windows[..., -1]
+        features[chunk, ..., 10] = chunk_windows[..., -1] - chunk_windows[..., 0]
+        for idx, percentile in enumerate([10, 25, 50, 75, 90]):
+            features[chunk, ..., 11 + idx] = _get_sorted_percentile(chunk_windows, percentile)
+    flat = features[..., 8] == features[..., 9]
+
+    mean = s1 / size
+    # central moments from the raw moments, which are exactly zero for windows of identical values
+    m2 = np.maximum(s2 - s1 * mean, 0)
+    m3 = s3 - 3 * mean * s2 + 3 * mean ** 2 * s1 - size * mean ** 3
+    m4 = s4 - 4 * mean * s3 + 6 * mean ** 2 * s2 - 4 * mean ** 3 * s1 + size * mean ** 4
+    m2[flat] = 0
+    m3[flat] = 0
+    m4[flat] = 0
+    var = m2 / size
+    std = np.sqrt(var)
+
+    features[..., 0] = mean
+    features[..., 1] = var
+    features[..., 2] = std
+    features[..., 3] = np.sqrt(num_values * (num_values - 1)) / (num_values - 2) * m3 / (num_values * std ** 3 + eps)
+    features[..., 4] = m4 / (num_values * std ** 4 + eps)
+
+    # entropy and energy of p = values / (sum + eps): the entropy is only defined if all p are positive, i.e. all
+    # values have the sign of the sum, and then equals -(sum(|v| log2 |v|) - |sum| log2 |sum + eps|) / |sum + eps|
+    total = s1 + eps
+    with np.errstate(divide='ignore', invalid='ignore'):
+        abs_padded = np.abs(padded)
+        v_log_v = np.where(abs_padded > 0, abs_padded * np.log2(np.where(abs_padded > 0, abs_padded, 1)), 0)
+        positives = _get_box_sums((padded > 0).astype(np.float64), window_shape, shape)
+        negatives = _get_box_sums((padded < 0).astype(np.float64), window_shape, shape)
+        defined = ((positives == size) & (total > 0)) | ((negatives == size) & (total < 0))
+        abs_total = np.abs(total)
+        entropy = -(_get_box_sums(v_log_v, window_shape, shape) - np.abs(s1) * np.log2(abs_total)) / abs_total
+        features[..., 5] = np.where(defined, entropy, np.nan)
+        features[..., 6] = s2 / total ** 2
+        features[..., 7] = np.where(std != 0, mean / std, 0)
+
+    return features
+
+
+def first_order_texture_features_at(img_arr: np.ndarray, indices: np.ndarray, kernel: tuple = (3, 3, 3),
+                                    chunk_size: int = 65536) -> np.ndarray:
+    """Calculates the first-order texture features of the neighborhoods of selected voxels of a 3-D array.
+
+    The neighborhoods are the ones of :func:`first_order_texture_features`, i.e. the windows starting at the voxels in
+    the array padded symmetrically at the end of each axis, and the features are calculated per window in float64 like
+    :func:`first_order_texture_features_function`. The cost is proportional to the number of voxels, not the array size.
+
+    Args:
+        img_arr (np.ndarray): The array with shape (z, y, x).
+        indices (np.ndarray): The flat indices of the voxels in the array (in C order, i.e. of ``img_arr.ravel()``).
+        kernel (tuple): The window size (x, y, z).
+        chunk_size (int): The number of windows gathered at once.
+
+    Returns:
+        np.ndarray: The features with shape (n, 16) in the order of :func:`first_order_texture_features_function`.
+    """
+    eps = sys.float_info.epsilon  # to avoid division by zero
+
+    window_shape = (kernel[2], kernel[1], kernel[0])
+    padded = np.pad(img_arr.astype(np.float64), [(0, k) for k in window_shape], 'symmetric')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window_shape)
+    num_values = window_shape[0]  # len(values) of the window
+    size = np.prod(window_shape)
+    z, y, x = np.unravel_index(indices, img_arr.shape)
+
+    features = np.empty((len(indices), 16), np.float32)
+    for start in range(0, len(indices), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        values = windows[z[chunk], y[chunk], x[chunk]].reshape(-1, size)
+
+        mean = np.mean(values, axis=1)
+        deviations = values - mean[:, np.newaxis]
+        var = np.mean(deviations ** 2, axis=1)
+        std = np.sqrt(var)
+        p = values / (np.sum(values, axis=1, keepdims=True) + eps)
+
+        features[chunk, 0] = mean
+        features[chunk, 1] = var
+        features[chunk, 2] = std
+        features[chunk, 3] = np.sqrt(num_values * (num_values - 1)) / (num_values - 2) * \
+            np.sum(deviations ** 3, axis=1) / (num_values * std ** 3 + eps)
+        features[chunk, 4] = np.sum(deviations ** 4, axis=1) / (num_values * std ** 4 + eps)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            features[chunk, 5] = np.sum(-p * np.log2(p), axis=1)
+            features[chunk, 7] = np.where(std != 0, mean / std, 0)
+        features[chunk, 6] = np.sum(p ** 2, axis=1)
+
+        values.sort(axis=1)
+        features[chunk, 8] = values[:, 0]
+        features[chunk, 9] = values[:, -1]
+        features[chunk, 10] = values[:, -1] - values[:, 0]
+        for idx, percentile in enumerate([10, 25, 50, 75, 90]):
+            features[chunk, 11 + idx] = _get_sorted_percentile(values, percentile)
+
+    return features
+
+
 class NeighborhoodFeatureExtractor(fltr.Filter):
     """Represents a feature extractor filter, which works on a neighborhood."""
 
     def __init__(self, kernel=(3, 3, 3), function_=first_order_texture_features_function):
-        """Initializes a new instance of the NeighborhoodFeatureExtractor class."""
+        """Initializes a new instance of the NeighborhoodFeatureExtractor class.
+
+        Args:
+            kernel (tuple): The neighborhood size (x, y, z).
+            function_ (callable): The function calculating the features of a neighborhood. The
+                :func:`first_order_texture_features_function` is calculated for all neighborhoods at once (see
+                :func:`first_order_texture_features`), any other function voxel by voxel.
+        """
         super().__init__()
         self.neighborhood_radius = 3
         self.kernel = kernel
@@ -148,21 +392,21 @@ class NeighborhoodFeatureExtractor(fltr.Filter):
         if image.GetDimension() != 3:
             raise ValueError('image needs to be 3-D')
 
-        # test the function and get the output dimension for later reshaping
-        function_output = self.function(np.array([1, 2, 3]))
-        if np.isscalar(function_output):
+        no_features = self._get_number_of_features()
+        if no_features == 1:
             img_out = sitk.Image(image.GetSize(), sitk.sitkFloat32)
-        elif not isinstance(function_output, np.ndarray):
-            raise ValueError('function must return a scalar or a 1-D np.ndarray')
-        elif function_output.ndim > 1:
-            raise ValueError('function must return a scalar or a 1-D np.ndarray')
-        elif function_output.shape[0] <= 1:
-            raise ValueError('function must return a scalar or a 1-D np.ndarray with at least two elements')
         else:
-            img_out = sitk.Image(image.GetSize(), sitk.sitkVectorFloat32, function_output.shape[0])
+            img_out = sitk.Image(image.GetSize(), sitk.sitkVectorFloat32, no_features)
 
-        img_out_arr = sitk.GetArrayFromImage(img_out)
         img_arr = sitk.GetArrayFromImage(image)
+
+        if self.function is first_order_texture_features_function:
+            # vectorized calculation of all neighborhoods at once
+            img_out = sitk.GetImageFromArray(first_order_texture_features(img_arr, self.kernel), isVector=True)
+            img_out.CopyInformation(image)
+            return img_out
+
+        img_out_arr = sitk.GetArrayFromImage(img_out)
         z, y, x = img_arr.shape
 
         z_offset = self.kernel[2]
@@ -183,6 +427,61 @@ class NeighborhoodFeatureExtractor(fltr.Filter):
 
         return img_out
 
+    def execute_at(self, image: sitk.Image, indices: np.ndarray) -> np.ndarray:
+        """Executes a neighborhood feature extractor at selected voxels of an image.
+
+        The features equal the ones of :meth:`execute` at the voxels, but only the neighborhoods of the voxels are
+        evaluated.
+
+        Args:
+            image (sitk.Image): The image.
+            indices (np.ndarray): The flat indices of the voxels in the image array (z, y, x) in C order.
+
+        Returns:
+            np.ndarray: The features (float32) with shape (n, number of features).
+
+        Raises:
+            ValueError: If image is not 3-D.
+        """
+
+        if image.GetDimension() != 3:
+            raise ValueError('image needs to be 3-D')
+
+        no_features = self._get_number_of_features()
+        img_arr = sitk.GetArrayViewFromImage(image)
+
+        if self.function is first_order_texture_features_function:
+            return first_order_texture_features_at(img_arr, indices, self.kernel)
+
+        z_offset = self.kernel[2]
+        y_offset = self.kernel[1]
+        x_offset = self.kernel[0]
+        pad = ((0, z_offset), (0, y_offset), (0, x_offset))
+        img_arr_padded = np.pad(img_arr, pad, 'symmetric')
+
+        features = np.empty((len(indices), no_features), np.float32)
+        for row, (zz, yy, xx) in enumerate(zip(*np.unravel_index(indices, img_arr.shape))):
+            features[row] = self.function(img_arr_padded[zz:zz + z_offset, yy:yy + y_offset, xx:xx + x_offset])
+
+        return features
+
+    def _get_number_of_features(self) -> int:
+        """Tests the function and gets the number of features it calculates.
+
+        Raises:
+            ValueError: If the function does not return a scalar or a 1-D np.ndarray with at least two elements.
+        """
+        function_output = self.function(np.array([1, 2, 3]))
+        if np.isscalar(function_output):
+            return 1
+        elif not isinstance(function_output, np.ndarray):
+            raise ValueError('function must return a scalar or a 1-D np.ndarray')
+        elif function_output.ndim > 1:
+            raise ValueError('function must return a scalar or a 1-D np.ndarray')
+        elif function_output.shape[0] <= 1:
+            raise ValueError('function must return a scalar or a 1-D np.ndarray with at least two elements')
+        return function_output.shape[0]
+
     def __str__(self):
         """Gets a printable string representation.
 
@@ -193,6 +492,397 @@ class NeighborhoodFeatureExtractor(fltr.Filter):
             .format(self=self)
 
 
+def _get_symmetric_eigenvalues(matrix: dict) -> tuple:
+    """Gets the eigenvalues of symmetric 3x3 matrices in closed form (trigonometric solution of the characteristic
+    polynomial).
+
+    Args:
+        matrix (dict): The upper triangle of the matrices, where the key is the index (a, b) with a <= b and the value
+            the arrays of the entries.
+
+    Returns:
+        tuple of np.ndarray: The eigenvalues (float64) in ascending order.
+    """
+    a = {key: value.astype(np.float64) for key, value in matrix.items()}
+    q = (a[0, 0] + a[1, 1] + a[2, 2]) / 3
+    off_diagonal = a[0, 1] ** 2 + a[0, 2] ** 2 + a[1, 2] ** 2
+    p = np.sqrt(((a[0, 0] - q) ** 2 + (a[1, 1] - q) ** 2 + (a[2, 2] - q) ** 2 + 2 * off_diagonal) / 6)
+
+    # the half determinant of (A - qI) / p, which is in [-1, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        b00, b11, b22 = (a[0, 0] - q) / p, (a[1, 1] - q) / p, (a[2, 2] - q) / p
+        b01, b02, b12 = a[0, 1] / p, a[0, 2] / p, a[1, 2] / p
+        r = (b00 * (b11 * b22 - b12 ** 2) - b01 * (b01 * b22 - b12 * b02) + b02 * (b01 * b12 - b11 * b02)) / 2
+    phi = np.arccos(np.clip(np.where(p > 0, r, 0), -1, 1)) / 3
+
+    largest = q + 2 * p * np.cos(phi)
+    smallest = q + 2 * p * np.cos(phi + 2 * np.pi / 3)
+    return smallest, 3 * q - largest - smallest, largest
+
+
+class FilterBankFeatureExtractor(fltr.Filter):
+    """Represents a multi-modal, multi-scale filter bank feature extractor.
+
+    The channels of a vector image (e.g., the T1w and T2w image composed) are smoothed by a recursive Gaussian once per
+    scale. The Gaussian, gradient magnitude, Laplacian of Gaussian, and Hessian eigenvalue features of all channels are
+    derived from this shared smoothed volume by central differences in physical units (with zero-flux boundaries).
+    """
+
+    FEATURE_NAMES = ('gaussian', 'gradient_magnitude', 'laplacian', 'hessian_eigenvalue1', 'hessian_eigenvalue2',
+                     'hessian_eigenvalue3')  # the features per scale and channel (the eigenvalues in ascending order)
+
+    def __init__(self, sigmas: tuple = (1.0, 2.0), chunk_size: int = 262144):
+        """Initializes a new instance of the FilterBankFeatureExtractor class.
+
+        Args:
+            sigmas (tuple of float): The standard deviations (in mm) of the Gaussian of each scale.
+            chunk_size (int): The number of voxels whose features are derived at once.
+        """
+        super().__init__()
+        self.sigmas = sigmas
+        self.chunk_size = chunk_size
+        self.times = []  # the time in seconds of each scale of the last execution
+
+    def get_column_names(self, channel_names: tuple) -> list:
+        """Gets the names of the features in the order of the columns, i.e. per scale, per channel, per feature.
+
+        Args:
+            channel_names (tuple of str): The names of the channels, e.g. ('T1w', 'T2w').
+
+        Returns:
+            list of str: The names.
+        """
+        return ['{}_sigma{}_{}'.format(channel, sigma, feature) for sigma in self.sigmas for channel in channel_names
+                for feature in self.FEATURE_NAMES]
+
+    def execute(self, image: sitk.Image, params: fltr.FilterParams = None) -> sitk.Image:
+        """Executes a filter bank feature extractor on an image.
+
+        Args:
+            image (sitk.Image): The (vector) image, whose components are the channels.
+            params (fltr.FilterParams): The parameters (unused).
+
+        Returns:
+            sitk.Image: The feature image (float32) with a component per feature (see :meth:`get_column_names`).
+
+        Raises:
+            ValueError: If image is not 3-D.
+        """
+        features = self.execute_at(image, np.arange(np.prod(image.GetSize())))
+
+        img_out = sitk.GetImageFromArray(features.reshape(image.GetSize()[::-1] + (-1,)), isVector=True)
+        img_out.CopyInformation(image)
+
+        return img_out
+
+    def execute_at(self, image: sitk.Image, indices: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """Executes a filter bank feature extractor at selected voxels of an image.
+
+        The smoothing is done over the full image, the features are only derived at the voxels.
+
+        Args:
+            image (sitk.Image): The (vector) image, whose components are the channels.
+            indices (np.ndarray): The flat indices of the voxels in the image array (z, y, x) in C order.
+            out (np.ndarray): The optional array with shape (n, number of features) to write the features to, e.g.
+                columns of a feature matrix.
+
+        Returns:
+            np.ndarray: The features with shape (n, number of features) (see :meth:`get_column_names`).
+
+        Raises:
+            ValueError: If image is not 3-D.
+        """
+
+        if image.GetDimension() != 3:
+            raise ValueError('image needs to be 3-D')
+
+        no_channels = image.GetNumberOfComponentsPerPixel()
+        no_features = len(self.FEATURE_NAMES)
+        if out is None:
+            out = np.empty((len(indices), len(self.sigmas) * no_channels * no_features), np.float32)
+
+        image = sitk.Cast(image, sitk.sitkVectorFloat32 if no_channels > 1 else sitk.sitkFloat32)
+        spacing = image.GetSpacing()[::-1]  # (z, y, x) like the array axes
+        z, y, x = np.unravel_index(indices, image.GetSize()[::-1])
+        unit = np.eye(3, dtype=int)
+
+        self.times = []
+        for scale, sigma in enumerate(self.sigmas):
+            start_time = timeit.default_timer()
+
+            smoothed_image = sitk.SmoothingRecursiveGaussian(image, sigma)
+            smoothed = sitk.GetArrayViewFromImage(smoothed_image)
+            padded = np.pad(smoothed.reshape(smoothed.shape[:3] + (no_channels,)), ((1, 1), (1, 1), (1, 1), (0, 0)),
+                            'edge')
+            del smoothed, smoothed_image
+
+            for start in range(0, len(indices), self.chunk_size):
+                chunk = slice(start, start + self.chunk_size)
+                center = np.stack((z[chunk], y[chunk], x[chunk])) + 1
+
+                def value(shift):
+                    """Gets the smoothed values (n, channels) at the voxels shifted by an index offset."""
+                    return padded[center[0] + shift[0], center[1] + shift[1], center[2] + shift[2]]
+
+                values = value((0, 0, 0))
+                gradient_magnitude = np.zeros(values.shape, np.float32)
+                hessian = {}  # the upper triangle of the Hessian by (a, b)
+                for a in range(3):
+                    plus, minus = value(unit[a]), value(-unit[a])
+                    gradient_magnitude += ((plus - minus) / (2 * spacing[a])) ** 2
+                    hessian[a, a] = (plus - 2 * values + minus) / spacing[a] ** 2
+                    for b in range(a + 1, 3):
+                        hessian[a, b] = (value(unit[a] + unit[b]) - value(unit[a] - unit[b]) -
+                                         value(unit[b] - unit[a]) + value(-unit[a] - unit[b])) / \
+                            (4 * spacing[a] * spacing[b])
+                eigenvalues = _get_symmetric_eigenvalues(hessian)
+
+                for channel in range(no_channels):
+                    column = (scale * no_channels + channel) * no_features
+                    out[chunk, column] = values[:, channel]
+                    out[chunk, column + 1] = np.sqrt(gradient_magnitude[:, channel])
+                    out[chunk, column + 2] = hessian[0, 0][:, channel] + hessian[1, 1][:, channel] + \
+                        hessian[2, 2][:, channel]
+                    for idx, eigenvalue in enumerate(eigenvalues):
+                        out[chunk, column + 3 + idx] = eigenvalue[:, channel]
+
+            self.times.append(timeit.default_timer() - start_time)
+
+        return out
+
+    def __str__(self):
+        """Gets a printable string representation.
+
+        Returns:
+            str: String representation.
+        """
+        return 'FilterBankFeatureExtractor:\n' \
+               ' sigmas: {self.sigmas}\n' \
+            .format(self=self)
+
+
+def quantize(img_arr: np.ndarray, levels: int, value_range: tuple = (0.0, 1.0)) -> np.ndarray:
+    """Quantizes intensities to grey levels of equal width.
+
+    Args:
+        img_arr (np.ndarray): The intensities.
+        levels (int): The number of grey levels (at most 255).
+        value_range (tuple): The intensity range (low, high) mapped to the grey levels, where intensities outside are
+            clipped, e.g. (0, 1) for min-max normalized images.
+
+    Returns:
+        np.ndarray: The grey levels (uint8) in [0, levels - 1].
+    """
+    low, high = value_range
+    scaled = (np.asarray(img_arr, np.float64) - low) * (levels / (high - low))
+    return np.clip(np.floor(scaled), 0, levels - 1).astype(np.uint8)
+
+
+class CooccurrenceTextureFeatureExtractor(fltr.Filter):
+    """Represents a grey-level co-occurrence matrix (GLCM) texture feature extractor.
+
+    The intensities are quantized to grey levels (see :func:`quantize`). For each voxel, the symmetric co-occurrence
+    matrix of the voxel pairs (p, p + offset) within the neighborhood centered at the voxel is accumulated per offset,
+    excluding pairs outside the image. The Haralick contrast, homogeneity, energy, and correlation of the matrices are
+    averaged over the offsets. Over the full image, the co-occurrence counts are box sums of the shifted grey level
+    comparisons; at selected voxels, the grey level pairs of each neighborhood are counted.
+    """
+
+    FEATURE_NAMES = ('contrast', 'homogeneity', 'energy', 'correlation')
+
+    def __init__(self, levels: int = 8, kernel: tuple = (5, 5, 5), offsets: tuple = ((1, 0, 0), (0, 1, 0), (0, 0, 1)),
+                 value_range: tuple = (0.0, 1.0), chunk_size: int = 65536):
+        """Initializes a new instance of the CooccurrenceTextureFeatureExtractor class.
+
+        Args:
+            levels (int): The number of grey levels (at most 255).
+            kernel (tuple): The neighborhood size (x, y, z), odd along each axis.
+            offsets (tuple): The offsets (x, y, z) of the voxel pairs.
+            value_range (tuple): The intensity range mapped to the grey levels (see :func:`quantize`).
+            chunk_size (int): The number of neighborhoods counted at once at selected voxels.
+        """
+        super().__init__()
+        self.levels = levels
+        self.kernel = kernel
+        self.offsets = offsets
+        self.value_range = value_range
+        self.chunk_size = chunk_size
+
+    def execute(self, image: sitk.Image, params: fltr.FilterParams = None) -> sitk.Image:
+        """Executes a GLCM texture feature extractor on an image.
+
+        Args:
+            image (sitk.Image): The image.
+            params (fltr.FilterParams): The parameters (unused).
+
+        Returns:
+            sitk.Image: The feature image (float32) with the components of :attr:`FEATURE_NAMES`.
+
+        Raises:
+            ValueError: If image is not 3-D.
+        """
+
+        if image.GetDimension() != 3:
+            raise ValueError('image needs to be 3-D')
+
+        padded, radius = self._get_padded_levels(image)
+        shape = image.GetSize()[::-1]
+        features = np.zeros(shape + (len(self.FEATURE_NAMES),), np.float64)
+        for offset, pairs_shape, start in self._get_pair_windows():
+            first, second = self._get_pairs(padded, offset)
+            valid = (first < self.levels) & (second < self.levels)
+            window = tuple(slice(r - k // 2 + s, None) for r, k, s in zip(radius, self.kernel[::-1], start))
+
+            def box_sums(arr, dtype=np.float64):
+                """Gets the sums over the pairs of each neighborhood."""
+                return _get_box_sums(arr[window], pairs_shape, shape, dtype)
+
+            codes = np.where(valid, first.astype(np.int32) * self.levels + second, -1)
+            first = np.where(valid, first, 0).astype(np.float64)
+            second = np.where(valid, second, 0).astype(np.float64)
+            difference = (first - second) ** 2
+            no_pairs = box_sums(valid, np.int32).astype(np.float64)
+
+            # the energy of the symmetric matrix from the exact counts of the unordered grey level pairs
+            energy = np.zeros(shape)
+            for i in range(self.levels):
+                for j in range(i, self.levels):
+                    pair = (codes == i * self.levels + j) | (codes == j * self.levels + i)
+                    counts = box_sums(pair, np.int32).astype(np.float64)
+                    energy += counts ** 2 if i == j else counts ** 2 / 2
+
+            features[..., :] += self._get_features(no_pairs, box_sums(difference), box_sums(valid / (1 + difference)),
+                                                   energy, box_sums(first + second),
+                                                   box_sums(first ** 2 + second ** 2), box_sums(first * second))
+
+        img_out = sitk.GetImageFromArray((features / len(self.offsets)).astype(np.float32), isVector=True)
+        img_out.CopyInformation(image)
+
+        return img_out
+
+    def execute_at(self, image: sitk.Image, indices: np.ndarray) -> np.ndarray:
+        """Executes a GLCM texture feature extractor at selected voxels of an image.
+
+        The features equal the ones of :meth:`execute` at the voxels, but only the neighborhoods of the voxels are
+        counted.
+
+        Args:
+            image (sitk.Image): The image.
+            indices (np.ndarray): The flat indices of the voxels in the image array (z, y, x) in C order.
+
+        Returns:
+            np.ndarray: The features (float32) with shape (n, number of features).
+
+        Raises:
+            ValueError: If image is not 3-D.
+        """
+
+        if image.GetDimension() != 3:
+            raise ValueError('image needs to be 3-D')
+
+        padded, radius = self._get_padded_levels(image)
+        center = np.unravel_index(indices, image.GetSize()[::-1])
+        levels = np.arange(self.levels, dtype=np.float64)
+        i, j = levels[:, np.newaxis], levels[np.newaxis, :]
+        no_codes = self.levels ** 2 + 1  # the codes of the grey level pairs and of invalid pairs
+
+        features = np.zeros((len(indices), len(self.FEATURE_NAMES)), np.float64)
+        for offset, pairs_shape, start in self._get_pair_windows():
+            first, second = self._get_pairs(padded, offset)
+            codes = np.where((first < self.levels) & (second < self.levels),
+                             first.astype(np.int64) * self.levels + second, no_codes - 1)
+            windows = np.lib.stride_tricks.sliding_window_view(codes, pairs_shape)
+
+            for chunk_start in range(0, len(indices), self.chunk_size):
+                chunk = slice(chunk_start, chunk_start + self.chunk_size)
+                window_starts = [c[chunk] + r - k // 2 + s
+                                 for c, r, k, s in zip(center, radius, self.kernel[::-1], start)]
+                chunk_codes = windows[tuple(window_starts)].reshape(len(window_starts[0]), -1)
+
+                rows = np.arange(chunk_codes.shape[0])[:, np.newaxis] * no_codes
+                counts = np.bincount((rows + chunk_codes).ravel(), minlength=chunk_codes.shape[0] * no_codes)
+                counts = counts.reshape(-1, no_codes)[:, :-1].reshape(-1, self.levels, self.levels).astype(np.float64)
+                counts = counts + np.swapaxes(counts, 1, 2)  # symmetric, i.e. twice the number of pairs
+
+                no_pairs = counts.sum(axis=(1, 2)) / 2
+                features[chunk] += self._get_features(
+                    no_pairs,
+                    (counts * (i - j) ** 2).sum(axis=(1, 2)) / 2,
+                    (counts / (1 + (i - j) ** 2)).sum(axis=(1, 2)) / 2,
+                    (counts ** 2).sum(axis=(1, 2)) / 4,
+                    (counts * i).sum(axis=(1, 2)),
+                    (counts * i ** 2).sum(axis=(1, 2)),
+                    (counts * i * j).sum(axis=(1, 2)) / 2)
+
+        return (features / len(self.offsets)).astype(np.float32)
+
+    def _get_padded_levels(self, image: sitk.Image) -> tuple:
+        """Gets the grey levels padded by the neighborhood radius and the offsets with the invalid level ``levels``."""
+        max_offset = np.max(np.abs(self.offsets), axis=0)[::-1]
+        radius = tuple(k // 2 + o for k, o in zip(self.kernel[::-1], max_offset))
+        levels = quantize(sitk.GetArrayViewFromImage(image), self.levels, self.value_range)
+        return np.pad(levels, [(r, r) for r in radius], constant_values=self.levels), radius
+
+    def _get_pair_windows(self) -> t.Iterator[tuple]:
+        """Gets, per offset, the offset (z, y, x) and the shape and start of the pairs (p, p + offset) within the
+        neighborhood relative to the neighborhood."""
+        for offset in self.offsets:
+            offset = offset[::-1]
+            pairs_shape = tuple(k - abs(o) for k, o in zip(self.kernel[::-1], offset))
+            start = tuple(max(0, -o) for o in offset)
+            yield offset, pairs_shape, start
+
+    def _get_pairs(self, padded: np.ndarray, offset: tuple) -> tuple:
+        """Gets the grey levels of the voxel pairs (p, p + offset), where pairs beyond the array get invalid levels."""
+        second = np.full(padded.shape, self.levels, np.uint8)
+        target = tuple(slice(max(0, -o), padded.shape[axis] - max(0, o)) for axis, o in enumerate(offset))
+        source = tuple(slice(max(0, o), padded.shape[axis] - max(0, -o)) for axis, o in enumerate(offset))
+        second[target] = padded[source]
+        return padded, second
+
+    @staticmethod
+    def _get_features(no_pairs, difference_sum, homogeneity_sum, squared_counts_sum, level_sum, squared_level_sum,
+                      product_sum) -> np.ndarray:
+        """Gets the Haralick features of symmetric co-occurrence matrices from sums over their pairs (p, q).
+
+        Args:
+            no_pairs: The number of pairs n.
+            difference_sum: The sum of (p - q)^2.
+            homogeneity_sum: The sum of 1 / (1 + (p - q)^2).
+            squared_counts_sum: The sum of the squared entries of the symmetric count matrix (halved counts of
+                unordered pairs of different levels).
+            level_sum: The sum of p + q.
+            squared_level_sum: The sum of p^2 + q^2.
+            product_sum: The sum of p * q.
+
+        Returns:
+            np.ndarray: The features with the last axis of :attr:`FEATURE_NAMES`.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = level_sum / (2 * no_pairs)
+            variance = squared_level_sum / (2 * no_pairs) - mean ** 2
+            covariance = product_sum / no_pairs - mean ** 2
+            # the correlation is 1 for a neighborhood of a single grey level
+            correlation = np.where(variance > 1e-12, covariance / variance, 1)
+            features = np.stack([difference_sum / no_pairs,
+                                 homogeneity_sum / no_pairs,
+                                 squared_counts_sum / no_pairs ** 2,
+                                 correlation], axis=-1)
+        return np.nan_to_num(features)
+
+    def __str__(self):
+        """Gets a printable string representation.
+
+        Returns:
+            str: String representation.
+        """
+        return 'CooccurrenceTextureFeatureExtractor:\n' \
+               ' levels:  {self.levels}\n' \
+               ' kernel:  {self.kernel}\n' \
+               ' offsets: {self.offsets}\n' \
+            .format(self=self)
+
+
 class RandomizedTrainingMaskGenerator:
     """Represents a training mask generator.
 
@@ -204,9 +894,14 @@ class RandomizedTrainingMaskGenerator:
     def get_mask(ground_truth: sitk.Image,
                  ground_truth_labels: list,
                  label_percentages: list,
-                 background_mask: sitk.Image = None) -> sitk.Image:
+                 background_mask: sitk.Image = None,
+                 seed: t.Union[int, np.random.SeedSequence, np.random.Generator] = None,
+                 return_indices: bool = False) -> t.Union[sitk.Image, np.ndarray]:
         """Gets a training mask.
 
+        The voxels are grouped by label in a single sort and each group is sampled without replacement, such that the
+        mask is reproducible for a given seed.
+
         Args:
             ground_truth (sitk.Image): The ground truth image.
             ground_truth_labels (list of int): The ground truth labels,
@@ -215,33 +910,44 @@ class RandomizedTrainingMaskGenerator:
                 e.g. [0.2, 0.2].
             background_mask (sitk.Image): A mask, where intensity 0 indicates voxels to exclude independent of the
             label.
+            seed (int, np.random.SeedSequence or np.random.Generator): The seed or generator of the sampling
+                (unseeded if None).
+            return_indices (bool): Whether to return the flat indices of the masked voxels in the ground truth array
+                (z, y, x) in ascending order instead of a mask image.
 
         Returns:
-            sitk.Image: The training mask.
+            sitk.Image or np.ndarray: The training mask or the flat indices of the masked voxels.
         """
+        rng = np.random.default_rng(seed)
 
-        # initialize mask
-        ground_truth_array = sitk.GetArrayFromImage(ground_truth)
-        mask_array = np.zeros(ground_truth_array.shape, dtype=np.uint8)
+        ground_truth_array = sitk.GetArrayViewFromImage(ground_truth).ravel()
 
         # exclude background
+        candidates = None
         if background_mask is not None:
-            background_mask_array = sitk.GetArrayFromImage(background_mask)
-            background_mask_array = np.logical_not(background_mask_array)
-            ground_truth_array = ground_truth_array.astype(float)  # convert to float because of np.nan
-            ground_truth_array[background_mask_array] = np.nan
-
-        for label_idx, label in enumerate(ground_truth_labels):
-            indices = np.transpose(np.where(ground_truth_array == label))
-            np.random.shuffle(indices)
-
-            no_mask_items = int(indices.shape[0] * label_percentages[label_idx])
-
-            for no in range(no_mask_items):
-                x = indices[no][0]
-                y = indices[no][1]
-                z = indices[no][2]
-                mask_array[x, y, z] = 1  # this is a masked item
+            candidates = np.flatnonzero(sitk.GetArrayViewFromImage(background_mask))
+            ground_truth_array = ground_truth_array[candidates]
+
+        # group the voxels by label
+        order = np.argsort(ground_truth_array, kind='stable')
+        sorted_labels = ground_truth_array[order]
+        starts = np.searchsorted(sorted_labels, ground_truth_labels, 'left')
+        ends = np.searchsorted(sorted_labels, ground_truth_labels, 'right')
+
+        selected = []
+        for start, end, percentage in zip(starts, ends, label_percentages):
+            no_mask_items = int((end - start) * percentage)
+            selected.append(order[start + rng.choice(end - start, no_mask_items, replace=False)])
+
+        indices = np.sort(np.concatenate(selected)) if selected else np.empty(0, np.intp)
+        if candidates is not None:
+            indices = candidates[indices]
+
+        if return_indices:
+            return indices
+
+        mask_array = np.zeros(ground_truth.GetSize()[::-1], dtype=np.uint8)
+        mask_array.reshape(-1)[indices] = 1  # these are masked items
 
         mask = sitk.GetImageFromArray(mask_array)
         mask.SetOrigin(ground_truth.GetOrigin())
@@ -63,7 +63,8 @@ class DenseCRFParams(pymia_fltr.FilterParams):
         Args:
             img_t1 (sitk.Image): The T1-weighted image.
             img_t2 (sitk.Image): The T2-weighted image.
-            img_probability (sitk.Image): The posterior probability image.
+            img_probability (sitk.Image): The posterior probability image (floating point or quantized to the range of
+                an unsigned integer type).
         """
         self.img_t1 = img_t1
         self.img_t2 = img_t2
@@ -98,6 +99,9 @@ class DenseCRF(pymia_fltr.Filter):
         img_t2 = sitk.GetArrayFromImage(params.img_t1)
         img_ir = sitk.GetArrayFromImage(params.img_t2)
         img_probability = sitk.GetArrayFromImage(params.img_probability)
+        if img_probability.dtype.kind in 'ui':
+            # probabilities quantized to the range of the integer type
+            img_probability = img_probability.astype(np.float32) / np.iinfo(img_probability.dtype).max
 
         # some variables
         x = img_probability.shape[2]
@@ -3,14 +3,20 @@
 Image pre-processing aims to improve the image quality (image intensities) for subsequent pipeline steps.
 """
 
+import copy
+import typing as t
+
 import pymia.filtering.filter as pymia_fltr
 import matplotlib.pyplot as plt 
-from scipy.signal import wiener
+import scipy.ndimage as ndimage
 from datetime import datetime
 import SimpleITK as sitk
 import numpy as np
 import warnings
 
+import mialab.data.structure as structure
+import mialab.utilities.atlas_registry as atlas_registry
+
 
 def show_image(image, title='Image', cmap='gray'):
     """
@@ -46,7 +52,82 @@ def plot_histogram(img_arr, bins=20):
     # Save the plot to a PNG file with timestamp
     plt.savefig(filename, format='png', dpi=300)
 
-#TODO bilinear interpolation, wiener filter 
+def wiener_denoising(image_array: np.ndarray, kernel_size: int = 3, noise: float = None,
+                     bounding_box: tuple = None) -> np.ndarray:
+    """Applies a Wiener filter to an array.
+
+    The result equals :func:`scipy.signal.wiener` up to float32 precision. The local mean and variance are computed by
+    separable box filters (:func:`scipy.ndimage.uniform_filter`) with zero padding instead of a dense correlation.
+
+    Args:
+        image_array (np.ndarray): The array.
+        kernel_size (int): The size of the local neighborhood window along each axis.
+        noise (float): The noise power. If None, the noise power is estimated as the mean of the local variance.
+        bounding_box (tuple): Optional slices restricting the filtering to a region of the array. The array must be
+            zero outside the region, which is extended by the window's half-size, such that the result is equal to
+            filtering the whole array.
+
+    Returns:
+        np.ndarray: The denoised array (float32).
+    """
+    size = kernel_size ** image_array.ndim
+    if bounding_box is None:
+        region = (slice(None),) * image_array.ndim
+    else:
+        region = tuple(slice(max(s.start - kernel_size // 2, 0), min(s.stop + kernel_size // 2, n))
+                       for s, n in zip(bounding_box, image_array.shape))
+
+    im = image_array[region].astype(np.float32)
+    local_mean = ndimage.uniform_filter(im, kernel_size, mode='constant')
+    local_var = ndimage.uniform_filter(im * im, kernel_size, mode='constant')
+    local_var -= local_mean * local_mean
+
+    if noise is None:
+        # the local variance is zero outside the region (the array and therefore the local mean are zero)
+        noise = local_var.sum(dtype=np.float64) / image_array.size
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res = im - local_mean
+        res *= 1 - np.float32(noise) / local_var
+        res += local_mean
+    res = np.where(local_var < noise, local_mean, res)
+
+    if bounding_box is None:
+        return res
+    out = np.zeros(image_array.shape, np.float32)
+    out[region] = res
+    return out
+
+
+def get_bounding_box(mask_array: np.ndarray) -> tuple:
+    """Gets the bounding box of the non-zero voxels of an array.
+
+    Args:
+        mask_array (np.ndarray): The array, e.g. a brain mask.
+
+    Returns:
+        tuple: The slices of the bounding box along each axis (empty slices if the array is zero).
+    """
+    bounding_box = []
+    for axis in range(mask_array.ndim):
+        indices = np.flatnonzero(mask_array.any(axis=tuple(a for a in range(mask_array.ndim) if a != axis)))
+        bounding_box.append(slice(indices[0], indices[-1] + 1) if indices.size > 0 else slice(0, 0))
+    return tuple(bounding_box)
+
+
+class WienerDenoisingParameters(pymia_fltr.FilterParams):
+    """Wiener denoising parameters."""
+
+    def __init__(self, img_mask: sitk.Image):
+        """Initializes a new instance of the WienerDenoisingParameters class.
+
+        Args:
+            img_mask (sitk.Image): The brain mask image. The image to denoise must be zero outside the mask's bounding
+                box, e.g. skull-stripped.
+        """
+        self.img_mask = img_mask
+
+
 class WienerDenoisingFilter(pymia_fltr.Filter):
     """Represents a Wiener denoising filter for MRI image preprocessing."""
     
@@ -60,24 +141,30 @@ class WienerDenoisingFilter(pymia_fltr.Filter):
         self.kernel_size = kernel_size
     
 
-    def execute(self, image: sitk.Image, params: pymia_fltr.FilterParams = None) -> sitk.Image:
+    def execute(self, image: sitk.Image, params: WienerDenoisingParameters = None) -> sitk.Image:
         """
         Executes the Wiener denoising filter on the given image.
+
+        If a brain mask is given, only the mask's bounding box is filtered (see :func:`wiener_denoising`).
         
         Args:
             image (sitk.Image): Input image.
-            params (pymia_fltr.FilterParams): Optional parameters for filtering.
+            params (WienerDenoisingParameters): Optional parameters with the brain mask.
         
         Returns:
-            sitk.Image: Denoised image.
+            sitk.Image: Denoised image (float32).
         """
         print("[WienerDenoising]: Applying Wiener filter with kernel size", self.kernel_size)
         
         # Convert SimpleITK image to numpy array
-        image_array = sitk.GetArrayFromImage(image)
+        image_array = sitk.GetArrayViewFromImage(image)
+
+        bounding_box = None
+        if params is not None:
+            bounding_box = get_bounding_box(sitk.GetArrayViewFromImage(params.img_mask))
         
         # Apply Wiener filter
-        denoised_array = wiener(image_array, mysize=self.kernel_size)
+        denoised_array = wiener_denoising(image_array, self.kernel_size, bounding_box=bounding_box)
         
         # Convert denoised numpy array back to SimpleITK image
         denoised_image = sitk.GetImageFromArray(denoised_array)
@@ -85,6 +172,55 @@ class WienerDenoisingFilter(pymia_fltr.Filter):
         
         return denoised_image
 
+def _get_interpolator(method: str) -> int:
+    """Gets the SimpleITK interpolator of a resampling method ('NN', 'linear' or 'Bspline')."""
+    match method:
+        case 'NN':
+            return sitk.sitkNearestNeighbor
+        case 'linear':
+            return sitk.sitkLinear
+        case 'Bspline':
+            return sitk.sitkBSpline
+        case _:
+            return sitk.sitkNearestNeighbor
+
+
+def _get_resampled_size(size: tuple, spacing: tuple, new_spacing: tuple) -> list:
+    """Gets the size of an image grid resampled to a new spacing, such that the physical extent is preserved."""
+    return [int(np.round(size[i] * (spacing[i] / new_spacing[i]))) for i in range(len(size))]
+
+
+def get_resampled_properties(image_properties, new_spacing: tuple):
+    """Gets the image properties of an image after the resampling by :class:`Resampling` (without parameters).
+
+    Args:
+        image_properties (pymia.data.conversion.ImageProperties): The image properties.
+        new_spacing (tuple): The new spacing.
+
+    Returns:
+        pymia.data.conversion.ImageProperties: The image properties of the resampled image.
+    """
+    resampled_properties = copy.copy(image_properties)
+    resampled_properties.size = tuple(_get_resampled_size(image_properties.size, image_properties.spacing, new_spacing))
+    resampled_properties.spacing = tuple(float(s) for s in new_spacing)
+    return resampled_properties
+
+
+class ResamplingParameters(pymia_fltr.FilterParams):
+    """Resampling parameters."""
+
+    def __init__(self, grid_origin: tuple, grid_size: tuple = None):
+        """Initializes a new instance of the ResamplingParameters class.
+
+        Args:
+            grid_origin (tuple): The origin of the grid the resampled image is aligned to, i.e. the output voxels are a
+                subset of the voxels of the grid with the new spacing and this origin.
+            grid_size (tuple): The size of the grid, which restricts the output voxels (unrestricted if None).
+        """
+        self.grid_origin = grid_origin
+        self.grid_size = grid_size
+
+
 class Resampling(pymia_fltr.Filter):
     """Represents various resampling methods for MRI image preprocessing."""
 
@@ -93,44 +229,65 @@ class Resampling(pymia_fltr.Filter):
         self.new_spacing = new_spacing
         self.method = method
 
-    def execute(self, image: sitk.Image, params: pymia_fltr.FilterParams = None) -> sitk.Image: 
+    def execute(self, image: sitk.Image, params: ResamplingParameters = None) -> sitk.Image: 
+        """Resamples an image to the new spacing.
+
+        Without parameters, the resampled image has the input's origin. With parameters, the resampled image is
+        aligned to a grid and covers the voxels of the grid inside the input image, e.g. to resample a cropped image
+        onto the voxels of the resampled uncropped image.
+
+        Args:
+            image (sitk.Image): The image.
+            params (ResamplingParameters): The optional parameters with the grid.
+
+        Returns:
+            sitk.Image: The resampled image.
+        """
 
         new_spacing = self.new_spacing
 
         # print("[Resampling]: original space ", image.GetSpacing()," ---Upsampling---> ",new_spacing)
 
-        original_spacing = image.GetSpacing()
-        original_size = image.GetSize()
-        
-        new_size = [
-            int(np.round(original_size[0] * (original_spacing[0] / new_spacing[0]))),
-            int(np.round(original_size[1] * (original_spacing[1] / new_spacing[1]))),
-            int(np.round(original_size[2] * (original_spacing[2] / new_spacing[2])))]
-            
+        new_size = _get_resampled_size(image.GetSize(), image.GetSpacing(), new_spacing)
+        new_origin = image.GetOrigin()
+        default_value = image.GetPixelIDValue()
+        if params is not None:
+            new_origin, new_size = self._get_aligned_grid(image, params)
+            default_value = 0
 
         resampler = sitk.ResampleImageFilter()
         resampler.SetOutputDirection(image.GetDirection())      # direction from input
-        resampler.SetOutputOrigin(image.GetOrigin())            # origin from input
+        resampler.SetOutputOrigin(new_origin)                   # origin from input or grid
         resampler.SetOutputSpacing(new_spacing)                 # new spacing
         resampler.SetSize(new_size)                             # new size
 
         resampler.SetTransform(sitk.Transform())                # transform ?  
-        resampler.SetDefaultPixelValue(image.GetPixelIDValue()) # origin pixel value 
-
-        match self.method: 
-            case 'NN':
-                resampler.SetInterpolator(sitk.sitkNearestNeighbor)
-            case 'linear':
-                resampler.SetInterpolator(sitk.sitkLinear)
-            case 'Bspline':
-                resampler.SetInterpolator(sitk.sitkBSpline)
-            case _: 
-                resampler.SetInterpolator(sitk.sitkNearestNeighbor)
+        resampler.SetDefaultPixelValue(default_value)           # origin pixel value 
+
+        resampler.SetInterpolator(_get_interpolator(self.method))
 
         resampled_image = resampler.Execute(image)
         
         return resampled_image
 
+    def _get_aligned_grid(self, image: sitk.Image, params: ResamplingParameters) -> tuple:
+        """Gets the origin and size of the grid's voxels inside an image."""
+        direction = np.reshape(image.GetDirection(), (image.GetDimension(), image.GetDimension()))
+        spacing = np.array(image.GetSpacing())
+        new_spacing = np.array(self.new_spacing, dtype=float)
+
+        # continuous grid indices of the first and last voxel of the image
+        first = direction.T @ (np.array(image.GetOrigin()) - np.array(params.grid_origin)) / new_spacing
+        last = first + (np.array(image.GetSize()) - 1) * spacing / new_spacing
+        start = np.ceil(first - 1e-6).astype(int)
+        stop = np.floor(last + 1e-6).astype(int) + 1
+        if params.grid_size is not None:
+            start = np.maximum(start, 0)
+            stop = np.minimum(stop, params.grid_size)
+
+        origin = np.array(params.grid_origin) + direction @ (start * new_spacing)
+        return tuple(origin.tolist()), [int(n) for n in np.maximum(stop - start, 1)]
+
 
     def __str__(self):
         """Gets a printable string representation of the Resampling class."""
@@ -248,14 +405,149 @@ class SkullStripping(pymia_fltr.Filter):
         return 'SkullStripping:\n' \
             .format(self=self)
 
+
+def get_cropping_region(img_mask: sitk.Image, padding: int = 0) -> tuple:
+    """Gets the region of the bounding box of a mask.
+
+    Args:
+        img_mask (sitk.Image): The mask.
+        padding (int): The number of voxels to pad the bounding box with on each side.
+
+    Returns:
+        tuple: The index (x, y, z) and size of the region, which lies inside the image (the whole image if the mask
+        is empty).
+    """
+    bounding_box = get_bounding_box(sitk.GetArrayViewFromImage(img_mask))[::-1]  # numpy (z, y, x) to (x, y, z)
+    if any(s.stop == 0 for s in bounding_box):
+        return [0] * img_mask.GetDimension(), list(img_mask.GetSize())
+
+    index = [max(int(s.start) - padding, 0) for s in bounding_box]
+    stop = [min(int(s.stop) + padding, n) for s, n in zip(bounding_box, img_mask.GetSize())]
+    return index, [b - a for a, b in zip(index, stop)]
+
+
+class BrainMaskCroppingParameters(pymia_fltr.FilterParams):
+    """Brain mask cropping parameters."""
+
+    def __init__(self, img_mask: sitk.Image, padding: int = 2):
+        """Initializes a new instance of the BrainMaskCroppingParameters class.
+
+        Args:
+            img_mask (sitk.Image): The brain mask image.
+            padding (int): The number of voxels to pad the brain mask's bounding box with on each side. Two voxels
+                ensure that subsequent linear interpolations and gradients at the border only involve background.
+        """
+        self.img_mask = img_mask
+        self.padding = padding
+
+
+class BrainMaskCropping(pymia_fltr.Filter):
+    """Represents a filter cropping an image to the padded bounding box of the brain mask.
+
+    The cropped image keeps its physical location, i.e. its origin is the position of the bounding box.
+    """
+
+    def __init__(self):
+        """Initializes a new instance of the BrainMaskCropping class."""
+        super().__init__()
+
+    def execute(self, image: sitk.Image, params: BrainMaskCroppingParameters = None) -> sitk.Image:
+        """Crops an image.
+
+        Args:
+            image (sitk.Image): The image.
+            params (BrainMaskCroppingParameters): The parameters with the brain mask.
+
+        Returns:
+            sitk.Image: The cropped image.
+
+        Raises:
+            ValueError: If the mask and image differ in size.
+        """
+        if params.img_mask.GetSize() != image.GetSize():
+            raise ValueError("The mask and image must have the same dimensions.")
+
+        index, size = get_cropping_region(params.img_mask, params.padding)
+        return sitk.RegionOfInterest(image, size, index)
+
+    def __str__(self):
+        """Gets a printable string representation.
+
+        Returns:
+            str: String representation.
+        """
+        return 'BrainMaskCropping:\n' \
+            .format(self=self)
+
+
+class ImageUncroppingParams(pymia_fltr.FilterParams):
+    """Image uncropping parameters."""
+
+    def __init__(self, image_properties: structure.CroppedImageProperties):
+        """Initializes a new instance of the ImageUncroppingParams
+
+        Args:
+            image_properties (structure.CroppedImageProperties): The properties of the cropped image.
+        """
+        self.image_properties = image_properties
+
+
+class ImageUncropping(pymia_fltr.Filter):
+    """Represents a filter restoring a cropped image to the uncropped image grid.
+
+    Voxels outside the cropped image are zero.
+    """
+
+    def __init__(self):
+        """Initializes a new instance of the ImageUncropping class."""
+        super().__init__()
+
+    def execute(self, image: sitk.Image, params: ImageUncroppingParams = None) -> sitk.Image:
+        """Uncrops an image.
+
+        Args:
+            image (sitk.Image): The cropped image (a scalar or vector image).
+            params (ImageUncroppingParams): The parameters with the cropped image properties.
+
+        Returns:
+            sitk.Image: The uncropped image.
+        """
+
+        if params is None:
+            raise ValueError('Parameters are required')
+
+        uncropped = params.image_properties.uncropped
+        image_arr = sitk.GetArrayViewFromImage(image)
+        uncropped_arr = np.zeros(uncropped.size[::-1] + image_arr.shape[uncropped.dimensions:], image_arr.dtype)
+        region = tuple(slice(o, o + n) for o, n in zip(params.image_properties.offset[::-1], image_arr.shape))
+        uncropped_arr[region] = image_arr
+
+        img_out = sitk.GetImageFromArray(uncropped_arr, isVector=image.GetNumberOfComponentsPerPixel() > 1)
+        img_out.SetOrigin(uncropped.origin)
+        img_out.SetSpacing(uncropped.spacing)
+        img_out.SetDirection(uncropped.direction)
+        return img_out
+
+    def __str__(self):
+        """Gets a printable string representation.
+
+        Returns:
+            str: String representation.
+        """
+        return 'ImageUncropping:\n' \
+            .format(self=self)
+
+
 class ImageRegistrationParameters(pymia_fltr.FilterParams):
     """Image registration parameters."""
 
-    def __init__(self, atlas: sitk.Image, transformation: sitk.Transform, is_ground_truth: bool = False):
+    def __init__(self, atlas: t.Union[sitk.Image, atlas_registry.AtlasReference], transformation: sitk.Transform,
+                 is_ground_truth: bool = False):
         """Initializes a new instance of the ImageRegistrationParameters
 
         Args:
-            atlas (sitk.Image): The atlas image.
+            atlas (sitk.Image or AtlasReference): The atlas image or a reference to it (see
+                :mod:`mialab.utilities.atlas_registry`), which avoids pickling the image with the parameters.
             transformation (sitk.Transform): The transformation for registration.
             is_ground_truth (bool): Indicates weather the registration is performed on the ground truth or not.
         """
@@ -263,6 +555,16 @@ class ImageRegistrationParameters(pymia_fltr.FilterParams):
         self.transformation = transformation
         self.is_ground_truth = is_ground_truth
 
+    def get_atlas(self) -> sitk.Image:
+        """Gets the atlas image, which is loaded by the atlas registry if the parameters hold a reference.
+
+        Returns:
+            sitk.Image: The atlas image.
+        """
+        if isinstance(self.atlas, atlas_registry.AtlasReference):
+            return self.atlas.get_image()
+        return self.atlas
+
 class ImageRegistration(pymia_fltr.Filter):
     """Represents a registration filter."""
 
@@ -284,7 +586,7 @@ class ImageRegistration(pymia_fltr.Filter):
         # todo: replace this filter by a registration. Registration can be costly, therefore, we provide you the
         # transformation, which you only need to apply to the image!
 
-        atlas = params.atlas
+        atlas = params.get_atlas()
         transform = params.transformation
         is_ground_truth = params.is_ground_truth  # the ground truth will be handled slightly different
 
@@ -321,3 +623,52 @@ class ImageRegistration(pymia_fltr.Filter):
         return 'ImageRegistration:\n' \
             .format(self=self)
 
+
+class ImageRegistrationResampling(pymia_fltr.Filter):
+    """Represents a registration filter fused with a resampling to a new spacing.
+
+    Instead of resampling the image onto the atlas grid and then resampling it again to the new spacing, the filter
+    builds the atlas grid with the new spacing and interpolates the image once with the registration transformation.
+    """
+
+    def __init__(self, new_spacing=(1, 1, 1), method='linear'):
+        """Initializes a new instance of the ImageRegistrationResampling class.
+
+        Args:
+            new_spacing (tuple): The spacing of the output grid.
+            method (str): The interpolation method ('NN', 'linear' or 'Bspline'), nearest neighbor is always used for
+                the ground truth.
+        """
+        super().__init__()
+        self.new_spacing = new_spacing
+        self.method = method
+
+    def execute(self, image: sitk.Image, params: ImageRegistrationParameters = None) -> sitk.Image:
+        """Registers an image and resamples it to the new spacing.
+
+        Args:
+            image (sitk.Image): The image.
+            params (ImageRegistrationParameters): The registration parameters.
+
+        Returns:
+            sitk.Image: The registered and resampled image.
+        """
+        atlas = params.get_atlas()
+        interpolator = sitk.sitkNearestNeighbor if params.is_ground_truth else _get_interpolator(self.method)
+
+        size = _get_resampled_size(atlas.GetSize(), atlas.GetSpacing(), self.new_spacing)
+
+        return sitk.Resample(image, size, params.transformation, interpolator, atlas.GetOrigin(),
+                             tuple(float(s) for s in self.new_spacing), atlas.GetDirection(), 0.0,
+                             image.GetPixelID())
+
+    def __str__(self):
+        """Gets a printable string representation.
+
+        Returns:
+            str: String representation.
+        """
+        return 'ImageRegistrationResampling:\n' \
+               ' new_spacing: {self.new_spacing}\n' \
+               ' method:      {self.method}\n' \
+            .format(self=self)
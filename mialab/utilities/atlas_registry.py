@@ -0,0 +1,143 @@
+"""This module contains a per-process registry of the atlas images.
+
+Atlas images are registered by a key (e.g., ``'t1'``) and referenced by an :class:`AtlasReference` in filter
+parameters. A reference pickles to its key, path and fingerprint only, such that worker processes do not receive the
+atlas image with every task. Each process loads an atlas lazily at its first use and reuses it afterwards. The first
+load stores an uncompressed copy of the atlas, which further loads (e.g., by other worker processes or later runs)
+read instead of decompressing the original file. Note that each process holds its own copy of the atlas image in
+memory, since SimpleITK copies the pixels into the image.
+"""
+import json
+import os
+import tempfile
+import uuid
+
+import numpy as np
+import SimpleITK as sitk
+
+import mialab.utilities.cache as cache_
+
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), 'mialab-atlas')  # the default directory of the copies
+
+_references = {}  # the registered atlas references by key
+_images = {}  # the atlas images loaded by this process by fingerprint
+
+
+class AtlasReference:
+    """Represents a reference to an atlas image."""
+
+    def __init__(self, key: str, path: str, directory: str = DEFAULT_DIRECTORY):
+        """Initializes a new instance of the AtlasReference class.
+
+        Args:
+            key (str): The key of the atlas.
+            path (str): The path to the atlas image.
+            directory (str): The directory of the uncompressed copy (no copy if None).
+        """
+        self.key = key
+        self.path = path
+        self.directory = directory
+        self.fingerprint = cache_.get_file_fingerprint(path)
+
+    def get_image(self) -> sitk.Image:
+        """Gets the atlas image, which is loaded at the first call in a process.
+
+        Returns:
+            sitk.Image: The atlas image.
+        """
+        if self.fingerprint not in _images:
+            _images[self.fingerprint] = self._load()
+        return _images[self.fingerprint]
+
+    def get_fingerprint(self) -> str:
+        """Gets the fingerprint of the atlas image's file (see :func:`mialab.utilities.cache.get_object_fingerprint`).
+
+        Returns:
+            str: The hexadecimal fingerprint.
+        """
+        return self.fingerprint
+
+    def _load(self) -> sitk.Image:
+        """Loads the atlas image from the uncompressed copy, which is created if it does not exist."""
+        if self.directory is None:
+            return sitk.ReadImage(self.path)
+
+        array_path = os.path.join(self.directory, '{}-{}.npy'.format(self.key, self.fingerprint))
+        header_path = os.path.join(self.directory, '{}-{}.json'.format(self.key, self.fingerprint))
+        if not os.path.exists(header_path):
+            image = sitk.ReadImage(self.path)
+            self._store(image, array_path, header_path)
+            return image
+
+        with open(header_path, 'r') as f:
+            header = json.load(f)
+        array = np.load(array_path)
+        image = sitk.GetImageFromArray(array, isVector=header['is_vector'])
+        image.SetOrigin(header['origin'])
+        image.SetSpacing(header['spacing'])
+        image.SetDirection(header['direction'])
+        return image
+
+    @staticmethod
+    def _store(image: sitk.Image, array_path: str, header_path: str):
+        """Stores the uncompressed copy of an atlas image.
+
+        The files are written under temporary names and renamed, such that concurrent processes never read a partial
+        copy. The header is written last and marks the copy as complete.
+        """
+        os.makedirs(os.path.dirname(array_path), exist_ok=True)
+        suffix = '.{}.tmp'.format(uuid.uuid4().hex)
+        with open(array_path + suffix, 'wb') as f:
+            np.save(f, sitk.GetArrayViewFromImage(image))
+        os.replace(array_path + suffix, array_path)
+
+        header = {'origin': image.GetOrigin(),
+                  'spacing': image.GetSpacing(),
+                  'direction': image.GetDirection(),
+                  'is_vector': image.GetNumberOfComponentsPerPixel() > 1}
+        with open(header_path + suffix, 'w') as f:
+            json.dump(header, f)
+        os.replace(header_path + suffix, header_path)
+
+    def __str__(self):
+        """Gets a printable string representation.
+
+        Returns:
+            str: String representation.
+        """
+        return 'AtlasReference:\n' \
+               ' key:  {self.key}\n' \
+               ' path: {self.path}\n' \
+            .format(self=self)
+
+
+def register(key: str, path: str, directory: str = DEFAULT_DIRECTORY) -> AtlasReference:
+    """Registers an atlas image.
+
+    Args:
+        key (str): The key of the atlas.
+        path (str): The path to the atlas image.
+        directory (str): The directory of the uncompressed copy (no copy if None).
+
+    Returns:
+        AtlasReference: The reference to the atlas.
+    """
+    _references[key] = AtlasReference(key, path, directory)
+    return _references[key]
+
+
+def get(key: str) -> AtlasReference:
+    """Gets the reference to a registered atlas.
+
+    Args:
+        key (str): The key of the atlas.
+
+    Returns:
+        AtlasReference: The reference to the atlas.
+
+    Raises:
+        KeyError: If no atlas is registered with the key.
+    """
+    if key not in _references:
+        raise KeyError('No atlas registered with key {}'.format(key))
+    return _references[key]
@@ -0,0 +1,809 @@
+"""This module contains content-addressed on-disk caches for pre-processed brain images.
+
+The :class:`PreProcessCache` avoids re-computing the pre-processing (registration, skull stripping, denoising,
+resampling, normalization, and feature extraction) of subjects whose input files, pre-processing parameters and
+filter code did not change since a previous run. The :class:`FilterStageCache` memoizes the output of each stage of a
+:class:`MemoizedFilterPipeline` such that changing a parameter of the last stages re-uses the output of the first ones.
+The :class:`FeatureStore` keeps the feature matrices of the training subjects as memory-mappable columns.
+
+The cache can be inspected and purged from the command line::
+
+    python -m mialab.utilities.cache --cache_dir ./mia-cache info
+    python -m mialab.utilities.cache --cache_dir ./mia-cache list
+    python -m mialab.utilities.cache --cache_dir ./mia-cache purge --older_than 30
+"""
+import argparse
+import collections
+import datetime
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import time
+import typing as t
+import uuid
+
+import numpy as np
+import pymia.filtering.filter as fltr
+import SimpleITK as sitk
+
+import mialab.data.structure as structure
+
+CACHE_FORMAT_VERSION = 1  # increase if the layout of a cache entry changes
+
+_META_FILE = 'meta.json'
+_HEADER_FILE = 'header.pkl'
+_TRANSFORM_FILE = 'transform.tfm'
+
+_file_fingerprints = {}  # memoizes file fingerprints by (path, size, modification time)
+
+
+def get_file_fingerprint(path: str) -> str:
+    """Gets the SHA-256 fingerprint of a file's content.
+
+    Args:
+        path (str): The path to the file.
+
+    Returns:
+        str: The hexadecimal fingerprint.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_fingerprints:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        _file_fingerprints[memo_key] = sha.hexdigest()
+    return _file_fingerprints[memo_key]
+
+
+def get_params_fingerprint(params: dict) -> str:
+    """Gets the SHA-256 fingerprint of a parameter dict.
+
+    Args:
+        params (dict): The parameters. Values that are not JSON serializable are represented by their ``repr``.
+
+    Returns:
+        str: The hexadecimal fingerprint.
+    """
+    params_str = json.dumps(params, sort_keys=True, default=repr)
+    return hashlib.sha256(params_str.encode('utf-8')).hexdigest()
+
+
+def get_code_fingerprint(modules: list) -> str:
+    """Gets the SHA-256 fingerprint of the source code of modules.
+
+    The fingerprint serves as filter version, i.e. any change of the filter code invalidates cached results.
+
+    Args:
+        modules (list): The modules.
+
+    Returns:
+        str: The hexadecimal fingerprint.
+    """
+    sha = hashlib.sha256()
+    for module in sorted(modules, key=lambda m: m.__name__):
+        sha.update(module.__name__.encode('utf-8'))
+        sha.update(get_file_fingerprint(inspect.getsourcefile(module)).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def get_image_fingerprint(image: sitk.Image) -> str:
+    """Gets the SHA-256 fingerprint of an image's voxels, pixel type and physical properties.
+
+    Args:
+        image (sitk.Image): The image.
+
+    Returns:
+        str: The hexadecimal fingerprint.
+    """
+    sha = hashlib.sha256()
+    sha.update(repr((image.GetPixelIDValue(), image.GetNumberOfComponentsPerPixel(), image.GetSize(),
+                     image.GetOrigin(), image.GetSpacing(), image.GetDirection())).encode('utf-8'))
+    sha.update(np.ascontiguousarray(sitk.GetArrayViewFromImage(image)).data)
+    return sha.hexdigest()
+
+
+def get_object_fingerprint(obj) -> str:
+    """Gets the SHA-256 fingerprint of an object, e.g. a filter or filter parameters.
+
+    Images, transformations, and numpy arrays are fingerprinted by their content, containers and objects recursively by
+    their items and attributes. Objects may provide their own fingerprint by a ``get_fingerprint`` method.
+
+    Args:
+        obj: The object.
+
+    Returns:
+        str: The hexadecimal fingerprint.
+    """
+    if hasattr(obj, 'get_fingerprint'):
+        content = obj.get_fingerprint()
+    elif isinstance(obj, sitk.Image):
+        content = get_image_fingerprint(obj)
+    elif isinstance(obj, sitk.Transform):
+        content = repr((obj.GetName(), obj.GetParameters(), obj.GetFixedParameters()))
+    elif isinstance(obj, np.ndarray):
+        content = repr((obj.dtype.str, obj.shape)) + hashlib.sha256(np.ascontiguousarray(obj).data).hexdigest()
+    elif isinstance(obj, dict):
+        content = repr(sorted((repr(key), get_object_fingerprint(value)) for key, value in obj.items()))
+    elif isinstance(obj, (list, tuple)):
+        content = repr([get_object_fingerprint(item) for item in obj])
+    elif callable(obj) and hasattr(obj, '__qualname__'):
+        content = repr((getattr(obj, '__module__', ''), obj.__qualname__))
+    elif hasattr(obj, '__dict__'):
+        content = repr((type(obj).__module__, type(obj).__qualname__, get_object_fingerprint(vars(obj))))
+    else:
+        content = repr(obj)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def get_subject_key(paths: dict, params: dict, code_fingerprint: str = '',
+                    additional_files: t.Iterable[str] = ()) -> str:
+    """Gets the key of a subject's pre-processing.
+
+    Args:
+        paths (dict): A dict, where the keys are an image identifier of type structure.BrainImageTypes
+            and the values are paths to the images (other keys are ignored).
+        params (dict): The pre-processing parameters.
+        code_fingerprint (str): The fingerprint of the filter code (see :func:`get_code_fingerprint`).
+        additional_files (Iterable[str]): Paths to additional files the pre-processing depends on.
+
+    Returns:
+        str: The key.
+    """
+    inputs = {key.name: get_file_fingerprint(path) for key, path in paths.items()
+              if isinstance(key, structure.BrainImageTypes)}
+    key = {'format_version': CACHE_FORMAT_VERSION,
+           'inputs': inputs,
+           'params': get_params_fingerprint(params),
+           'code': code_fingerprint,
+           'additional_files': sorted(get_file_fingerprint(path) for path in additional_files)}
+    return get_params_fingerprint(key)
+
+
+class CacheEntry:
+    """Represents an entry of a :class:`DiskCache`."""
+
+    def __init__(self, key: str, directory: str, meta: dict, last_access: float):
+        """Initializes a new instance of the CacheEntry class.
+
+        Args:
+            key (str): The entry's key.
+            directory (str): The entry's directory.
+            meta (dict): The entry's meta-data.
+            last_access (float): The time of the last access in seconds since the epoch.
+        """
+        self.key = key
+        self.directory = directory
+        self.meta = meta
+        self.last_access = last_access
+
+    @property
+    def size(self) -> int:
+        """int: The size of the entry in bytes."""
+        return self.meta.get('size', 0)
+
+    def __str__(self):
+        """Gets a printable string representation.
+
+        Returns:
+            str: String representation.
+        """
+        last_access = datetime.datetime.fromtimestamp(self.last_access).strftime('%Y-%m-%d %H:%M:%S')
+        return '{self.key:.16}  {size:>10.1f} MB  {last_access}  {description}' \
+            .format(self=self, size=self.size / 2 ** 20, last_access=last_access,
+                    description=self.meta.get('description', ''))
+
+
+class DiskCache:
+    """Represents a size-bounded, content-addressed on-disk cache.
+
+    Each entry is a directory named by its key. Entries are written to a temporary directory first and renamed
+    afterwards such that concurrent readers never observe incomplete entries. If the cache exceeds its maximum size,
+    the least recently accessed entries are evicted.
+    """
+
+    def __init__(self, directory: str, max_size: int = None):
+        """Initializes a new instance of the DiskCache class.
+
+        Args:
+            directory (str): The cache directory.
+            max_size (int): The maximum size of the cache in bytes (None means unbounded).
+        """
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get_entry_directory(self, key: str) -> str:
+        """Gets the directory of an entry.
+
+        Args:
+            key (str): The entry's key.
+
+        Returns:
+            str: The entry's directory.
+        """
+        return os.path.join(self.directory, key)
+
+    def contains(self, key: str) -> bool:
+        """Determines whether the cache contains an entry.
+
+        Args:
+            key (str): The entry's key.
+
+        Returns:
+            bool: True if the entry exists; otherwise, False.
+        """
+        return os.path.isfile(os.path.join(self.get_entry_directory(key), _META_FILE))
+
+    def touch(self, key: str):
+        """Marks an entry as recently accessed.
+
+        Args:
+            key (str): The entry's key.
+        """
+        os.utime(os.path.join(self.get_entry_directory(key), _META_FILE))
+
+    def entries(self) -> t.List[CacheEntry]:
+        """Gets all entries, where the least recently accessed entry comes first.
+
+        Returns:
+            List[CacheEntry]: The entries.
+        """
+        entries = []
+        for key in os.listdir(self.directory):
+            meta_file = os.path.join(self.get_entry_directory(key), _META_FILE)
+            if key.startswith('.') or not os.path.isfile(meta_file):
+                continue
+            with open(meta_file, 'r') as f:
+                meta = json.load(f)
+            entries.append(CacheEntry(key, self.get_entry_directory(key), meta, os.path.getmtime(meta_file)))
+        return sorted(entries, key=lambda entry: entry.last_access)
+
+    def size(self) -> int:
+        """Gets the size of the cache.
+
+        Returns:
+            int: The size of all entries in bytes.
+        """
+        return sum(entry.size for entry in self.entries())
+
+    def remove(self, key: str):
+        """Removes an entry.
+
+        Args:
+            key (str): The entry's key.
+        """
+        shutil.rmtree(self.get_entry_directory(key), ignore_errors=True)
+
+    def purge(self, older_than: float = None) -> t.List[CacheEntry]:
+        """Removes entries.
+
+        Args:
+            older_than (float): Only remove entries, which were not accessed for this amount of days.
+                None removes all entries.
+
+        Returns:
+            List[CacheEntry]: The removed entries.
+        """
+        removed = []
+        for entry in self.entries():
+            if older_than is None or time.time() - entry.last_access > older_than * 24 * 60 * 60:
+                self.remove(entry.key)
+                removed.append(entry)
+        return removed
+
+    def evict(self, keep: t.Iterable[str] = ()) -> t.List[CacheEntry]:
+        """Removes the least recently accessed entries until the cache does not exceed its maximum size.
+
+        Args:
+            keep (Iterable[str]): Keys of entries, which must not be removed.
+
+        Returns:
+            List[CacheEntry]: The removed entries.
+        """
+        if self.max_size is None:
+            return []
+
+        entries = self.entries()
+        size = sum(entry.size for entry in entries)
+        removed = []
+        for entry in entries:
+            if size <= self.max_size:
+                break
+            if entry.key in keep:
+                continue
+            self.remove(entry.key)
+            size -= entry.size
+            removed.append(entry)
+        return removed
+
+    def _create_temporary_directory(self) -> str:
+        tmp_dir = os.path.join(self.directory, '.tmp-' + uuid.uuid4().hex)
+        os.makedirs(tmp_dir)
+        return tmp_dir
+
+    def _commit(self, tmp_dir: str, key: str, meta: dict):
+        """Commits a temporary directory as entry and evicts old entries if required."""
+        meta['size'] = sum(os.path.getsize(os.path.join(tmp_dir, file)) for file in os.listdir(tmp_dir))
+        meta['format_version'] = CACHE_FORMAT_VERSION
+        with open(os.path.join(tmp_dir, _META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        try:
+            os.rename(tmp_dir, self.get_entry_directory(key))
+        except OSError:
+            # the entry has been stored concurrently
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.evict(keep=(key,))
+
+
+class PreProcessCache(DiskCache):
+    """Represents an on-disk cache for the results of :func:`pipeline_utilities.pre_process`.
+
+    The key of an entry is derived from the content of the input files, the pre-processing parameters, the
+    fingerprint of the filter code and the content of additional files (e.g., the atlas images). Entries store the
+    pre-processed images, the transformation, the image properties, and the feature matrix of a
+    :class:`BrainImage <data.structure.BrainImage>`.
+    """
+
+    SUB_DIRECTORY = 'pre_process'
+
+    def __init__(self, directory: str, max_size: int = None, code_fingerprint: str = ''):
+        """Initializes a new instance of the PreProcessCache class.
+
+        Args:
+            directory (str): The cache's root directory.
+            max_size (int): The maximum size of the cache in bytes (None means unbounded).
+            code_fingerprint (str): The fingerprint of the filter code (see :func:`get_code_fingerprint`).
+        """
+        super().__init__(os.path.join(directory, self.SUB_DIRECTORY), max_size)
+        self.code_fingerprint = code_fingerprint
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, paths: dict, params: dict, additional_files: t.Iterable[str] = ()) -> str:
+        """Gets the key of a subject.
+
+        Args:
+            paths (dict): A dict, where the keys are an image identifier of type structure.BrainImageTypes
+                and the values are paths to the images (other keys are ignored).
+            params (dict): The pre-processing parameters.
+            additional_files (Iterable[str]): Paths to additional files the pre-processing depends on.
+
+        Returns:
+            str: The key.
+        """
+        return get_subject_key(paths, params, self.code_fingerprint, additional_files)
+
+    def load(self, key: str, id_: str, path: str) -> t.Optional[structure.BrainImage]:
+        """Loads a pre-processed image.
+
+        Args:
+            key (str): The key.
+            id_ (str): The image identifier.
+            path (str): Full path to the image directory.
+
+        Returns:
+            BrainImage: The pre-processed image or None if the cache does not contain the key.
+        """
+        if not self.contains(key):
+            self.misses += 1
+            return None
+
+        entry_dir = self.get_entry_directory(key)
+        with open(os.path.join(entry_dir, _HEADER_FILE), 'rb') as f:
+            header = pickle.load(f)
+
+        images = {img_key: sitk.ReadImage(os.path.join(entry_dir, img_key.name + '.mha'))
+                  for img_key in header['image_keys']}
+        transform = sitk.ReadTransform(os.path.join(entry_dir, _TRANSFORM_FILE))
+        img = structure.BrainImage(id_, path, images, transform)
+        img.image_properties = header['image_properties']
+        if header['feature_matrix_length'] is not None:
+            img.feature_matrix = tuple(np.load(os.path.join(entry_dir, 'feature_matrix_{}.npy'.format(i)))
+                                       for i in range(header['feature_matrix_length']))
+
+        self.touch(key)
+        self.hits += 1
+        return img
+
+    def store(self, key: str, img: structure.BrainImage):
+        """Stores a pre-processed image.
+
+        Args:
+            key (str): The key.
+            img (BrainImage): The pre-processed image.
+        """
+        tmp_dir = self._create_temporary_directory()
+        try:
+            for img_key, image in img.images.items():
+                sitk.WriteImage(image, os.path.join(tmp_dir, img_key.name + '.mha'), False)
+            sitk.WriteTransform(img.transformation, os.path.join(tmp_dir, _TRANSFORM_FILE))
+            if img.feature_matrix is not None:
+                for i, array in enumerate(img.feature_matrix):
+                    np.save(os.path.join(tmp_dir, 'feature_matrix_{}.npy'.format(i)), np.asarray(array))
+
+            header = {'image_keys': list(img.images.keys()),
+                      'image_properties': img.image_properties,
+                      'feature_matrix_length': None if img.feature_matrix is None else len(img.feature_matrix)}
+            with open(os.path.join(tmp_dir, _HEADER_FILE), 'wb') as f:
+                pickle.dump(header, f)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        self._commit(tmp_dir, key, {'description': img.id_})
+
+
+class FeatureStore(DiskCache):
+    """Represents an on-disk columnar store of the feature matrices of pre-processed subjects.
+
+    An entry holds the features, labels, voxel indices, and column names of a subject's feature matrix (see
+    :class:`FeatureExtractor <mialab.utilities.pipeline_utilities.FeatureExtractor>`) as separate ``.npy`` files. The
+    key of an entry is the same as the one of the :class:`PreProcessCache` (see :func:`get_subject_key`). The entries
+    are loaded as memory maps, such that a design matrix can be assembled from many subjects while holding only one
+    copy of the data in memory.
+    """
+
+    SUB_DIRECTORY = 'features'
+    FILES = ('features', 'labels', 'indices', 'columns')
+
+    def __init__(self, directory: str, max_size: int = None, code_fingerprint: str = ''):
+        """Initializes a new instance of the FeatureStore class.
+
+        Args:
+            directory (str): The cache's root directory.
+            max_size (int): The maximum size of the store in bytes (None means unbounded).
+            code_fingerprint (str): The fingerprint of the filter code (see :func:`get_code_fingerprint`).
+        """
+        super().__init__(os.path.join(directory, self.SUB_DIRECTORY), max_size)
+        self.code_fingerprint = code_fingerprint
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, paths: dict, params: dict, additional_files: t.Iterable[str] = ()) -> str:
+        """Gets the key of a subject (see :func:`get_subject_key`)."""
+        return get_subject_key(paths, params, self.code_fingerprint, additional_files)
+
+    def load(self, key: str, mmap_mode: str = 'r') -> t.Optional[tuple]:
+        """Loads the feature matrix of a subject.
+
+        Args:
+            key (str): The key.
+            mmap_mode (str): The memory map mode of :func:`numpy.load` (None loads the arrays into memory).
+
+        Returns:
+            tuple: The features, labels, voxel indices, and column names or None if the store does not contain the key.
+        """
+        if not self.contains(key):
+            self.misses += 1
+            return None
+
+        entry_dir = self.get_entry_directory(key)
+        feature_matrix = tuple(np.load(os.path.join(entry_dir, name + '.npy'), mmap_mode=mmap_mode)
+                               for name in self.FILES)
+        self.touch(key)
+        self.hits += 1
+        return feature_matrix
+
+    def store(self, key: str, id_: str, feature_matrix: tuple):
+        """Stores the feature matrix of a subject.
+
+        Args:
+            key (str): The key.
+            id_ (str): The image identifier.
+            feature_matrix (tuple): The features, labels, voxel indices, and column names.
+        """
+        tmp_dir = self._create_temporary_directory()
+        try:
+            for name, array in zip(self.FILES, feature_matrix):
+                np.save(os.path.join(tmp_dir, name + '.npy'), np.asarray(array))
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        self._commit(tmp_dir, key, {'description': id_})
+
+    def assemble(self, keys: t.Sequence[str], transform: t.Callable[[np.ndarray, np.ndarray], np.ndarray] = None,
+                 dtype=None) -> t.Tuple[np.ndarray, np.ndarray]:
+        """Assembles the design matrix and the label vector of several subjects.
+
+        The output is allocated once and filled subject by subject from the memory maps.
+
+        Args:
+            keys (Sequence[str]): The keys of the subjects.
+            transform (callable): An optional function ``transform(features, out)``, which writes the transformed
+                features of a subject into ``out`` (e.g. :meth:`FeatureQuantizer.transform
+                <mialab.classifier.quantization.FeatureQuantizer.transform>`).
+            dtype: The type of the design matrix (the type of the stored features if None).
+
+        Returns:
+            tuple: The features of shape (n_samples, n_features) and the labels of shape (n_samples,).
+        """
+        feature_matrices = [self._load_existing(key) for key in keys]
+        columns = self._check_columns(feature_matrices)
+        n_samples = sum(features.shape[0] for features, _, _, _ in feature_matrices)
+
+        data = np.empty((n_samples, len(columns)), feature_matrices[0][0].dtype if dtype is None else dtype)
+        labels = np.empty(n_samples, feature_matrices[0][1].dtype)
+        start = 0
+        for features, subject_labels, _, _ in feature_matrices:
+            if transform is None:
+                data[start:start + features.shape[0]] = features
+            else:
+                transform(features, data[start:start + features.shape[0]])
+            labels[start:start + features.shape[0]] = subject_labels.reshape(-1)
+            start += features.shape[0]
+        return data, labels
+
+    def get_subject_chunks(self, keys: t.Sequence[str], n_samples: int) -> t.List[t.List[str]]:
+        """Groups consecutive subjects into chunks of about a number of samples.
+
+        A chunk is closed as soon as it has at least ``n_samples`` samples, such that a chunk only exceeds the number
+        by less than the samples of one subject.
+
+        Args:
+            keys (Sequence[str]): The keys of the subjects.
+            n_samples (int): The number of samples per chunk.
+
+        Returns:
+            List[List[str]]: The keys of the subjects of each chunk.
+        """
+        chunks = [[]]
+        chunk_samples = 0
+        for key in keys:
+            if chunk_samples >= n_samples:
+                chunks.append([])
+                chunk_samples = 0
+            chunks[-1].append(key)
+            chunk_samples += self._load_existing(key)[0].shape[0]
+        return chunks
+
+    def sample(self, keys: t.Sequence[str], n_samples: int, seed: int = 0) -> np.ndarray:
+        """Draws random rows of the design matrix of several subjects without assembling it.
+
+        Args:
+            keys (Sequence[str]): The keys of the subjects.
+            n_samples (int): The number of rows (all rows if the subjects have less).
+            seed (int): The seed of the random generator.
+
+        Returns:
+            np.ndarray: The features of shape (n_samples, n_features) in the order of the subjects.
+        """
+        feature_matrices = [self._load_existing(key) for key in keys]
+        self._check_columns(feature_matrices)
+        offsets = np.cumsum([0] + [features.shape[0] for features, _, _, _ in feature_matrices])
+        rows = np.arange(offsets[-1])
+        if n_samples < offsets[-1]:
+            rows = np.sort(np.random.default_rng(seed).choice(offsets[-1], n_samples, replace=False))
+
+        bounds = np.searchsorted(rows, offsets)
+        return np.concatenate([features[rows[bounds[i]:bounds[i + 1]] - offsets[i]]
+                               for i, (features, _, _, _) in enumerate(feature_matrices)])
+
+    def iter_chunks(self, keys: t.Sequence[str],
+                    chunk_size: int = 1 << 20) -> t.Iterator[t.Tuple[np.ndarray, np.ndarray]]:
+        """Streams the design matrix and the label vector of several subjects in chunks.
+
+        Args:
+            keys (Sequence[str]): The keys of the subjects.
+            chunk_size (int): The maximum number of samples per chunk. A chunk does not span several subjects.
+
+        Yields:
+            tuple: The features of shape (n_chunk, n_features) and the labels of shape (n_chunk,).
+        """
+        feature_matrices = [self._load_existing(key) for key in keys]
+        self._check_columns(feature_matrices)
+        for features, labels, _, _ in feature_matrices:
+            for start in range(0, features.shape[0], chunk_size):
+                yield (np.array(features[start:start + chunk_size]),
+                       np.array(labels[start:start + chunk_size]).reshape(-1))
+
+    def _load_existing(self, key: str) -> tuple:
+        feature_matrix = self.load(key)
+        if feature_matrix is None:
+            raise KeyError('The feature store {} does not contain the entry {}'.format(self.directory, key))
+        return feature_matrix
+
+    @staticmethod
+    def _check_columns(feature_matrices: t.List[tuple]) -> np.ndarray:
+        if len(feature_matrices) == 0:
+            raise ValueError('At least one subject is required')
+        columns = feature_matrices[0][3]
+        for feature_matrix in feature_matrices[1:]:
+            if not np.array_equal(feature_matrix[3], columns):
+                raise ValueError('The subjects have different feature columns: {} and {}'.format(
+                    list(columns), list(feature_matrix[3])))
+        return columns
+
+
+class FilterStageCache(DiskCache):
+    """Represents an on-disk cache for the output images of the stages of a :class:`MemoizedFilterPipeline`.
+
+    The key of a stage is derived from the fingerprint of its input, the filter's class and attributes, the source code
+    of the filter's module, and the filter parameters. The cache counts hits and misses per filter class.
+    """
+
+    SUB_DIRECTORY = 'stages'
+
+    def __init__(self, directory: str, max_size: int = None):
+        """Initializes a new instance of the FilterStageCache class.
+
+        Args:
+            directory (str): The cache's root directory.
+            max_size (int): The maximum size of the cache in bytes (None means unbounded).
+        """
+        super().__init__(os.path.join(directory, self.SUB_DIRECTORY), max_size)
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+
+    @staticmethod
+    def get_key(input_fingerprint: str, filter_: fltr.Filter, params: fltr.FilterParams = None) -> str:
+        """Gets the key of a filter stage.
+
+        Args:
+            input_fingerprint (str): The fingerprint of the stage's input image, i.e. the key of the previous stage or
+                the image fingerprint (see :func:`get_image_fingerprint`) for the first stage.
+            filter_ (fltr.Filter): The filter.
+            params (fltr.FilterParams): The filter parameters.
+
+        Returns:
+            str: The key.
+        """
+        # changing the implementation of the filter invalidates its stages
+        module = inspect.getmodule(type(filter_))
+        key = {'format_version': CACHE_FORMAT_VERSION,
+               'input': input_fingerprint,
+               'filter': get_object_fingerprint(filter_),
+               'code': get_code_fingerprint([module]) if module is not None else '',
+               'params': get_object_fingerprint(params)}
+        return get_params_fingerprint(key)
+
+    def load(self, key: str) -> t.Optional[sitk.Image]:
+        """Loads the output image of a stage.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            sitk.Image: The image or None if the cache does not contain the key.
+        """
+        if not self.contains(key):
+            return None
+        image = sitk.ReadImage(os.path.join(self.get_entry_directory(key), 'image.mha'))
+        self.touch(key)
+        return image
+
+    def store(self, key: str, image: sitk.Image, filter_: fltr.Filter):
+        """Stores the output image of a stage.
+
+        Args:
+            key (str): The key.
+            image (sitk.Image): The image.
+            filter_ (fltr.Filter): The filter, which produced the image.
+        """
+        tmp_dir = self._create_temporary_directory()
+        try:
+            sitk.WriteImage(image, os.path.join(tmp_dir, 'image.mha'), False)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self._commit(tmp_dir, key, {'description': type(filter_).__name__})
+
+    def report(self) -> str:
+        """Gets a report of the hits and misses per filter class.
+
+        Returns:
+            str: The report.
+        """
+        lines = ['Filter stage cache:']
+        for name in sorted(set(self.hits) | set(self.misses)):
+            lines.append(' {:<30} {:>5} hits {:>5} misses'.format(name, self.hits[name], self.misses[name]))
+        return '\n'.join(lines)
+
+
+class MemoizedFilterPipeline(fltr.FilterPipeline):
+    """Represents a filter pipeline, which memoizes the output of each stage in a :class:`FilterStageCache`.
+
+    The keys of all stages are chained from the fingerprint of the input image, such that they can be determined
+    without executing any filter. The pipeline loads the output of the last cached stage and only executes the
+    remaining stages. Any :class:`pymia.filtering.filter.Filter` works as stage, as long as its output is fully
+    determined by its input image, its attributes and its parameters.
+    """
+
+    def __init__(self, filters: t.List[fltr.Filter] = None, cache: FilterStageCache = None):
+        """Initializes a new instance of the MemoizedFilterPipeline class.
+
+        Args:
+            filters (list of Filter): The filters of the pipeline.
+            cache (FilterStageCache): The stage cache. The pipeline does not memoize if None.
+        """
+        super().__init__(filters)
+        self.cache = cache
+
+    def execute(self, image: sitk.Image) -> sitk.Image:
+        """Executes the filter pipeline on an image.
+
+        Args:
+            image (sitk.Image): The image to filter.
+
+        Returns:
+            sitk.Image: The filtered image.
+        """
+        if self.cache is None or len(self.filters) == 0:
+            return super().execute(image)
+
+        keys = []
+        fingerprint = get_image_fingerprint(image)
+        for filter_, params in zip(self.filters, self.params):
+            fingerprint = self.cache.get_key(fingerprint, filter_, params)
+            keys.append(fingerprint)
+
+        # resume after the last cached stage
+        first_stage = 0
+        for stage in reversed(range(len(self.filters))):
+            cached_image = self.cache.load(keys[stage])
+            if cached_image is not None:
+                image = cached_image
+                first_stage = stage + 1
+                break
+
+        for stage, filter_ in enumerate(self.filters):
+            name = type(filter_).__name__
+            if stage < first_stage:
+                self.cache.hits[name] += 1
+                continue
+            self.cache.misses[name] += 1
+            image = filter_.execute(image, self.params[stage])
+            self.cache.store(keys[stage], image, filter_)
+
+        return image
+
+
+def main():
+    """Inspects or purges a cache from the command line."""
+
+    parser = argparse.ArgumentParser(description='Inspect or purge the MIALab pre-processing cache')
+    parser.add_argument('--cache_dir', type=str, required=True, help='Directory of the cache.')
+
+    sub_parsers = parser.add_subparsers(dest='command', required=True)
+    sub_parsers.add_parser('info', help='Print the number of entries and the size of the cache.')
+    sub_parsers.add_parser('list', help='List all entries, least recently accessed first.')
+    purge_parser = sub_parsers.add_parser('purge', help='Remove entries.')
+    purge_parser.add_argument('--older_than', type=float, default=None,
+                              help='Only remove entries not accessed for this amount of days.')
+    purge_parser.add_argument('--max_size', type=float, default=None,
+                              help='Evict least recently accessed entries until the cache is smaller (in GB).')
+
+    args = parser.parse_args()
+
+    caches = [DiskCache(os.path.join(args.cache_dir, PreProcessCache.SUB_DIRECTORY)),
+              DiskCache(os.path.join(args.cache_dir, FilterStageCache.SUB_DIRECTORY)),
+              DiskCache(os.path.join(args.cache_dir, FeatureStore.SUB_DIRECTORY))]
+
+    for cache in caches:
+        if args.command == 'info':
+            entries = cache.entries()
+            print('{}: {} entries, {:.1f} MB'.format(cache.directory, len(entries),
+                                                   sum(entry.size for entry in entries) / 2 ** 20))
+        elif args.command == 'list':
+            print('-' * 5, cache.directory)
+            for entry in cache.entries():
+                print(entry)
+        elif args.command == 'purge':
+            if args.max_size is not None:
+                cache.max_size = int(args.max_size * 2 ** 30)
+                removed = cache.evict()
+            else:
+                removed = cache.purge(args.older_than)
+            print('{}: removed {} entries, {:.1f} MB'.format(cache.directory, len(removed),
+                                                            sum(entry.size for entry in removed) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""This module contains the execution resources, which split a core budget between processes and threads.
+
+SimpleITK filters, BLAS, and scikit-learn each use one thread per core by default. Combined with a process pool of one
+process per core, this oversubscribes the cores quadratically. The :class:`ExecutionResources` split the core budget per
+pipeline phase into the number of pool processes, the number of SimpleITK threads and BLAS threads per process, and the
+``n_jobs`` of scikit-learn estimators.
+
+The default policy is:
+
+================  ===========================  =======================  =======================  ======
+phase             pool processes               SimpleITK threads        BLAS threads             n_jobs
+================  ===========================  =======================  =======================  ======
+``pre_process``   min(cores, number of tasks)  cores // pool processes  cores // pool processes  1
+``training``      1                            cores                    1                        cores
+``testing``       1                            cores                    1                        cores
+``post_process``  min(cores, number of tasks)  cores // pool processes  cores // pool processes  1
+================  ===========================  =======================  =======================  ======
+
+That is, the parallel phases run one subject per process and share the remaining cores among the filter threads of
+each process, and a phase running sequentially uses all cores for the filter threads. The forest uses its ``n_jobs``
+threads, each being single-threaded. Any value can be overridden per phase, e.g., from the command line by
+``--resources pre_process:processes=8,sitk_threads=16`` (see :func:`parse_overrides`).
+"""
+import contextlib
+import os
+import typing as t
+
+import SimpleITK as sitk
+import threadpoolctl
+
+PHASES = ('pre_process', 'training', 'testing', 'post_process')
+_POOL_PHASES = ('pre_process', 'post_process')
+
+
+class PhaseResources:
+    """Represents the resources of a pipeline phase."""
+
+    FIELDS = ('processes', 'sitk_threads', 'blas_threads', 'n_jobs')
+
+    def __init__(self, processes: int = 1, sitk_threads: int = 1, blas_threads: int = 1, n_jobs: int = 1):
+        """Initializes a new instance of the PhaseResources class.
+
+        Args:
+            processes (int): The number of pool processes.
+            sitk_threads (int): The number of SimpleITK threads per process.
+            blas_threads (int): The number of BLAS threads per process.
+            n_jobs (int): The ``n_jobs`` of scikit-learn estimators.
+        """
+        self.processes = processes
+        self.sitk_threads = sitk_threads
+        self.blas_threads = blas_threads
+        self.n_jobs = n_jobs
+
+    def __str__(self):
+        """Gets a printable string representation.
+
+        Returns:
+            str: String representation.
+        """
+        return 'PhaseResources: processes={self.processes}, sitk_threads={self.sitk_threads}, ' \
+               'blas_threads={self.blas_threads}, n_jobs={self.n_jobs}' \
+            .format(self=self)
+
+
+def apply(phase_resources: PhaseResources):
+    """Applies the SimpleITK and BLAS threads of a phase to the current process, e.g. as pool initializer.
+
+    Args:
+        phase_resources (PhaseResources): The resources of the phase.
+    """
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(phase_resources.sitk_threads)
+    threadpoolctl.threadpool_limits(limits=phase_resources.blas_threads, user_api='blas')
+
+
+def get_available_cores() -> int:
+    """Gets the number of cores available to the current process.
+
+    Returns:
+        int: The number of cores.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class ExecutionResources:
+    """Represents the execution resources, which split a core budget per pipeline phase (see module documentation)."""
+
+    def __init__(self, cores: int = None, overrides: t.Dict[str, dict] = None):
+        """Initializes a new instance of the ExecutionResources class.
+
+        Args:
+            cores (int): The core budget. Defaults to the number of cores available to the process.
+            overrides (dict): The per-phase overrides of the default policy, where the key is a phase and the value a
+                dict of :class:`PhaseResources` fields and values, e.g. ``{'pre_process': {'processes': 8}}``.
+
+        Raises:
+            ValueError: If an override refers to an unknown phase or field.
+        """
+        self.cores = max(1, cores if cores is not None else get_available_cores())
+        self.overrides = overrides if overrides is not None else {}
+
+        for phase, fields in self.overrides.items():
+            if phase not in PHASES:
+                raise ValueError('Unknown phase {} (expected one of {})'.format(phase, ', '.join(PHASES)))
+            for field in fields:
+                if field not in PhaseResources.FIELDS:
+                    raise ValueError('Unknown resource {} (expected one of {})'.format(
+                        field, ', '.join(PhaseResources.FIELDS)))
+
+    def get(self, phase: str, no_tasks: int = None, multi_process: bool = True) -> PhaseResources:
+        """Gets the resources of a phase.
+
+        Args:
+            phase (str): The phase (one of :data:`PHASES`).
+            no_tasks (int): The number of tasks of a pool phase, which bounds the number of pool processes.
+            multi_process (bool): Whether a pool phase runs in a process pool or sequentially.
+
+        Returns:
+            PhaseResources: The resources. The threads of a pool phase are shared among the pool processes, also if
+            the number of processes is overridden.
+        """
+        overrides = self.overrides.get(phase, {})
+        if phase in _POOL_PHASES:
+            processes = max(1, overrides.get('processes', self.cores)) if multi_process else 1
+            if no_tasks is not None:
+                processes = min(processes, max(1, no_tasks))
+            threads = max(1, self.cores // processes)
+            resources = PhaseResources(processes, threads, threads, 1)
+        else:
+            resources = PhaseResources(1, self.cores, 1, self.cores)
+
+        for field, value in overrides.items():
+            if field != 'processes':
+                setattr(resources, field, max(1, int(value)))
+        return resources
+
+    @contextlib.contextmanager
+    def phase(self, phase: str, no_tasks: int = None, multi_process: bool = True) -> t.Iterator[PhaseResources]:
+        """Applies the SimpleITK and BLAS threads of a phase to the current process and restores them afterwards.
+
+        Args:
+            phase (str): The phase (one of :data:`PHASES`).
+            no_tasks (int): The number of tasks of a pool phase, which bounds the number of pool processes.
+            multi_process (bool): Whether a pool phase runs in a process pool or sequentially.
+
+        Yields:
+            PhaseResources: The resources.
+        """
+        resources = self.get(phase, no_tasks, multi_process)
+        sitk_threads = sitk.ProcessObject.GetGlobalDefaultNumberOfThreads()
+        sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(resources.sitk_threads)
+        try:
+            with threadpoolctl.threadpool_limits(limits=resources.blas_threads, user_api='blas'):
+                yield resources
+        finally:
+            sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(sitk_threads)
+
+    def __str__(self):
+        """Gets a printable string representation.
+
+        Returns:
+            str: String representation.
+        """
+        return 'ExecutionResources ({} cores):\n'.format(self.cores) + \
+            ''.join(' {:<12} {}\n'.format(phase, self.get(phase)) for phase in PHASES)
+
+
+def parse_overrides(specs: t.List[str]) -> t.Dict[str, dict]:
+    """Parses per-phase overrides of the form ``phase:field=value[,field=value...]``.
+
+    Args:
+        specs (list of str): The overrides, e.g. ``['pre_process:processes=8,sitk_threads=16', 'training:n_jobs=64']``.
+
+    Returns:
+        dict: The overrides (see :class:`ExecutionResources`).
+
+    Raises:
+        ValueError: If an override is malformed.
+    """
+    overrides = {}
+    for spec in specs or []:
+        phase, sep, assignments = spec.partition(':')
+        if not sep or not assignments:
+            raise ValueError('Malformed resource override {} (expected phase:field=value[,...])'.format(spec))
+        for assignment in assignments.split(','):
+            field, sep, value = assignment.partition('=')
+            if not sep or not value.strip().isdigit():
+                raise ValueError('Malformed resource override {} (expected phase:field=value[,...])'.format(spec))
+            overrides.setdefault(phase.strip(), {})[field.strip()] = int(value)
+    return overrides
+
+
+resources = ExecutionResources()  # the execution resources of the pipeline, see init
+
+
+def init(cores: int = None, overrides: t.Dict[str, dict] = None) -> ExecutionResources:
+    """Initializes the execution resources of the pipeline.
+
+    Args:
+        cores (int): The core budget. Defaults to the number of cores available to the process.
+        overrides (dict): The per-phase overrides of the default policy (see :class:`ExecutionResources`).
+
+    Returns:
+        ExecutionResources: The execution resources.
+    """
+    global resources
+    resources = ExecutionResources(cores, overrides)
+    return resources
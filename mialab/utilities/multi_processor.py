@@ -1,5 +1,11 @@
 """Module for the management of multi-process function calls."""
+import os
+import queue
+import shutil
+import tempfile
+import traceback
 import typing as t
+import uuid
 
 import numpy as np
 import SimpleITK as sitk
@@ -7,6 +13,115 @@ from pathos import multiprocessing as pmp
 import pymia.data.conversion as conversion
 
 import mialab.data.structure as structure
+import mialab.utilities.execution_resources as exec_res
+
+
+class SharedArrayDescriptor:
+    """Represents a numpy array in a file on shared memory, which is pickled instead of the array itself."""
+
+    def __init__(self, path: str, shape: tuple, dtype: str):
+        """Initializes a new instance of the SharedArrayDescriptor class.
+
+        Args:
+            path (str): The path to the .npy file holding the array.
+            shape (tuple): The array's shape.
+            dtype (str): The array's data type.
+        """
+        self.path = path
+        self.shape = shape
+        self.dtype = dtype
+
+
+class ArrayTransport:
+    """Represents the transport of numpy arrays between processes, where the arrays are pickled."""
+
+    def put(self, array: np.ndarray):
+        """Prepares an array for the transport to another process.
+
+        Args:
+            array (np.ndarray): The array.
+
+        Returns:
+            The object to pickle.
+        """
+        return array
+
+    def put_image(self, image: sitk.Image):
+        """Prepares the voxels of an image for the transport to another process.
+
+        Args:
+            image (sitk.Image): The image.
+
+        Returns:
+            The object to pickle.
+        """
+        return self.put(sitk.GetArrayFromImage(image))
+
+    def get(self, obj) -> np.ndarray:
+        """Recovers an array in the receiving process.
+
+        Args:
+            obj: The unpickled object returned by :meth:`put`.
+
+        Returns:
+            np.ndarray: The array.
+        """
+        return obj
+
+    def cleanup(self):
+        """Releases all resources of the transport."""
+        pass
+
+
+class SharedMemoryArrayTransport(ArrayTransport):
+    """Represents the transport of numpy arrays between processes through memory-mapped files on shared memory.
+
+    The sending process writes each array into a .npy file (in /dev/shm if available) and only a small
+    :class:`SharedArrayDescriptor` is pickled. The receiving process memory-maps the file and removes it, such that
+    the memory is freed as soon as the array is not used anymore.
+    """
+
+    def __init__(self, directory: str):
+        """Initializes a new instance of the SharedMemoryArrayTransport class.
+
+        Args:
+            directory (str): The directory for the array files.
+        """
+        self.directory = directory
+
+    @staticmethod
+    def create(shm_dir: str = '/dev/shm') -> 'SharedMemoryArrayTransport':
+        """Creates a transport with a new directory on shared memory.
+
+        Args:
+            shm_dir (str): The shared memory directory. The default temporary directory is used if it does not exist
+                or is not writable.
+
+        Returns:
+            SharedMemoryArrayTransport: The transport.
+        """
+        root_dir = shm_dir if os.path.isdir(shm_dir) and os.access(shm_dir, os.W_OK) else None
+        return SharedMemoryArrayTransport(tempfile.mkdtemp(prefix='mialab-', dir=root_dir))
+
+    def put(self, array: np.ndarray) -> SharedArrayDescriptor:
+        path = os.path.join(self.directory, uuid.uuid4().hex + '.npy')
+        shared_array = np.lib.format.open_memmap(path, mode='w+', dtype=array.dtype, shape=array.shape)
+        shared_array[...] = array
+        shared_array.flush()
+        del shared_array
+        return SharedArrayDescriptor(path, array.shape, array.dtype.str)
+
+    def put_image(self, image: sitk.Image) -> SharedArrayDescriptor:
+        # copy the voxels directly from the image buffer into the shared memory
+        return self.put(sitk.GetArrayViewFromImage(image))
+
+    def get(self, obj: SharedArrayDescriptor) -> np.ndarray:
+        array = np.load(obj.path, mmap_mode='c')
+        os.remove(obj.path)  # the mapping stays valid until the array is released
+        return array
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
 
 
 class PicklableAffineTransform:
@@ -41,9 +156,8 @@ class PicklableBrainImage:
         self.np_images = np_images
         self.image_properties = image_properties
         self.np_feature_images = {}
-        self.feature_matrix = None  # a tuple (features, labels),
-        # where the shape of features is (n, number_of_features) and the shape of labels is (n, 1)
-        # with n being the amount of voxels
+        self.feature_matrix = None  # a tuple (features, labels, indices, columns),
+        # see structure.BrainImage.feature_matrix
         self.pickable_transform = PicklableAffineTransform(transform)
 
 
@@ -51,28 +165,33 @@ class BrainImageToPicklableBridge:
     """A :class:`BrainImage <data.structure.BrainImage>` to :class:`PicklableBrainImage` bridge."""
 
     @staticmethod
-    def convert(brain_image: structure.BrainImage) -> PicklableBrainImage:
+    def convert(brain_image: structure.BrainImage, transport: ArrayTransport = None) -> PicklableBrainImage:
         """Converts a :class:`BrainImage <data.structure.BrainImage>` to :class:`PicklableBrainImage`.
 
         Args:
             brain_image (BrainImage): A brain image.
+            transport (ArrayTransport): The transport of the image arrays (arrays are pickled if None).
 
         Returns:
             PicklableBrainImage: The pickable brain image.
         """
+        if transport is None:
+            transport = ArrayTransport()
 
         np_images = {}
         for key, img in brain_image.images.items():
-            np_images[key] = sitk.GetArrayFromImage(img)
+            np_images[key] = transport.put_image(img)
         np_feature_images = {}
         for key, feat_img in brain_image.feature_images.items():
-            np_feature_images[key] = sitk.GetArrayFromImage(feat_img)
+            np_feature_images[key] = transport.put_image(feat_img)
 
         pickable_brain_image = PicklableBrainImage(brain_image.id_, brain_image.path, np_images,
                                                    brain_image.image_properties,
                                                    brain_image.transformation)
         pickable_brain_image.np_feature_images = np_feature_images
-        pickable_brain_image.feature_matrix = brain_image.feature_matrix
+        if brain_image.feature_matrix is not None:
+            pickable_brain_image.feature_matrix = tuple(transport.put(np.asarray(array))
+                                                        for array in brain_image.feature_matrix)
 
         return pickable_brain_image
 
@@ -81,35 +200,50 @@ class PicklableToBrainImageBridge:
     """A :class:`PicklableBrainImage` to :class:`BrainImage <data.structure.BrainImage>` bridge."""
 
     @staticmethod
-    def convert(picklable_brain_image: PicklableBrainImage) -> structure.BrainImage:
+    def convert(picklable_brain_image: PicklableBrainImage, transport: ArrayTransport = None) -> structure.BrainImage:
         """Converts a :class:`PicklableBrainImage` to :class:`BrainImage <data.structure.BrainImage>`.
 
         Args:
             picklable_brain_image (PicklableBrainImage): A pickable brain image.
+            transport (ArrayTransport): The transport of the image arrays (arrays are pickled if None).
 
         Returns:
             BrainImage: The brain image.
         """
+        if transport is None:
+            transport = ArrayTransport()
 
         images = {}
         for key, np_img in picklable_brain_image.np_images.items():
-            images[key] = conversion.NumpySimpleITKImageBridge.convert(np_img, picklable_brain_image.image_properties)
+            images[key] = conversion.NumpySimpleITKImageBridge.convert(transport.get(np_img),
+                                                                       picklable_brain_image.image_properties)
 
         feature_images = {}
         for key, np_feat_img in picklable_brain_image.np_feature_images.items():
-            feature_images[key] = conversion.NumpySimpleITKImageBridge.convert(np_feat_img,
+            feature_images[key] = conversion.NumpySimpleITKImageBridge.convert(transport.get(np_feat_img),
                                                                                picklable_brain_image.image_properties)
 
         transform = picklable_brain_image.pickable_transform.get_sitk_transformation()
 
         brain_image = structure.BrainImage(picklable_brain_image.id_, picklable_brain_image.path, images, transform)
-        brain_image.feature_matrix = picklable_brain_image.feature_matrix
+        brain_image.image_properties = picklable_brain_image.image_properties
+        brain_image.feature_images = feature_images
+        if picklable_brain_image.feature_matrix is not None:
+            brain_image.feature_matrix = tuple(transport.get(array) for array in picklable_brain_image.feature_matrix)
         return brain_image
 
 
 class DefaultPickleHelper:
     """Default pickle helper class"""
 
+    def __init__(self, transport: ArrayTransport = None):
+        """Initializes a new instance of the DefaultPickleHelper class.
+
+        Args:
+            transport (ArrayTransport): The transport of numpy arrays (arrays are pickled if None).
+        """
+        self.transport = ArrayTransport() if transport is None else transport
+
     def make_params_picklable(self, params):
         """Default function called to ensure that all parameters can be pickled before transferred to the new process.
         To be overwritten if non-picklable parameters are contained in ``params``.
@@ -175,7 +309,7 @@ class PreProcessingPickleHelper(DefaultPickleHelper):
             PicklableBrainImage: The modified pre-processing return values.
         """
 
-        return BrainImageToPicklableBridge.convert(ret_val)
+        return BrainImageToPicklableBridge.convert(ret_val, self.transport)
 
     def recover_return_value(self, ret_val: PicklableBrainImage) -> structure.BrainImage:
         """Recovers (from the pickle state) the original pre-processing return values.
@@ -186,7 +320,7 @@ class PreProcessingPickleHelper(DefaultPickleHelper):
         Returns:
             BrainImage: The recovered pre-processing return values.
         """
-        return PicklableToBrainImageBridge.convert(ret_val)
+        return PicklableToBrainImageBridge.convert(ret_val, self.transport)
 
 
 class PostProcessingPickleHelper(DefaultPickleHelper):
@@ -202,9 +336,9 @@ class PostProcessingPickleHelper(DefaultPickleHelper):
             tuple: The modified post-processing parameters.
         """
         brain_img, segmentation, probability, fn_kwargs = params
-        picklable_brain_image = BrainImageToPicklableBridge.convert(brain_img)
-        np_segmentation, _ = conversion.SimpleITKNumpyImageBridge.convert(segmentation)
-        np_probability, _ = conversion.SimpleITKNumpyImageBridge.convert(probability)
+        picklable_brain_image = BrainImageToPicklableBridge.convert(brain_img, self.transport)
+        np_segmentation = self.transport.put_image(segmentation)
+        np_probability = self.transport.put_image(probability)
         return picklable_brain_image, np_segmentation, np_probability, fn_kwargs
 
     def recover_params(self, params: t.Tuple[PicklableBrainImage, np.ndarray, np.ndarray, dict]):
@@ -218,12 +352,14 @@ class PostProcessingPickleHelper(DefaultPickleHelper):
 
         """
         picklable_img, np_segmentation, np_probability, fn_kwargs = params
-        img = PicklableToBrainImageBridge.convert(picklable_img)
-        segmentation = conversion.NumpySimpleITKImageBridge.convert(np_segmentation, picklable_img.image_properties)
-        probability = conversion.NumpySimpleITKImageBridge.convert(np_probability, picklable_img.image_properties)
+        img = PicklableToBrainImageBridge.convert(picklable_img, self.transport)
+        segmentation = conversion.NumpySimpleITKImageBridge.convert(self.transport.get(np_segmentation),
+                                                                    picklable_img.image_properties)
+        probability = conversion.NumpySimpleITKImageBridge.convert(self.transport.get(np_probability),
+                                                                   picklable_img.image_properties)
         return img, segmentation, probability, fn_kwargs
 
-    def make_return_value_picklable(self, ret_val: sitk.Image) -> t.Tuple[np.ndarray, conversion.ImageProperties]:
+    def make_return_value_picklable(self, ret_val: sitk.Image) -> t.Tuple[t.Any, conversion.ImageProperties]:
         """Ensures that all post-processing return values ``ret_val`` can be pickled before transferring back to
         the original process.
 
@@ -233,10 +369,9 @@ class PostProcessingPickleHelper(DefaultPickleHelper):
         Returns:
             The modified post-processing return values.
         """
-        np_img, image_properties = conversion.SimpleITKNumpyImageBridge.convert(ret_val)
-        return np_img, image_properties
+        return self.transport.put_image(ret_val), conversion.ImageProperties(ret_val)
 
-    def recover_return_value(self, ret_val: t.Tuple[np.ndarray, conversion.ImageProperties]) -> sitk.Image:
+    def recover_return_value(self, ret_val: t.Tuple[t.Any, conversion.ImageProperties]) -> sitk.Image:
         """Recovers (from the pickle state) the original post-processing return values.
 
         Args:
@@ -246,14 +381,39 @@ class PostProcessingPickleHelper(DefaultPickleHelper):
             sitk.Image: The recovered post-processing return values.
         """
         np_img, image_properties = ret_val
-        return conversion.NumpySimpleITKImageBridge.convert(np_img, image_properties)
+        return conversion.NumpySimpleITKImageBridge.convert(self.transport.get(np_img), image_properties)
+
+
+class TaskError:
+    """Represents the error of a task, which has been captured instead of raised."""
+
+    def __init__(self, index: int, exception: BaseException, traceback_: str = ''):
+        """Initializes a new instance of the TaskError class.
+
+        Args:
+            index (int): The index of the task's parameters in the parameter list.
+            exception (BaseException): The exception raised by the task.
+            traceback_ (str): The formatted traceback of the exception.
+        """
+        self.index = index
+        self.exception = exception
+        self.traceback = traceback_
+
+    def __str__(self):
+        """Gets a printable string representation.
+
+        Returns:
+            str: String representation.
+        """
+        return 'TaskError (task {self.index}): {self.exception!r}\n{self.traceback}'.format(self=self)
 
 
 class MultiProcessor:
     """Class managing multiprocessing"""
 
     @staticmethod
-    def run(fn: callable, param_list: iter, fn_kwargs: dict = None, pickle_helper_cls: type = DefaultPickleHelper):
+    def run(fn: callable, param_list: iter, fn_kwargs: dict = None, pickle_helper_cls: type = DefaultPickleHelper,
+            shared_memory: bool = False):
         """ Executes the function ``fn`` in parallel (different processes) for each parameter in the parameter list.
 
         Args:
@@ -261,32 +421,127 @@ class MultiProcessor:
             param_list (List[tuple]): List containing the parameters for each ``fn`` call.
             fn_kwargs (dict): kwargs for the ``fn`` function call.
             pickle_helper_cls: Class responsible for the pickling of the parameters
+            shared_memory (bool): Whether the pickle helper transports arrays through shared memory
+                (see :class:`SharedMemoryArrayTransport`) instead of pickling them.
 
         Returns:
             list: A list of all return values of the ``fn`` calls
         """
+        return [ret_val for _, ret_val in MultiProcessor.run_iter(fn, param_list, fn_kwargs, pickle_helper_cls,
+                                                                   shared_memory)]
+
+    @staticmethod
+    def run_iter(fn: callable, param_list: iter, fn_kwargs: dict = None, pickle_helper_cls: type = DefaultPickleHelper,
+                 shared_memory: bool = False, max_in_flight: int = None, ordered: bool = True,
+                 capture_errors: bool = False,
+                 phase_resources: exec_res.PhaseResources = None) -> t.Iterator[t.Tuple[int, t.Any]]:
+        """ Executes the function ``fn`` in parallel (different processes) for each parameter in the parameter list
+        and yields the return values as they arrive.
+
+        At most ``max_in_flight`` parameters are converted and submitted before their return values have been yielded,
+        such that the memory stays bounded independent of the length of the parameter list.
+
+        Args:
+            fn (callable): Function to be executed in another process.
+            param_list (Iterable[tuple]): Iterable containing the parameters for each ``fn`` call.
+            fn_kwargs (dict): kwargs for the ``fn`` function call.
+            pickle_helper_cls: Class responsible for the pickling of the parameters
+            shared_memory (bool): Whether the pickle helper transports arrays through shared memory
+                (see :class:`SharedMemoryArrayTransport`) instead of pickling them.
+            max_in_flight (int): The maximum number of submitted tasks, whose return values have not been yielded yet.
+                Defaults to twice the number of processes.
+            ordered (bool): Whether to yield the return values in the order of the parameter list or as they arrive.
+            capture_errors (bool): Whether to yield a :class:`TaskError` for a failed ``fn`` call instead of raising.
+            phase_resources (PhaseResources): The number of pool processes and the SimpleITK and BLAS threads of each
+                process (see :mod:`mialab.utilities.execution_resources`). Defaults to one process per core with the
+                library defaults.
+
+        Yields:
+            tuple: The index of the parameters in the parameter list and the return value of the ``fn`` call.
+        """
         if fn_kwargs is None:
             fn_kwargs = {}
 
-        helper = pickle_helper_cls()
-        # add additional_params
-        param_list = ((*p, fn_kwargs) for p in param_list)
-        param_list = (helper.make_params_picklable(params) for params in param_list)
-
-        with pmp.Pool() as p:
-            ret_vals = p.starmap(MultiProcessor._wrap_fn(fn, pickle_helper_cls), param_list)
-        ret_vals = [helper.recover_return_value(ret_val) for ret_val in ret_vals]
-        return ret_vals
+        transport = SharedMemoryArrayTransport.create() if shared_memory else ArrayTransport()
+        try:
+            helper = pickle_helper_cls(transport)
+            wrapped_fn = MultiProcessor._wrap_fn(fn, pickle_helper_cls, transport, capture_errors)
+            param_iter = enumerate(param_list)
+            done = queue.Queue()  # filled by the result handler thread of the pool
+
+            if phase_resources is None:
+                processes = exec_res.get_available_cores()
+                pool_args = (processes,)
+            else:
+                processes = phase_resources.processes
+                pool_args = (processes, exec_res.apply, (phase_resources,))
+            if max_in_flight is None:
+                max_in_flight = 2 * processes
+            max_in_flight = max(1, max_in_flight)
+
+            with pmp.Pool(*pool_args) as p:
+
+                no_in_flight = 0
+                exhausted = False
+                arrived = {}  # return values waiting for their predecessors if ordered
+                next_index = 0
+                while True:
+                    while not exhausted and no_in_flight < max_in_flight:
+                        try:
+                            index, params = next(param_iter)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        # add additional_params
+                        params = helper.make_params_picklable((*params, fn_kwargs))
+                        p.apply_async(wrapped_fn, params,
+                                      callback=lambda ret_val, i=index: done.put((i, ret_val, None)),
+                                      error_callback=lambda error, i=index: done.put((i, None, error)))
+                        no_in_flight += 1
+
+                    if no_in_flight == 0:
+                        break
+
+                    index, ret_val, error = done.get()
+                    if error is not None:
+                        if not capture_errors:
+                            raise error
+                        # the traceback includes the worker's traceback, which the pool chains as cause
+                        ret_val = TaskError(index, error, ''.join(
+                            traceback.format_exception(type(error), error, error.__traceback__)))
+                    elif isinstance(ret_val, TaskError):
+                        ret_val.index = index
+                    else:
+                        ret_val = helper.recover_return_value(ret_val)
+
+                    if not ordered:
+                        no_in_flight -= 1
+                        yield index, ret_val
+                        continue
+
+                    arrived[index] = ret_val
+                    while next_index in arrived:
+                        no_in_flight -= 1
+                        yield next_index, arrived.pop(next_index)
+                        next_index += 1
+        finally:
+            transport.cleanup()
 
     @staticmethod
-    def _wrap_fn(fn, pickle_helper_cls):
+    def _wrap_fn(fn, pickle_helper_cls, transport, capture_errors=False):
         def wrapped_fn(*params):
-            # create instance due to possible race condition (not sure if really possible)
-            helper = pickle_helper_cls()
-            params = helper.recover_params(params)
-            params, shared_params = params[:-1], params[-1]
-            ret_val = fn(*params, **shared_params)
-            ret_val = helper.make_return_value_picklable(ret_val)
+            try:
+                # create instance due to possible race condition (not sure if really possible)
+                helper = pickle_helper_cls(transport)
+                params = helper.recover_params(params)
+                params, shared_params = params[:-1], params[-1]
+                ret_val = fn(*params, **shared_params)
+                ret_val = helper.make_return_value_picklable(ret_val)
+            except Exception as e:
+                if not capture_errors:
+                    raise
+                # the index is set by the parent process
+                return TaskError(-1, e, traceback.format_exc())
             return ret_val
 
         return wrapped_fn
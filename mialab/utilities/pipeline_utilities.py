@@ -1,7 +1,9 @@
 """This module contains utility classes and functions."""
 import enum
 import os
+import sys
 import typing as t
+import zlib
 
 import numpy as np
 import pymia.data.conversion as conversion
@@ -14,6 +16,9 @@ import mialab.data.structure as structure
 import mialab.filtering.feature_extraction as fltr_feat
 import mialab.filtering.postprocessing as fltr_postp
 import mialab.filtering.preprocessing as fltr_prep
+import mialab.utilities.atlas_registry as atlas_registry
+import mialab.utilities.cache as cache_
+import mialab.utilities.execution_resources as exec_res
 import mialab.utilities.multi_processor as mproc
 
 import matplotlib.pyplot as plt 
@@ -22,26 +27,54 @@ import traceback
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-atlas_t1 = sitk.Image()
-atlas_t2 = sitk.Image()
+atlas_t1 = None  # the reference to the T1 atlas image in the atlas registry, see load_atlas_images
+atlas_t2 = None  # the reference to the T2 atlas image in the atlas registry, see load_atlas_images
+atlas_files = []  # the atlas image paths, which are part of the pre-processing cache key
+stage_cache = None  # the cache of the pre-processing filter stages, see init_stage_cache
 
 
-def load_atlas_images(directory: str):
-    """Loads the T1 and T2 atlas images.
+def load_atlas_images(directory: str, copy_directory: str = atlas_registry.DEFAULT_DIRECTORY):
+    """Registers the T1 and T2 atlas images.
+
+    The filter parameters reference the atlas images by :data:`atlas_t1` and :data:`atlas_t2` such that each (worker)
+    process loads the images only once (see :mod:`mialab.utilities.atlas_registry`).
 
     Args:
         directory (str): The atlas data directory.
+        copy_directory (str): The directory of the uncompressed atlas copies.
     """
 
     global atlas_t1
     global atlas_t2
+    global atlas_files
     print("[Load_atlas]: ",directory)
-    atlas_t1 = sitk.ReadImage(os.path.join(directory, 'mni_icbm152_t1_tal_nlin_sym_09a_mask.nii.gz'))
-    atlas_t2 = sitk.ReadImage(os.path.join(directory, 'mni_icbm152_t2_tal_nlin_sym_09a.nii.gz'))
-    if not conversion.ImageProperties(atlas_t1) == conversion.ImageProperties(atlas_t2):
+    atlas_files = [os.path.join(directory, 'mni_icbm152_t1_tal_nlin_sym_09a_mask.nii.gz'),
+                   os.path.join(directory, 'mni_icbm152_t2_tal_nlin_sym_09a.nii.gz')]
+    atlas_t1 = atlas_registry.register('t1', atlas_files[0], copy_directory)
+    atlas_t2 = atlas_registry.register('t2', atlas_files[1], copy_directory)
+    if not conversion.ImageProperties(atlas_t1.get_image()) == conversion.ImageProperties(atlas_t2.get_image()):
         raise ValueError('T1w and T2w atlas images have not the same image properties')
 
 
+def init_stage_cache(directory: str, max_size: int = None) -> cache_.FilterStageCache:
+    """Initializes the cache of the pre-processing filter stages.
+
+    The filter pipelines in :func:`pre_process` memoize the output of each stage in the cache, such that a parameter
+    sweep over the last stages re-uses, e.g., the registered and skull-stripped images. Note that the hit and miss
+    counters are kept per process.
+
+    Args:
+        directory (str): The cache directory.
+        max_size (int): The maximum size of the cache in bytes (None means unbounded).
+
+    Returns:
+        cache_.FilterStageCache: The cache.
+    """
+    global stage_cache
+    stage_cache = cache_.FilterStageCache(directory, max_size)
+    return stage_cache
+
+
 class FeatureImageTypes(enum.Enum):
     """Represents the feature image types."""
 
@@ -50,6 +83,158 @@ class FeatureImageTypes(enum.Enum):
     T1w_GRADIENT_INTENSITY = 3
     T2w_INTENSITY = 4
     T2w_GRADIENT_INTENSITY = 5
+    T1w_TEXTURE = 6
+    T2w_TEXTURE = 7
+    FILTER_BANK = 8
+    T1w_GLCM = 9
+    T2w_GLCM = 10
+
+
+class FeatureDefinition:
+    """Represents the declaration of a feature, i.e. how to select and compute it and the columns it provides."""
+
+    def __init__(self, param: str, inputs: tuple, column_names: tuple, dtype: type, compute: callable,
+                 compute_at: callable = None):
+        """Initializes a new instance of the FeatureDefinition class.
+
+        Args:
+            param (str): The key of the pre-processing parameters, which selects the feature.
+            inputs (tuple of structure.BrainImageTypes): The images the feature is computed from.
+            column_names (tuple of str): The names of the columns of the feature in the feature matrix.
+            dtype (type): The data type of the computed feature values.
+            compute (callable): The function ``compute(img, *inputs) -> sitk.Image`` computing the feature image, with
+                one component per column, from the brain image and its input images, or None if the feature is
+                always computed by ``compute_at``.
+            compute_at (callable): The optional function ``compute_at(img, indices, out, *inputs)`` computing the
+                columns at the flat voxel indices only and writing them into ``out``, the feature's columns of the
+                feature matrix (used in sparse mode).
+        """
+        self.param = param
+        self.inputs = inputs
+        self.column_names = column_names
+        self.dtype = dtype
+        self.compute = compute
+        self.compute_at = compute_at
+
+    @property
+    def no_columns(self) -> int:
+        """int: The number of columns of the feature."""
+        return len(self.column_names)
+
+
+def _get_atlas_coordinates_params(img: structure.BrainImage) -> fltr_feat.AtlasCoordinatesParameters:
+    """Gets the atlas coordinates parameters, such that the coordinates of a cropped image equal the uncropped ones."""
+    if isinstance(img.image_properties, structure.CroppedImageProperties):
+        return fltr_feat.AtlasCoordinatesParameters(img.image_properties.uncropped.origin,
+                                                    img.image_properties.offset)
+    return None
+
+
+def _compute_atlas_coordinates(img: structure.BrainImage, image: sitk.Image) -> sitk.Image:
+    """Computes the atlas coordinates."""
+    return fltr_feat.AtlasCoordinates().execute(image, _get_atlas_coordinates_params(img))
+
+
+def _compute_atlas_coordinates_at(img: structure.BrainImage, indices: np.ndarray, out: np.ndarray, image: sitk.Image):
+    """Computes the atlas coordinates of voxels."""
+    out[...] = fltr_feat.AtlasCoordinates().execute_at(image, indices, _get_atlas_coordinates_params(img))
+
+
+def _compute_intensity(img: structure.BrainImage, image: sitk.Image) -> sitk.Image:
+    """Computes the intensity feature, i.e. the image itself."""
+    return image
+
+
+def _compute_gradient_intensity(img: structure.BrainImage, image: sitk.Image) -> sitk.Image:
+    """Computes the gradient magnitude."""
+    return sitk.GradientMagnitude(image)
+
+
+def _compute_texture(img: structure.BrainImage, image: sitk.Image) -> sitk.Image:
+    """Computes the first-order texture features of the 3x3x3 neighborhoods."""
+    return fltr_feat.NeighborhoodFeatureExtractor(kernel=(3, 3, 3)).execute(image)
+
+
+def _compute_texture_at(img: structure.BrainImage, indices: np.ndarray, out: np.ndarray, image: sitk.Image):
+    """Computes the first-order texture features of the 3x3x3 neighborhoods of voxels."""
+    out[...] = fltr_feat.NeighborhoodFeatureExtractor(kernel=(3, 3, 3)).execute_at(image, indices)
+
+
+def _compute_glcm(img: structure.BrainImage, image: sitk.Image) -> sitk.Image:
+    """Computes the GLCM texture features of the 5x5x5 neighborhoods."""
+    return fltr_feat.CooccurrenceTextureFeatureExtractor().execute(image)
+
+
+def _compute_glcm_at(img: structure.BrainImage, indices: np.ndarray, out: np.ndarray, image: sitk.Image):
+    """Computes the GLCM texture features of the 5x5x5 neighborhoods of voxels."""
+    out[...] = fltr_feat.CooccurrenceTextureFeatureExtractor().execute_at(image, indices)
+
+
+def _compute_filter_bank_at(img: structure.BrainImage, indices: np.ndarray, out: np.ndarray, image_t1: sitk.Image,
+                            image_t2: sitk.Image):
+    """Computes the filter bank features of the T1w and T2w image of voxels and reports the time per scale."""
+    filter_bank = fltr_feat.FilterBankFeatureExtractor(FILTER_BANK_SIGMAS)
+    image = sitk.Compose(sitk.Cast(image_t1, sitk.sitkFloat32), sitk.Cast(image_t2, sitk.sitkFloat32))
+    filter_bank.execute_at(image, indices, out)
+    for sigma, time in zip(filter_bank.sigmas, filter_bank.times):
+        print(' Filter bank sigma {} mm: {:.2f} s'.format(sigma, time))
+
+
+FILTER_BANK_SIGMAS = (1.0, 2.0)  # the scales (mm) of the filter bank feature
+
+
+# the features by type, in the order of the feature matrix columns
+FEATURE_DEFINITIONS = {
+    FeatureImageTypes.ATLAS_COORD: FeatureDefinition(
+        'coordinates_feature', (structure.BrainImageTypes.T1w,),
+        ('atlas_coord_x', 'atlas_coord_y', 'atlas_coord_z'), np.float32, _compute_atlas_coordinates,
+        _compute_atlas_coordinates_at),
+    FeatureImageTypes.T1w_INTENSITY: FeatureDefinition(
+        'intensity_feature', (structure.BrainImageTypes.T1w,),
+        ('T1w_intensity',), np.float32, _compute_intensity),
+    FeatureImageTypes.T1w_GRADIENT_INTENSITY: FeatureDefinition(
+        'gradient_intensity_feature', (structure.BrainImageTypes.T1w,),
+        ('T1w_gradient_intensity',), np.float32, _compute_gradient_intensity),
+    FeatureImageTypes.T2w_INTENSITY: FeatureDefinition(
+        't2_intensity_feature', (structure.BrainImageTypes.T2w,),
+        ('T2w_intensity',), np.float32, _compute_intensity),
+    FeatureImageTypes.T2w_GRADIENT_INTENSITY: FeatureDefinition(
+        't2_gradient_intensity_feature', (structure.BrainImageTypes.T2w,),
+        ('T2w_gradient_intensity',), np.float32, _compute_gradient_intensity),
+    FeatureImageTypes.T1w_TEXTURE: FeatureDefinition(
+        'texture_feature', (structure.BrainImageTypes.T1w,),
+        tuple('T1w_texture_' + name for name in fltr_feat.FIRST_ORDER_TEXTURE_FEATURE_NAMES), np.float32,
+        _compute_texture, _compute_texture_at),
+    FeatureImageTypes.T2w_TEXTURE: FeatureDefinition(
+        't2_texture_feature', (structure.BrainImageTypes.T2w,),
+        tuple('T2w_texture_' + name for name in fltr_feat.FIRST_ORDER_TEXTURE_FEATURE_NAMES), np.float32,
+        _compute_texture, _compute_texture_at),
+    FeatureImageTypes.FILTER_BANK: FeatureDefinition(
+        'filter_bank_feature', (structure.BrainImageTypes.T1w, structure.BrainImageTypes.T2w),
+        tuple(fltr_feat.FilterBankFeatureExtractor(FILTER_BANK_SIGMAS).get_column_names(('T1w', 'T2w'))), np.float32,
+        None, _compute_filter_bank_at),
+    FeatureImageTypes.T1w_GLCM: FeatureDefinition(
+        'glcm_feature', (structure.BrainImageTypes.T1w,),
+        tuple('T1w_glcm_' + name for name in fltr_feat.CooccurrenceTextureFeatureExtractor.FEATURE_NAMES), np.float32,
+        _compute_glcm, _compute_glcm_at),
+    FeatureImageTypes.T2w_GLCM: FeatureDefinition(
+        't2_glcm_feature', (structure.BrainImageTypes.T2w,),
+        tuple('T2w_glcm_' + name for name in fltr_feat.CooccurrenceTextureFeatureExtractor.FEATURE_NAMES), np.float32,
+        _compute_glcm, _compute_glcm_at),
+}
+
+
+def get_feature_columns(**kwargs) -> t.List[str]:
+    """Gets the column names of the feature matrix, which the pre-processing parameters select.
+
+    Args:
+        **kwargs: The pre-processing parameters (see :func:`pre_process`).
+
+    Returns:
+        list of str: The column names in the order of the feature matrix columns.
+    """
+    return [name for definition in FEATURE_DEFINITIONS.values() if kwargs.get(definition.param, False)
+            for name in definition.column_names]
 
 
 class FeatureExtractor:
@@ -58,51 +243,67 @@ class FeatureExtractor:
     def __init__(self, img: structure.BrainImage, **kwargs):
         """Initializes a new instance of the FeatureExtractor class.
 
+        The features are declared by :data:`FEATURE_DEFINITIONS` and selected by their parameter in ``kwargs``, e.g.
+        ``coordinates_feature=True``. Only the selected features are computed.
+
+        In sparse mode (``sparse_features``), the features are only extracted at the voxels of the feature matrix,
+        i.e. the voxels of the randomized training mask in training and of the brain mask in testing. Expensive
+        features, like the texture, are then evaluated at these voxels only instead of over the full image. The
+        randomized training mask of a subject is seeded by ``training_mask_seed`` and the subject's identifier.
+
         Args:
             img (structure.BrainImage): The image to extract features from.
         """
         self.img = img
         self.training = kwargs.get('training', True)
-        self.coordinates_feature = kwargs.get('coordinates_feature', False)
-        self.intensity_feature = kwargs.get('intensity_feature', False)
-        self.gradient_intensity_feature = kwargs.get('gradient_intensity_feature', False)
+        self.sparse_features = kwargs.get('sparse_features', False)
+        self.features = [id_ for id_, definition in FEATURE_DEFINITIONS.items() if kwargs.get(definition.param, False)]
+        self.seed = kwargs.get('training_mask_seed', None)
 
     def execute(self) -> structure.BrainImage:
         """Extracts features from an image.
 
         Returns:
             structure.BrainImage: The image with extracted features.
-        """
-        try:
-            self.intensity_feature,
-            self.gradient_intensity_feature,
-            self.coordinates_feature = self._extract_features(self.img.images[structure.BrainImageTypes.T2w])
-        except Exception as e:
-            print("[pipeline_utilities.execute]: ",e,'\n')
-            traceback.print_exc()
 
+        Raises:
+            ValueError: If a feature does not provide its declared number of columns.
+        """
+        indices = self._get_indices()
+        if indices is None:
+            indices = np.arange(np.prod(self.img.images[structure.BrainImageTypes.T1w].GetSize()))
+
+        # preallocate the feature matrix by the declared columns, into which each feature is written directly
+        no_columns = [FEATURE_DEFINITIONS[id_].no_columns for id_ in self.features]
+        data = np.empty((len(indices), sum(no_columns)), np.float32)
+
+        column = 0
+        for id_, no_columns_ in zip(self.features, no_columns):
+            definition = FEATURE_DEFINITIONS[id_]
+            inputs = [self.img.images[image_type] for image_type in definition.inputs]
+            out = data[:, column:column + no_columns_]
+            if definition.compute_at is not None and (self.sparse_features or definition.compute is None):
+                definition.compute_at(self.img, indices, out, *inputs)
+            else:
+                self.img.feature_images[id_] = definition.compute(self.img, *inputs)
+                if self.img.feature_images[id_].GetNumberOfComponentsPerPixel() != no_columns_:
+                    raise ValueError('Feature {} has {} instead of {} columns'.format(
+                        id_.name, self.img.feature_images[id_].GetNumberOfComponentsPerPixel(), no_columns_))
+                self._gather(self.img.feature_images[id_], indices, out)
+            column += no_columns_
 
-        if self.coordinates_feature:
-            atlas_coordinates = fltr_feat.AtlasCoordinates()
-            self.img.feature_images[FeatureImageTypes.ATLAS_COORD] = \
-                atlas_coordinates.execute(self.img.images[structure.BrainImageTypes.T1w])
-
-        if self.intensity_feature:
-            self.img.feature_images[FeatureImageTypes.T1w_INTENSITY] = self.img.images[structure.BrainImageTypes.T1w]
-
-        if self.gradient_intensity_feature:
-            # compute gradient magnitude images
-            self.img.feature_images[FeatureImageTypes.T1w_GRADIENT_INTENSITY] = \
-                sitk.GradientMagnitude(self.img.images[structure.BrainImageTypes.T1w])
-
-        self._generate_feature_matrix()
+        self._generate_feature_matrix(indices, data)
 
         return self.img
 
-    def _generate_feature_matrix(self):
-        """Generates a feature matrix."""
+    def _get_indices(self):
+        """Gets the flat indices of the voxels of the feature matrix in the image array (z, y, x).
+
+        Returns:
+            np.ndarray: The indices in ascending order or None to include all voxels.
+        """
 
-        mask = None
+        indices = None
         if self.training:
             # generate a randomized mask where 1 represents voxels used for training
             # the mask needs to be binary, where the value 1 is considered as a voxel which is to be loaded
@@ -118,86 +319,63 @@ class FeatureExtractor:
             # mask_background = self.img.images[structure.BrainImageTypes.BrainMask]
             # and use background_mask=mask_background in get_mask()
 
+            # the mask of a subject is reproducible for a seed independent of the order of the subjects
+            seed = None
+            if self.seed is not None:
+                seed = np.random.SeedSequence([self.seed, zlib.crc32(self.img.id_.encode('utf-8'))])
 
-            mask = fltr_feat.RandomizedTrainingMaskGenerator.get_mask(
+            indices = fltr_feat.RandomizedTrainingMaskGenerator.get_mask(
                 self.img.images[structure.BrainImageTypes.GroundTruth],
                 [0, 1, 2, 3, 4, 5],
-                [0.0003, 0.004, 0.003, 0.04, 0.04, 0.02])
+                [0.0003, 0.004, 0.003, 0.04, 0.04, 0.02],
+                seed=seed,
+                return_indices=True)
+        elif self.sparse_features:
+            # restrict the testing to the voxels of the brain
+            indices = np.flatnonzero(sitk.GetArrayViewFromImage(self.img.images[structure.BrainImageTypes.BrainMask]))
 
-            # convert the mask to a logical array where value 1 is False and value 0 is True
-            mask = sitk.GetArrayFromImage(mask)
+        return indices
 
-            mask = np.logical_not(mask)
-
-        # generate features
-        data = np.concatenate(
-            [self._image_as_numpy_array(image, mask) for id_, image in self.img.feature_images.items()],
-            axis=1)
-
-        # generate labels (note that we assume to have a ground truth even for testing)
-        labels = self._image_as_numpy_array(self.img.images[structure.BrainImageTypes.GroundTruth], mask)
-
-        self.img.feature_matrix = (data.astype(np.float32), labels.astype(np.int16))
-
-    def _extract_features(self, img: structure.BrainImage):
-        """Creates a matrix on [x,y,z] axis with value of the coordinates.
+    def _generate_feature_matrix(self, indices: np.ndarray, data: np.ndarray):
+        """Generates a feature matrix.
 
         Args:
-            img: The image to extract features from 
-            intensity_feature
-            gradient_intensity_feature
-            coordinates_feature
-
+            indices (np.ndarray): The flat indices of the voxels of the feature matrix in ascending order.
+            data (np.ndarray): The features (float32) with shape (n, number of columns) in the order of the features.
         """
-        intensity_feature = sitk.GetArrayFromImage(img)
 
-        gradient_filter = sitk.GradientMagnitudeImageFilter()
-        gradient_intensity_feature = gradient_filter.Execute(img)
+        # generate labels (note that we assume to have a ground truth even for testing)
+        labels = np.empty((len(indices), 1), np.int16)
+        self._gather(self.img.images[structure.BrainImageTypes.GroundTruth], indices, labels)
 
-        size = img.GetSize()
-        x = np.arange(size[0])
-        y = np.arange(size[1])
-        z = np.arange(size[2])
-        xx, yy, zz = np.meshgrid(x, y, z, indexing='ij')
-        coordinates = np.stack((xx, yy, zz), axis=-1)
-        
-        coordinates_feature = sitk.GetImageFromArray(coordinates)
+        # the manifest of the column names
+        columns = np.array([name for id_ in self.features for name in FEATURE_DEFINITIONS[id_].column_names])
 
-        return intensity_feature,gradient_intensity_feature,coordinates_feature
+        self.img.feature_matrix = (data, labels, indices, columns)
 
     @staticmethod
-    def _image_as_numpy_array(image: sitk.Image, mask: np.ndarray = None):
-        """Gets an image as numpy array where each row is a voxel and each column is a feature.
+    def _gather(image: sitk.Image, indices: np.ndarray, out: np.ndarray):
+        """Gathers voxels of an image into the columns of an array, where each row is a voxel.
 
         Args:
             image (sitk.Image): The image.
-            mask (np.ndarray): A mask defining which voxels to return. True is background, False is a masked voxel.
-
-        Returns:
-            np.ndarray: An array where each row is a voxel and each column is a feature.
+            indices (np.ndarray): The flat indices of the voxels in ascending order.
+            out (np.ndarray): The array with shape (n, number of components) to write the voxels to.
         """
 
         number_of_components = image.GetNumberOfComponentsPerPixel()  # the number of features for this image
-        no_voxels = np.prod(image.GetSize())
-        image = sitk.GetArrayFromImage(image)
+        image_array = sitk.GetArrayViewFromImage(image).reshape((-1, number_of_components))
 
-        if mask is not None:
-            no_voxels = np.size(mask) - np.count_nonzero(mask)
+        if len(indices) == image_array.shape[0]:
+            out[...] = image_array  # all voxels (the indices are unique)
+        else:
+            out[...] = image_array[indices]
 
-            if number_of_components == 1:
-                masked_image = np.ma.masked_array(image, mask=mask)
-            else:
-                # image is a vector image, make a vector mask
-                vector_mask = np.expand_dims(mask, axis=3)  # shape is now (z, x, y, 1)
-                
-
-                vector_mask = np.repeat(vector_mask, number_of_components,
-                                        axis=3)  # shape is now (z, x, y, number_of_components)
-                masked_image = np.ma.masked_array(image, mask=vector_mask)
-
-            image = masked_image[~masked_image.mask]
-
-        return image.reshape((no_voxels, number_of_components))
+def _get_registration_filter(fused_resampling: bool, new_spacing: tuple, method: str) -> fltr.Filter:
+    """Gets the registration filter, which optionally resamples to a new spacing in the same interpolation."""
+    if fused_resampling:
+        return fltr_prep.ImageRegistrationResampling(new_spacing, method)
+    return fltr_prep.ImageRegistration()
 
 
 def pre_process(id_: str, paths: dict, **kwargs) -> structure.BrainImage:
@@ -209,6 +387,14 @@ def pre_process(id_: str, paths: dict, **kwargs) -> structure.BrainImage:
     - Pre-processing
     - Feature extraction
 
+    If ``fused_resampling_pre`` is set in addition to ``registration_pre`` and ``resampling_pre``, the images are
+    resampled to the new spacing during the registration, i.e. before the skull stripping and denoising.
+    If ``cropping_pre`` is set, all images are cropped to the padded bounding box of the brain mask after the skull
+    stripping and denoising. The padding includes half of the Wiener window if ``wiener_denoising_pre`` is set, such
+    that the crop keeps all voxels the denoising spreads intensities to. The image properties are then
+    :class:`CroppedImageProperties <mialab.data.structure.CroppedImageProperties>` and :func:`uncrop` restores images
+    to the uncropped grid.
+
     Args:
         id_ (str): An image identifier.
         paths (dict): A dict, where the keys are an image identifier of type structure.BrainImageTypes
@@ -227,13 +413,18 @@ def pre_process(id_: str, paths: dict, **kwargs) -> structure.BrainImage:
     transform = sitk.ReadTransform(path_to_transform)
     img = structure.BrainImage(id_, path, img, transform)
 
+    resampling_spacing = (0.9, 0.9, 0.9)
+    # resample directly to the new spacing during the registration instead of interpolating twice
+    fused_resampling = kwargs.get('registration_pre', False) and kwargs.get('resampling_pre', False) and \
+        kwargs.get('fused_resampling_pre', False)
+
     ##################################PIPELINE BRAIN MASK###########################################
     # construct pipeline for brain mask registration
     # we need to perform this before the T1w and T2w pipeline because the registered mask is used for skull-stripping
-    pipeline_brain_mask = fltr.FilterPipeline()
+    pipeline_brain_mask = cache_.MemoizedFilterPipeline(cache=stage_cache)
 
     if kwargs.get('registration_pre', False):
-        pipeline_brain_mask.add_filter(fltr_prep.ImageRegistration())
+        pipeline_brain_mask.add_filter(_get_registration_filter(fused_resampling, resampling_spacing, 'NN'))
         pipeline_brain_mask.set_param(fltr_prep.ImageRegistrationParameters(atlas_t1, img.transformation, True),
                                       len(pipeline_brain_mask.filters) - 1)
 
@@ -241,15 +432,34 @@ def pre_process(id_: str, paths: dict, **kwargs) -> structure.BrainImage:
     # execute pipeline on the brain mask image
     img.images[structure.BrainImageTypes.BrainMask] = pipeline_brain_mask.execute(img.images[structure.BrainImageTypes.BrainMask])
 
+    wiener_kernel_size = 9
+
+    # crop all images to the brain mask's bounding box after the skull stripping (and denoising)
+    cropping = kwargs.get('cropping_pre', False)
+    resampling_params = None
+    if cropping:
+        # the grid of the images without cropping at the end of the pre-processing
+        uncropped_properties = conversion.ImageProperties(img.images[structure.BrainImageTypes.BrainMask])
+        if kwargs.get('resampling_pre', False) and not fused_resampling:
+            uncropped_properties = fltr_prep.get_resampled_properties(uncropped_properties, resampling_spacing)
+            # resample the cropped images onto voxels of the uncropped grid
+            resampling_params = fltr_prep.ResamplingParameters(uncropped_properties.origin, uncropped_properties.size)
+        padding = 2
+        if kwargs.get('wiener_denoising_pre', False):
+            # the denoising spreads intensities by half a window beyond the brain mask's bounding box
+            padding += wiener_kernel_size // 2
+        cropping_params = fltr_prep.BrainMaskCroppingParameters(img.images[structure.BrainImageTypes.BrainMask],
+                                                                padding)
+
     ################################################################################################
     ##################################PIPELINE T1###################################################
     
     # construct pipeline for T1w image pre-processing
-    pipeline_t1 = fltr.FilterPipeline()
+    pipeline_t1 = cache_.MemoizedFilterPipeline(cache=stage_cache)
 
     
     if kwargs.get('registration_pre', False):
-        pipeline_t1.add_filter(fltr_prep.ImageRegistration())
+        pipeline_t1.add_filter(_get_registration_filter(fused_resampling, resampling_spacing, 'linear'))
         pipeline_t1.set_param(fltr_prep.ImageRegistrationParameters(atlas_t1, img.transformation),
                               len(pipeline_t1.filters) - 1)
     
@@ -258,11 +468,20 @@ def pre_process(id_: str, paths: dict, **kwargs) -> structure.BrainImage:
         pipeline_t1.set_param(fltr_prep.SkullStrippingParameters(img.images[structure.BrainImageTypes.BrainMask]),
                               len(pipeline_t1.filters) - 1)
 
-    if kwargs.get('wiener_denoising', False):
-        pipeline_t1.add_filter(fltr_prep.WienerDenoisingFilter(kernel_size=9))   
+    if kwargs.get('wiener_denoising_pre', False):
+        pipeline_t1.add_filter(fltr_prep.WienerDenoisingFilter(kernel_size=wiener_kernel_size))
+        if kwargs.get('skullstrip_pre', False):
+            # the skull-stripped image is zero outside the brain mask, i.e. only its bounding box needs filtering
+            pipeline_t1.set_param(fltr_prep.WienerDenoisingParameters(img.images[structure.BrainImageTypes.BrainMask]),
+                                  len(pipeline_t1.filters) - 1)
+
+    if cropping:
+        pipeline_t1.add_filter(fltr_prep.BrainMaskCropping())
+        pipeline_t1.set_param(cropping_params, len(pipeline_t1.filters) - 1)
 
-    if kwargs.get('resampling_pre', False):
-        pipeline_t1.add_filter(fltr_prep.Resampling(new_spacing=(0.9,0.9,0.9),method='linear'))
+    if kwargs.get('resampling_pre', False) and not fused_resampling:
+        pipeline_t1.add_filter(fltr_prep.Resampling(new_spacing=resampling_spacing,method='linear'))
+        pipeline_t1.set_param(resampling_params, len(pipeline_t1.filters) - 1)
 
     if kwargs.get('normalization_pre', False):
         pipeline_t1.add_filter(fltr_prep.ImageNormalization())
@@ -273,11 +492,11 @@ def pre_process(id_: str, paths: dict, **kwargs) -> structure.BrainImage:
     ##################################PIPELINE T2###################################################
 
     # construct pipeline for T2w image pre-processing
-    pipeline_t2 = fltr.FilterPipeline()
+    pipeline_t2 = cache_.MemoizedFilterPipeline(cache=stage_cache)
 
 
     if kwargs.get('registration_pre', False):
-        pipeline_t2.add_filter(fltr_prep.ImageRegistration())
+        pipeline_t2.add_filter(_get_registration_filter(fused_resampling, resampling_spacing, 'linear'))
         pipeline_t2.set_param(fltr_prep.ImageRegistrationParameters(atlas_t2, img.transformation),
                               len(pipeline_t2.filters) - 1)
 
@@ -286,11 +505,20 @@ def pre_process(id_: str, paths: dict, **kwargs) -> structure.BrainImage:
         pipeline_t2.set_param(fltr_prep.SkullStrippingParameters(img.images[structure.BrainImageTypes.BrainMask]),
                               len(pipeline_t2.filters) - 1)
    
-    if kwargs.get('wiener_denoising', False):
-        pipeline_t2.add_filter(fltr_prep.WienerDenoisingFilter(kernel_size=9))
+    if kwargs.get('wiener_denoising_pre', False):
+        pipeline_t2.add_filter(fltr_prep.WienerDenoisingFilter(kernel_size=wiener_kernel_size))
+        if kwargs.get('skullstrip_pre', False):
+            # the skull-stripped image is zero outside the brain mask, i.e. only its bounding box needs filtering
+            pipeline_t2.set_param(fltr_prep.WienerDenoisingParameters(img.images[structure.BrainImageTypes.BrainMask]),
+                                  len(pipeline_t2.filters) - 1)
     
-    if kwargs.get('resampling_pre', False):
-        pipeline_t2.add_filter(fltr_prep.Resampling(new_spacing=(0.9,0.9,0.9),method='linear'))
+    if cropping:
+        pipeline_t2.add_filter(fltr_prep.BrainMaskCropping())
+        pipeline_t2.set_param(cropping_params, len(pipeline_t2.filters) - 1)
+
+    if kwargs.get('resampling_pre', False) and not fused_resampling:
+        pipeline_t2.add_filter(fltr_prep.Resampling(new_spacing=resampling_spacing,method='linear'))
+        pipeline_t2.set_param(resampling_params, len(pipeline_t2.filters) - 1)
 
     if kwargs.get('normalization_pre', False):
         pipeline_t2.add_filter(fltr_prep.ImageNormalization())
@@ -300,26 +528,36 @@ def pre_process(id_: str, paths: dict, **kwargs) -> structure.BrainImage:
 
     ################################################################################################
     ##################################PIPELINE BRAIN MASK RESAMPLING################################
-    pipeline_resampling = fltr.FilterPipeline()
+    pipeline_resampling = cache_.MemoizedFilterPipeline(cache=stage_cache)
+
+    if cropping:
+        pipeline_resampling.add_filter(fltr_prep.BrainMaskCropping())
+        pipeline_resampling.set_param(cropping_params, len(pipeline_resampling.filters) - 1)
 
-    if kwargs.get('resampling_pre', False):
-        pipeline_resampling.add_filter(fltr_prep.Resampling(new_spacing=(0.9,0.9,0.9),method='NN'))
+    if kwargs.get('resampling_pre', False) and not fused_resampling:
+        pipeline_resampling.add_filter(fltr_prep.Resampling(new_spacing=resampling_spacing,method='NN'))
+        pipeline_resampling.set_param(resampling_params, len(pipeline_resampling.filters) - 1)
 
     img.images[structure.BrainImageTypes.BrainMask] = pipeline_resampling.execute(img.images[structure.BrainImageTypes.BrainMask])
 
     ################################################################################################
     ##################################PIPELINE GROUND TRUTH###########################################
     # construct pipeline for ground truth image pre-processing
-    pipeline_gt = fltr.FilterPipeline()
+    pipeline_gt = cache_.MemoizedFilterPipeline(cache=stage_cache)
 
 
     if kwargs.get('registration_pre', False):
-        pipeline_gt.add_filter(fltr_prep.ImageRegistration())
+        pipeline_gt.add_filter(_get_registration_filter(fused_resampling, resampling_spacing, 'NN'))
         pipeline_gt.set_param(fltr_prep.ImageRegistrationParameters(atlas_t1, img.transformation, True),
                               len(pipeline_gt.filters) - 1)
 
-    if kwargs.get('resampling_pre', False):
-        pipeline_gt.add_filter(fltr_prep.Resampling(new_spacing=(0.9,0.9,0.9),method='NN'))
+    if cropping:
+        pipeline_gt.add_filter(fltr_prep.BrainMaskCropping())
+        pipeline_gt.set_param(cropping_params, len(pipeline_gt.filters) - 1)
+
+    if kwargs.get('resampling_pre', False) and not fused_resampling:
+        pipeline_gt.add_filter(fltr_prep.Resampling(new_spacing=resampling_spacing,method='NN'))
+        pipeline_gt.set_param(resampling_params, len(pipeline_gt.filters) - 1)
 
     # execute pipeline on the ground truth image
     img.images[structure.BrainImageTypes.GroundTruth] = pipeline_gt.execute(
@@ -329,6 +567,9 @@ def pre_process(id_: str, paths: dict, **kwargs) -> structure.BrainImage:
     
     # update image properties to atlas image properties after registration
     img.image_properties = conversion.ImageProperties(img.images[structure.BrainImageTypes.T1w])
+    if cropping:
+        img.image_properties = structure.CroppedImageProperties(img.images[structure.BrainImageTypes.T1w],
+                                                                uncropped_properties)
 
     # extract the features
     feature_extractor = FeatureExtractor(img, **kwargs)
@@ -340,6 +581,44 @@ def pre_process(id_: str, paths: dict, **kwargs) -> structure.BrainImage:
     return img
 
 
+def uncrop(image: sitk.Image, image_properties: conversion.ImageProperties) -> sitk.Image:
+    """Restores an image on the grid of a pre-processed image to the uncropped grid.
+
+    Args:
+        image (sitk.Image): The image, e.g. a segmentation.
+        image_properties (conversion.ImageProperties): The properties of the pre-processed image.
+
+    Returns:
+        sitk.Image: The uncropped image or the image itself if the pre-processed image was not cropped.
+    """
+    if not isinstance(image_properties, structure.CroppedImageProperties):
+        return image
+    return fltr_prep.ImageUncropping().execute(image, fltr_prep.ImageUncroppingParams(image_properties))
+
+
+def feature_rows_to_image(rows: np.ndarray, img: structure.BrainImage, background) -> sitk.Image:
+    """Converts values per row of an image's feature matrix, e.g. predictions, to an image.
+
+    Args:
+        rows (np.ndarray): The values with shape (n,) or (n, number of components) for the n rows of the feature matrix.
+        img (structure.BrainImage): The image with the feature matrix.
+        background: The value (scalar or per component) of the voxels without row in the feature matrix, e.g. the
+            voxels outside the brain in sparse mode.
+
+    Returns:
+        sitk.Image: The image with the properties of the pre-processed image.
+    """
+    indices = img.feature_matrix[2]
+    no_voxels = int(np.prod(img.image_properties.size))
+    if len(indices) == no_voxels:
+        return conversion.NumpySimpleITKImageBridge.convert(rows, img.image_properties)
+
+    array = np.empty((no_voxels,) + rows.shape[1:], rows.dtype)
+    array[...] = background
+    array[indices] = rows
+    return conversion.NumpySimpleITKImageBridge.convert(array, img.image_properties)
+
+
 def post_process(img: structure.BrainImage, segmentation: sitk.Image, probability: sitk.Image,
                  **kwargs) -> sitk.Image:
     """Post-processes a segmentation.
@@ -391,8 +670,178 @@ def init_evaluator() -> eval_.Evaluator:
     return evaluator
 
 
+def init_pre_process_cache(directory: str, max_size: int = None) -> cache_.PreProcessCache:
+    """Initializes a cache for the results of :func:`pre_process`.
+
+    The filter version of the cache key is the fingerprint of the code of the pre-processing and feature extraction.
+
+    Args:
+        directory (str): The cache directory.
+        max_size (int): The maximum size of the cache in bytes (None means unbounded).
+
+    Returns:
+        cache_.PreProcessCache: The cache.
+    """
+    code_fingerprint = cache_.get_code_fingerprint([structure, fltr_prep, fltr_feat, sys.modules[__name__]])
+    return cache_.PreProcessCache(directory, max_size, code_fingerprint)
+
+
+def init_feature_store(directory: str, max_size: int = None) -> cache_.FeatureStore:
+    """Initializes a store for the feature matrices computed by :func:`pre_process`.
+
+    The keys of the store are the same as the ones of the pre-processing cache (see :func:`init_pre_process_cache`).
+
+    Args:
+        directory (str): The store directory.
+        max_size (int): The maximum size of the store in bytes (None means unbounded).
+
+    Returns:
+        cache_.FeatureStore: The store.
+    """
+    code_fingerprint = cache_.get_code_fingerprint([structure, fltr_prep, fltr_feat, sys.modules[__name__]])
+    return cache_.FeatureStore(directory, max_size, code_fingerprint)
+
+
+def pre_process_to_feature_store(data_batch: t.Dict[structure.BrainImageTypes, structure.BrainImage],
+                                 feature_store: cache_.FeatureStore, pre_process_params: dict = None,
+                                 multi_process: bool = True, cache: cache_.PreProcessCache = None,
+                                 shared_memory: bool = False) -> t.List[str]:
+    """Pre-processes the subjects of a batch, which are not yet in a feature store, and stores their feature matrices.
+
+    Subjects in the store are neither loaded nor pre-processed. The other images are consumed one by one from
+    :func:`pre_process_iter` and dropped after storing their feature matrix, such that no images are kept in memory.
+    Use :meth:`FeatureStore.assemble <mialab.utilities.cache.FeatureStore.assemble>` to get the design matrix.
+
+    Args:
+        data_batch (Dict[structure.BrainImageTypes, structure.BrainImage]): Batch of images to be processed.
+        feature_store (cache_.FeatureStore): The feature store (see :func:`init_feature_store`).
+        pre_process_params (dict): Pre-processing parameters.
+        multi_process (bool): Whether to use the parallel processing on multiple cores or to run sequentially.
+        cache (cache_.PreProcessCache): A cache to load unchanged images from instead of re-computing them.
+        shared_memory (bool): Whether to transport the images between the processes through shared memory
+            instead of pickling them.
+
+    Returns:
+        List[str]: The keys of the subjects in the feature store in the order of the batch.
+    """
+    if pre_process_params is None:
+        pre_process_params = {}
+
+    keys = {id_: feature_store.get_key(paths, pre_process_params, atlas_files) for id_, paths in data_batch.items()}
+    missing = {id_: paths for id_, paths in data_batch.items() if not feature_store.contains(keys[id_])}
+    for id_ in data_batch:
+        if id_ not in missing:
+            print('-' * 10, 'Loaded', id_, 'from feature store')
+
+    if len(missing) > 0:
+        for _, img in pre_process_iter(missing, pre_process_params, multi_process, cache, shared_memory):
+            feature_store.store(keys[img.id_], img.id_, img.feature_matrix)
+
+    print('Feature store: {} hits, {} misses'.format(len(data_batch) - len(missing), len(missing)))
+
+    return list(keys.values())
+
+
+def _run_sequentially(fn: callable, param_list: iter, fn_kwargs: dict,
+                      capture_errors: bool) -> t.Iterator[t.Tuple[int, t.Any]]:
+    """Executes the function ``fn`` for each parameter in the parameter list and yields the return values like
+    :meth:`MultiProcessor.run_iter <mialab.utilities.multi_processor.MultiProcessor.run_iter>`."""
+    for idx, params in enumerate(param_list):
+        try:
+            ret_val = fn(*params, **fn_kwargs)
+        except Exception as e:
+            if not capture_errors:
+                raise
+            ret_val = mproc.TaskError(idx, e, traceback.format_exc())
+        yield idx, ret_val
+
+
+def pre_process_iter(data_batch: t.Dict[structure.BrainImageTypes, structure.BrainImage],
+                     pre_process_params: dict = None, multi_process: bool = True,
+                     cache: cache_.PreProcessCache = None, shared_memory: bool = False,
+                     max_in_flight: int = None, ordered: bool = True,
+                     capture_errors: bool = False) -> t.Iterator[t.Tuple[int, structure.BrainImage]]:
+    """Loads and pre-processes a batch of images and yields the images as they are ready.
+
+    See :func:`pre_process_batch` for the pre-processing. Consuming the images one by one keeps the memory bounded
+    independent of the batch size. The processes and threads are those of the ``pre_process`` phase of the execution
+    resources (see :mod:`mialab.utilities.execution_resources`).
+
+    Args:
+        data_batch (Dict[structure.BrainImageTypes, structure.BrainImage]): Batch of images to be processed.
+        pre_process_params (dict): Pre-processing parameters.
+        multi_process (bool): Whether to use the parallel processing on multiple cores or to run sequentially.
+        cache (cache_.PreProcessCache): A cache to load unchanged images from instead of re-computing them
+            (see :func:`init_pre_process_cache`).
+        shared_memory (bool): Whether to transport the images between the processes through shared memory
+            instead of pickling them.
+        max_in_flight (int): The maximum number of images being processed, but not yet yielded (multi-process only).
+        ordered (bool): Whether to yield the images in the order of the batch or as they are ready.
+        capture_errors (bool): Whether to yield a :class:`TaskError <mialab.utilities.multi_processor.TaskError>`
+            for an image, whose pre-processing failed, instead of raising.
+
+    Yields:
+        tuple: The index of the image in the batch and the image.
+    """
+    if pre_process_params is None:
+        pre_process_params = {}
+
+    params_list = list(data_batch.items())
+
+    ready = {}
+    keys = [None] * len(params_list)
+    if cache is not None:
+        for idx, (id_, paths) in enumerate(params_list):
+            keys[idx] = cache.get_key(paths, pre_process_params, atlas_files)
+            img = cache.load(keys[idx], id_, paths.get(id_, ''))
+            if img is not None:
+                print('-' * 10, 'Loaded', id_, 'from cache')
+                ready[idx] = img
+
+    # pre_process pops the image directory and transformation from the paths, therefore, we pass a copy
+    missing = [idx for idx in range(len(params_list)) if idx not in ready]
+    missing_params_list = [(params_list[idx][0], dict(params_list[idx][1])) for idx in missing]
+    if not ordered:
+        yield from ready.items()
+        ready = {}
+
+    next_idx = 0
+    with exec_res.resources.phase('pre_process', len(missing), multi_process) as phase_resources:
+        if multi_process:
+            results = mproc.MultiProcessor.run_iter(pre_process, missing_params_list, pre_process_params,
+                                                    mproc.PreProcessingPickleHelper, shared_memory, max_in_flight,
+                                                    ordered, capture_errors, phase_resources)
+        else:
+            results = _run_sequentially(pre_process, missing_params_list, pre_process_params, capture_errors)
+
+        for missing_idx, img in results:
+            idx = missing[missing_idx]
+            if isinstance(img, mproc.TaskError):
+                img.index = idx
+            elif cache is not None:
+                cache.store(keys[idx], img)
+
+            if not ordered:
+                yield idx, img
+                continue
+
+            ready[idx] = img
+            while next_idx in ready:
+                yield next_idx, ready.pop(next_idx)
+                next_idx += 1
+
+    while next_idx in ready:
+        yield next_idx, ready.pop(next_idx)
+        next_idx += 1
+
+    if cache is not None:
+        print('Pre-processing cache: {} hits, {} misses'.format(cache.hits, cache.misses))
+
+
 def pre_process_batch(data_batch: t.Dict[structure.BrainImageTypes, structure.BrainImage],
-                      pre_process_params: dict = None, multi_process: bool = True) -> t.List[structure.BrainImage]:
+                      pre_process_params: dict = None, multi_process: bool = True,
+                      cache: cache_.PreProcessCache = None,
+                      shared_memory: bool = False) -> t.List[structure.BrainImage]:
     """Loads and pre-processes a batch of images.
 
     The pre-processing includes:
@@ -405,24 +854,20 @@ def pre_process_batch(data_batch: t.Dict[structure.BrainImageTypes, structure.Br
         data_batch (Dict[structure.BrainImageTypes, structure.BrainImage]): Batch of images to be processed.
         pre_process_params (dict): Pre-processing parameters.
         multi_process (bool): Whether to use the parallel processing on multiple cores or to run sequentially.
+        cache (cache_.PreProcessCache): A cache to load unchanged images from instead of re-computing them
+            (see :func:`init_pre_process_cache`).
+        shared_memory (bool): Whether to transport the images between the processes through shared memory
+            instead of pickling them.
 
     Returns:
         List[structure.BrainImage]: A list of images.
     """
-    if pre_process_params is None:
-        pre_process_params = {}
-
-    params_list = list(data_batch.items())
-    if multi_process:
-        images = mproc.MultiProcessor.run(pre_process, params_list, pre_process_params, mproc.PreProcessingPickleHelper)
-    else:
-        images = [pre_process(id_, path, **pre_process_params) for id_, path in params_list]
-    return images
+    return [img for _, img in pre_process_iter(data_batch, pre_process_params, multi_process, cache, shared_memory)]
 
 
 def post_process_batch(brain_images: t.List[structure.BrainImage], segmentations: t.List[sitk.Image],
                        probabilities: t.List[sitk.Image], post_process_params: dict = None,
-                       multi_process: bool = True) -> t.List[sitk.Image]:
+                       multi_process: bool = True, shared_memory: bool = False) -> t.List[sitk.Image]:
     """ Post-processes a batch of images.
 
     Args:
@@ -431,17 +876,51 @@ def post_process_batch(brain_images: t.List[structure.BrainImage], segmentations
         probabilities (List[sitk.Image]): The prediction probabilities.
         post_process_params (dict): Post-processing parameters.
         multi_process (bool): Whether to use the parallel processing on multiple cores or to run sequentially.
+        shared_memory (bool): Whether to transport the images between the processes through shared memory
+            instead of pickling them.
 
     Returns:
         List[sitk.Image]: List of post-processed images
     """
+    return [pp_img for _, pp_img in post_process_iter(brain_images, segmentations, probabilities, post_process_params,
+                                                      multi_process, shared_memory)]
+
+
+def post_process_iter(brain_images: t.Iterable[structure.BrainImage], segmentations: t.Iterable[sitk.Image],
+                      probabilities: t.Iterable[sitk.Image], post_process_params: dict = None,
+                      multi_process: bool = True, shared_memory: bool = False, max_in_flight: int = None,
+                      ordered: bool = True, capture_errors: bool = False) -> t.Iterator[t.Tuple[int, sitk.Image]]:
+    """ Post-processes a batch of images and yields the post-processed images as they are ready.
+
+    The inputs are consumed lazily, i.e. they can be generators producing the segmentations one by one. The processes
+    and threads are those of the ``post_process`` phase of the execution resources (see
+    :mod:`mialab.utilities.execution_resources`).
+
+    Args:
+        brain_images (Iterable[structure.BrainImageTypes]): Original images that were used for the prediction.
+        segmentations (Iterable[sitk.Image]): The predicted segmentation.
+        probabilities (Iterable[sitk.Image]): The prediction probabilities.
+        post_process_params (dict): Post-processing parameters.
+        multi_process (bool): Whether to use the parallel processing on multiple cores or to run sequentially.
+        shared_memory (bool): Whether to transport the images between the processes through shared memory
+            instead of pickling them.
+        max_in_flight (int): The maximum number of images being processed, but not yet yielded (multi-process only).
+        ordered (bool): Whether to yield the images in the order of the batch or as they are ready.
+        capture_errors (bool): Whether to yield a :class:`TaskError <mialab.utilities.multi_processor.TaskError>`
+            for an image, whose post-processing failed, instead of raising.
+
+    Yields:
+        tuple: The index of the image in the batch and the post-processed image.
+    """
     if post_process_params is None:
         post_process_params = {}
 
+    no_tasks = len(brain_images) if hasattr(brain_images, '__len__') else None
     param_list = zip(brain_images, segmentations, probabilities)
-    if multi_process:
-        pp_images = mproc.MultiProcessor.run(post_process, param_list, post_process_params,
-                                             mproc.PostProcessingPickleHelper)
-    else:
-        pp_images = [post_process(img, seg, prob, **post_process_params) for img, seg, prob in param_list]
-    return pp_images
+    with exec_res.resources.phase('post_process', no_tasks, multi_process) as phase_resources:
+        if multi_process:
+            yield from mproc.MultiProcessor.run_iter(post_process, param_list, post_process_params,
+                                                     mproc.PostProcessingPickleHelper, shared_memory, max_in_flight,
+                                                     ordered, capture_errors, phase_resources)
+        else:
+            yield from _run_sequentially(post_process, param_list, post_process_params, capture_errors)
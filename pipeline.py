@@ -1,27 +1,40 @@
 """A medical image analysis pipeline.
 
-The pipeline is used for brain tissue segmentation using a decision forest classifier.
+The pipeline is used for brain tissue segmentation using a decision forest or gradient boosting classifier.
 """
 import argparse
 import datetime
 import os
 import sys
+import tempfile
 import timeit
 
 import SimpleITK as sitk
-import sklearn.ensemble as sk_ensemble
 import numpy as np
-import pymia.data.conversion as conversion
 import pymia.evaluation.writer as writer
 
 try:
+    import mialab.classifier.classifiers as clf
+    import mialab.classifier.flat_forest as flat
+    import mialab.classifier.out_of_core as ooc
+    import mialab.classifier.persistence as pers
+    import mialab.classifier.quantization as quant
     import mialab.data.structure as structure
+    import mialab.utilities.cache as cache_
+    import mialab.utilities.execution_resources as exec_res
     import mialab.utilities.file_access_utilities as futil
     import mialab.utilities.pipeline_utilities as putil
 except ImportError:
     # Append the MIALab root directory to Python path
     sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.classifier.classifiers as clf
+    import mialab.classifier.flat_forest as flat
+    import mialab.classifier.out_of_core as ooc
+    import mialab.classifier.persistence as pers
+    import mialab.classifier.quantization as quant
     import mialab.data.structure as structure
+    import mialab.utilities.cache as cache_
+    import mialab.utilities.execution_resources as exec_res
     import mialab.utilities.file_access_utilities as futil
     import mialab.utilities.pipeline_utilities as putil
 
@@ -32,8 +45,86 @@ LOADING_KEYS = [structure.BrainImageTypes.T1w,
                 structure.BrainImageTypes.RegistrationTransform]  # the list of data we will load
 
 
-def main(result_dir: str, data_atlas_dir: str, data_train_dir: str, data_test_dir: str):
-    """Brain tissue segmentation using decision forests.
+def train(data_train_dir: str, pre_process_params: dict, cache: cache_.PreProcessCache = None, cache_dir: str = None,
+          feature_bins: int = None, training_chunk_size: int = None, classifier_name: str = 'forest',
+          validation_subjects: int = 0) -> tuple:
+    """Trains a classifier on the training images.
+
+    The feature matrices of the training images are kept in the feature store of the cache directory (or a temporary
+    one), from which the design matrix is assembled.
+
+    Args:
+        data_train_dir (str): Directory with training data.
+        pre_process_params (dict): Pre-processing parameters.
+        cache (cache_.PreProcessCache): The pre-processing cache, if any.
+        cache_dir (str): The cache directory, if any.
+        feature_bins (int): The number of quantile bins per feature (float32 features if None).
+        training_chunk_size (int): The number of samples per chunk for out-of-core training (in-memory if None).
+        classifier_name (str): The classifier (see :mod:`mialab.classifier.classifiers`).
+        validation_subjects (int): The number of training subjects held out for the early stopping of the gradient
+            boosting.
+
+    Returns:
+        tuple: The fitted classifier, the quantizer (None if the features are not quantized), and the column names.
+    """
+    # the training feature matrices are kept in the feature store, which is temporary without a cache directory
+    tmp_dir = tempfile.TemporaryDirectory() if cache_dir is None else None
+    feature_store = putil.init_feature_store(cache_dir if tmp_dir is None else tmp_dir.name)
+
+    # crawl the training image directories
+    crawler = futil.FileSystemDataCrawler(data_train_dir,
+                                          LOADING_KEYS,
+                                          futil.BrainImageFilePathGenerator(),
+                                          futil.DataDirectoryFilter())
+
+    # load images for training, pre-process and store the feature matrices of the subjects not in the feature store
+    keys = putil.pre_process_to_feature_store(crawler.data, feature_store, pre_process_params, multi_process=False,
+                                              cache=cache)
+
+    # hold out the last training subjects to validate the classifier, if required
+    keys_val = []
+    if validation_subjects > 0:
+        keys, keys_val = keys[:-validation_subjects], keys[-validation_subjects:]
+
+    # quantize the features to the quantile bins of the training data, if required
+    quantizer = None
+    transform, dtype = None, None
+    if feature_bins is not None:
+        quantizer = quant.FeatureQuantizer(feature_bins)
+        quantizer.fit(feature_store.sample(keys, quantizer.subsample, quantizer.seed))
+        transform, dtype = quantizer.transform, quantizer.dtype
+
+    # generate feature matrix and label vector from the memory-mapped feature store, unless training out-of-core
+    if training_chunk_size is None:
+        data_train, labels_train = feature_store.assemble(keys, transform, dtype)
+        print('Training data: {} samples, {:.1f} MB'.format(data_train.shape[0], data_train.nbytes / 2 ** 20))
+        data_val, labels_val = feature_store.assemble(keys_val, transform, dtype) if keys_val else (None, None)
+
+    columns = np.array(feature_store.load(keys[0])[3])
+    classifier = clf.create_classifier(classifier_name, len(columns))
+
+    with exec_res.resources.phase('training') as training_resources, \
+            clf.limit_threads(classifier, training_resources.n_jobs):
+        start_time = timeit.default_timer()
+        if training_chunk_size is None:
+            clf.fit_classifier(classifier, data_train, labels_train, data_val, labels_val)
+            del data_train, labels_train
+        else:
+            # grow the trees chunk by chunk, such that only one chunk of the training data is in memory
+            ooc.fit_forest_out_of_core(classifier, feature_store, keys, training_chunk_size, transform, dtype)
+        print(' Time elapsed:', timeit.default_timer() - start_time, 's')
+
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+    return classifier, quantizer, columns
+
+
+def main(result_dir: str, data_atlas_dir: str, data_train_dir: str, data_test_dir: str, cache_dir: str = None,
+         cache_size: float = None, cores: int = None, resource_overrides: dict = None, feature_bins: int = None,
+         training_chunk_size: int = None, classifier_name: str = 'forest', validation_subjects: int = 0,
+         save_model_path: str = None, load_model_path: str = None):
+    """Brain tissue segmentation using decision forests or gradient boosting.
 
     The main routine executes the medical image analysis pipeline:
 
@@ -41,52 +132,100 @@ def main(result_dir: str, data_atlas_dir: str, data_train_dir: str, data_test_di
         - Registration
         - Pre-processing
         - Feature extraction
-        - Decision forest classifier model building
-        - Segmentation using the decision forest classifier model on unseen images
+        - Classifier model building
+        - Segmentation using the classifier model on unseen images
         - Post-processing of the segmentation
         - Evaluation of the segmentation
-    """
 
-    # load atlas images
-    putil.load_atlas_images(data_atlas_dir)
+    If a cache directory is given, the pre-processed images are loaded from the cache unless their input files,
+    pre-processing parameters or filter code changed. Otherwise, the output of unchanged pre-processing stages
+    (e.g. registration and skull stripping) is re-used.
 
-    print('-' * 5, 'Training...')
+    The cores are split between processes and threads per phase (see :mod:`mialab.utilities.execution_resources`).
+
+    If a number of feature bins is given, the features are quantized to the quantile bins of the training data
+    (see :mod:`mialab.classifier.quantization`) before training and testing. If a training chunk size is given, the
+    forest is grown chunk by chunk on the subjects of the feature store (see :mod:`mialab.classifier.out_of_core`),
+    such that the training set does not need to fit into memory.
+
+    The classifier is chosen by name (see :mod:`mialab.classifier.classifiers`). If validation subjects are given for
+    the gradient boosting, the last ones of the training data are held out for its early stopping.
+
+    A trained forest can be saved and loaded instead of training (see :mod:`mialab.classifier.persistence`). A loaded
+    model is refused if it has been trained with different pre-processing parameters or features.
+    """
+    if training_chunk_size is not None and classifier_name != 'forest':
+        raise ValueError('Out-of-core training is only supported for the forest, not for {}'.format(classifier_name))
+    if save_model_path is not None and classifier_name != 'forest':
+        raise ValueError('Saving the model is only supported for the forest, not for {}'.format(classifier_name))
+    if validation_subjects != 0 and classifier_name != 'hist_gradient_boosting':
+        # the other classifiers do not stop early, such that holding out subjects would only reduce the training data
+        raise ValueError('Validation subjects are only supported for the early stopping of the gradient boosting, not '
+                         'for {}'.format(classifier_name))
+    if load_model_path is None:
+        no_train_subjects = len(futil.FileSystemDataCrawler(data_train_dir, LOADING_KEYS,
+                                                            futil.BrainImageFilePathGenerator(),
+                                                            futil.DataDirectoryFilter()).data)
+        if not 0 <= validation_subjects < no_train_subjects:
+            raise ValueError('The number of validation subjects must be at least 0 and less than the number of '
+                             'training subjects ({}), not {}'.format(no_train_subjects, validation_subjects))
+
+    # split the cores between processes and threads
+    print(exec_res.init(cores, resource_overrides))
+
+    # load atlas images (keep the uncompressed atlas copies with the cache, if any)
+    if cache_dir is None:
+        putil.load_atlas_images(data_atlas_dir)
+    else:
+        putil.load_atlas_images(data_atlas_dir, os.path.join(cache_dir, 'atlas'))
+
+    cache = None
+    if cache_dir is not None:
+        # the size is split evenly between the pre-processing and the stage cache, the feature store is unbounded
+        # because evicting subjects from it would remove training data required later in the same run
+        max_size = None if cache_size is None else int(cache_size * 2 ** 30) // 2
+        cache = putil.init_pre_process_cache(cache_dir, max_size)
+        putil.init_stage_cache(cache_dir, max_size)
 
-    # crawl the training image directories
-    crawler = futil.FileSystemDataCrawler(data_train_dir,
-                                          LOADING_KEYS,
-                                          futil.BrainImageFilePathGenerator(),
-                                          futil.DataDirectoryFilter())
     pre_process_params = {'skullstrip_pre'            : True,
                           'normalization_pre'         : True,
                           'registration_pre'          : True,
                           'coordinates_feature'       : True,
                           'intensity_feature'         : True,
                           'gradient_intensity_feature': True,
+                          't2_intensity_feature'      : False,
+                          't2_gradient_intensity_feature': False,
+                          'texture_feature'           : False,
+                          't2_texture_feature'        : False,
+                          'filter_bank_feature'       : False,
+                          'glcm_feature'              : False,
+                          't2_glcm_feature'           : False,
+                          'sparse_features'           : True,
+                          'training_mask_seed'        : 0,
                           'resampling_pre'            : True,
-                          'wiener_denoising_pre'      : True,}
-
-    # load images for training and pre-process
-    images = putil.pre_process_batch(crawler.data, pre_process_params, multi_process=False)
-
-    # generate feature matrix and label vector
-    data_train = np.concatenate([img.feature_matrix[0] for img in images])
-    labels_train = np.concatenate([img.feature_matrix[1] for img in images]).squeeze()
-
-    # TODO fine-tune random forest
-    forest = sk_ensemble.RandomForestClassifier(
-        max_features     = images[0].feature_matrix[0].shape[1],
-        n_estimators     = 50,
-        max_depth        = 5,
-        criterion        = 'gini',
-        min_samples_leaf = 3, 
-        min_samples_split= 2,
-        bootstrap= True 
-        )
-
-    start_time = timeit.default_timer()
-    forest.fit(data_train, labels_train)
-    print(' Time elapsed:', timeit.default_timer() - start_time, 's')
+                          'fused_resampling_pre'      : False,
+                          'cropping_pre'              : False,
+                          'wiener_denoising_pre'      : False,}
+
+    # the parameters, which change the features at test time, identify the pre-processing of a saved model
+    params_fingerprint = cache_.get_params_fingerprint({key: value for key, value in pre_process_params.items()
+                                                        if key not in ('training', 'training_mask_seed')})
+
+    if load_model_path is None:
+        print('-' * 5, 'Training...')
+        classifier, quantizer, columns = train(data_train_dir, pre_process_params, cache, cache_dir, feature_bins,
+                                               training_chunk_size, classifier_name, validation_subjects)
+        if save_model_path is not None:
+            pers.save_model(save_model_path, classifier, columns, params_fingerprint, quantizer)
+            print('Saved model to', save_model_path)
+    else:
+        print('-' * 5, 'Loading model', load_model_path)
+        # refuse a model trained on other features before pre-processing the test images
+        classifier, quantizer, columns = pers.load_model(load_model_path, params_fingerprint,
+                                                         putil.get_feature_columns(**pre_process_params))
+
+    # a forest is evaluated on flat node arrays, which is faster than tree by tree
+    classifier = flat.flatten(classifier)
 
     # create a result directory with timestamp
     t = datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
@@ -106,44 +245,56 @@ def main(result_dir: str, data_atlas_dir: str, data_train_dir: str, data_test_di
 
     # load images for testing and pre-process
     pre_process_params['training'] = False
-    images_test = putil.pre_process_batch(crawler.data, pre_process_params, multi_process=False)
+    images_test = putil.pre_process_batch(crawler.data, pre_process_params, multi_process=False, cache=cache)
 
     images_prediction = []
     images_probabilities = []
 
-    for img in images_test:
-        print('-' * 10, 'Testing', img.id_)
+    with exec_res.resources.phase('testing') as testing_resources, \
+            clf.limit_threads(classifier, testing_resources.n_jobs):
+        for img in images_test:
+            print('-' * 10, 'Testing', img.id_)
 
-        start_time = timeit.default_timer()
-        predictions = forest.predict(img.feature_matrix[0])
-        probabilities = forest.predict_proba(img.feature_matrix[0])
-        print(' Time elapsed:', timeit.default_timer() - start_time, 's')
+            pers.check_columns(columns, img.feature_matrix[3])
+            start_time = timeit.default_timer()
+            features = img.feature_matrix[0] if quantizer is None else quantizer.transform(img.feature_matrix[0])
+            # the labels are derived from the probabilities, which are quantized to uint8 for the post-processing
+            predictions, probabilities = clf.predict(classifier, features)
+            print(' Time elapsed:', timeit.default_timer() - start_time, 's')
 
-        # convert prediction and probabilities back to SimpleITK images
-        image_prediction = conversion.NumpySimpleITKImageBridge.convert(predictions.astype(np.uint8),
-                                                                        img.image_properties)
-        image_probabilities = conversion.NumpySimpleITKImageBridge.convert(probabilities, img.image_properties)
+            # convert prediction and probabilities back to SimpleITK images, where voxels without features (outside
+            # the brain in sparse mode) are background
+            background_probabilities = clf.quantize_probabilities((classifier.classes_ == 0).astype(np.float64))
+            image_prediction = putil.feature_rows_to_image(predictions.astype(np.uint8), img, 0)
+            image_probabilities = putil.feature_rows_to_image(probabilities, img, background_probabilities)
 
-        # evaluate segmentation without post-processing
-        evaluator.evaluate(image_prediction, img.images[structure.BrainImageTypes.GroundTruth], img.id_)
+            # evaluate segmentation without post-processing
+            evaluator.evaluate(putil.uncrop(image_prediction, img.image_properties),
+                               putil.uncrop(img.images[structure.BrainImageTypes.GroundTruth], img.image_properties),
+                               img.id_)
 
-        images_prediction.append(image_prediction)
-        images_probabilities.append(image_probabilities)
+            images_prediction.append(image_prediction)
+            images_probabilities.append(image_probabilities)
 
     # post-process segmentation and evaluate with post-processing
     post_process_params = {
                 'simple_post': True, 
                 'crf_post'   : False}
     images_post_processed = putil.post_process_batch(images_test, images_prediction, images_probabilities,
-                                                     post_process_params, multi_process=True)
+                                                     post_process_params, multi_process=True, shared_memory=True)
 
     for i, img in enumerate(images_test):
-        evaluator.evaluate(images_post_processed[i], img.images[structure.BrainImageTypes.GroundTruth],
+        # restore the cropped images to the uncropped grid
+        image_prediction = putil.uncrop(images_prediction[i], img.image_properties)
+        image_post_processed = putil.uncrop(images_post_processed[i], img.image_properties)
+
+        evaluator.evaluate(image_post_processed,
+                           putil.uncrop(img.images[structure.BrainImageTypes.GroundTruth], img.image_properties),
                            img.id_ + '-PP')
 
         # save results
-        sitk.WriteImage(images_prediction[i], os.path.join(result_dir, images_test[i].id_ + '_SEG.mha'), True)
-        sitk.WriteImage(images_post_processed[i], os.path.join(result_dir, images_test[i].id_ + '_SEG-PP.mha'), True)
+        sitk.WriteImage(image_prediction, os.path.join(result_dir, images_test[i].id_ + '_SEG.mha'), True)
+        sitk.WriteImage(image_post_processed, os.path.join(result_dir, images_test[i].id_ + '_SEG-PP.mha'), True)
 
     # use two writers to report the results
     os.makedirs(result_dir, exist_ok=True)  # generate result directory, if it does not exists
@@ -163,6 +314,9 @@ def main(result_dir: str, data_atlas_dir: str, data_train_dir: str, data_test_di
     # clear results such that the evaluator is ready for the next evaluation
     evaluator.clear()
 
+    if putil.stage_cache is not None:
+        print('\n' + putil.stage_cache.report())
+
 
 if __name__ == "__main__":
     """The program's entry point."""
@@ -198,5 +352,84 @@ if __name__ == "__main__":
         help='Directory with testing data.'
     )
 
+    parser.add_argument(
+        '--cache_dir',
+        type=str,
+        default=None,
+        help='Directory of the pre-processing cache (no caching if not specified).'
+    )
+
+    parser.add_argument(
+        '--cache_size',
+        type=float,
+        default=None,
+        help='Maximum size of the cache directory in GB, split evenly between the pre-processing cache and the '
+             'filter stage cache (unbounded if not specified). The feature store with the training feature matrices '
+             'is not bounded.'
+    )
+
+    parser.add_argument(
+        '--cores',
+        type=int,
+        default=None,
+        help='The number of cores to split between processes and threads (all available cores if not specified).'
+    )
+
+    parser.add_argument(
+        '--resources',
+        type=str,
+        action='append',
+        default=[],
+        metavar='PHASE:FIELD=VALUE[,FIELD=VALUE]',
+        help='Overrides the resources of a phase ({}) with fields {}, e.g. pre_process:processes=8,sitk_threads=16. '
+             'Can be given multiple times.'.format(', '.join(exec_res.PHASES),
+                                                   ', '.join(exec_res.PhaseResources.FIELDS))
+    )
+
+    parser.add_argument(
+        '--feature_bins',
+        type=int,
+        default=None,
+        help='The number of quantile bins to quantize each feature to (float32 features if not specified).'
+    )
+
+    parser.add_argument(
+        '--training_chunk_size',
+        type=int,
+        default=None,
+        help='The number of training samples per chunk for out-of-core training (in-memory if not specified).'
+    )
+
+    parser.add_argument(
+        '--classifier',
+        type=str,
+        default='forest',
+        choices=sorted(clf.CLASSIFIERS),
+        help='The classifier.'
+    )
+
+    parser.add_argument(
+        '--validation_subjects',
+        type=int,
+        default=0,
+        help='The number of training subjects held out for the early stopping of the gradient boosting.'
+    )
+
+    parser.add_argument(
+        '--save_model',
+        type=str,
+        default=None,
+        help='Path to save the trained forest to (.npz).'
+    )
+
+    parser.add_argument(
+        '--load_model',
+        type=str,
+        default=None,
+        help='Path to load a trained forest from (.npz) instead of training.'
+    )
+
     args = parser.parse_args()
-    main(args.result_dir, args.data_atlas_dir, args.data_train_dir, args.data_test_dir)
+    main(args.result_dir, args.data_atlas_dir, args.data_train_dir, args.data_test_dir, args.cache_dir,
+         args.cache_size, args.cores, exec_res.parse_overrides(args.resources), args.feature_bins,
+         args.training_chunk_size, args.classifier, args.validation_subjects, args.save_model, args.load_model)
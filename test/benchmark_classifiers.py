@@ -0,0 +1,114 @@
+"""Benchmarks the classifiers on identical features of the subjects in a feature store.
+
+The subjects of the feature store (the most recent entry per subject, see :class:`mialab.utilities.cache.FeatureStore`)
+are split into training, validation, and test subjects. Each classifier is trained on the same (optionally quantized)
+features and the fit time, the inference time, and the Dice coefficient per label on the test samples are printed.
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+try:
+    import mialab.classifier.classifiers as clf
+    import mialab.classifier.quantization as quant
+    import mialab.utilities.cache as cache_
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.classifier.classifiers as clf
+    import mialab.classifier.quantization as quant
+    import mialab.utilities.cache as cache_
+
+
+def _get_dice(predictions: np.ndarray, labels: np.ndarray, label: int) -> float:
+    """Gets the Dice coefficient of a label."""
+    prediction, reference = predictions == label, labels == label
+    return 2 * np.sum(prediction & reference) / max(np.sum(prediction) + np.sum(reference), 1)
+
+
+def main(cache_dir: str, test_subjects: int, validation_subjects: int, feature_bins: int, n_jobs: int):
+
+    store = cache_.FeatureStore(cache_dir)
+    latest = {entry.meta.get('description', ''): entry.key for entry in store.entries()}
+    keys = [latest[id_] for id_ in sorted(latest)]
+    if len(keys) <= test_subjects + validation_subjects:
+        raise ValueError('The feature store {} contains only {} subjects'.format(store.directory, len(keys)))
+
+    keys_train = keys[:len(keys) - test_subjects - validation_subjects]
+    keys_val = keys[len(keys_train):len(keys) - test_subjects]
+    keys_test = keys[len(keys) - test_subjects:]
+
+    transform, dtype = None, None
+    if feature_bins is not None:
+        quantizer = quant.FeatureQuantizer(feature_bins).fit(store.sample(keys_train, 200000))
+        transform, dtype = quantizer.transform, quantizer.dtype
+
+    data, labels = store.assemble(keys_train, transform, dtype)
+    data_val, labels_val = store.assemble(keys_val, transform, dtype) if keys_val else (None, None)
+    data_test, labels_test = store.assemble(keys_test, transform, dtype)
+    print(f'Subjects: {len(keys_train)} training, {len(keys_val)} validation, {len(keys_test)} test')
+    print(f'Samples:  {len(labels)} training, {len(labels_test)} test, {data.shape[1]} features of {data.dtype}')
+
+    label_names = {label: str(label) for label in np.unique(labels)}
+    print(f'{"classifier":<24} {"fit":>8} {"predict":>8}  ' + ' '.join(f'{name:>6}' for name in label_names.values()))
+    for name in clf.CLASSIFIERS:
+        classifier = clf.create_classifier(name, data.shape[1], random_state=0)
+        with clf.limit_threads(classifier, n_jobs):
+            start_time = timeit.default_timer()
+            clf.fit_classifier(classifier, data, labels, data_val, labels_val)
+            fit_time = timeit.default_timer() - start_time
+
+            start_time = timeit.default_timer()
+            predictions = classifier.classes_[np.argmax(classifier.predict_proba(data_test), axis=1)]
+            predict_time = timeit.default_timer() - start_time
+
+        dice = ' '.join(f'{_get_dice(predictions, labels_test, label):6.3f}' for label in label_names)
+        print(f'{name:<24} {fit_time:7.2f}s {predict_time:7.2f}s  {dice}')
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    parser = argparse.ArgumentParser(description='Classifier benchmark on the feature store')
+
+    parser.add_argument(
+        '--cache_dir',
+        type=str,
+        required=True,
+        help='Directory of the pre-processing cache, which contains the feature store.'
+    )
+
+    parser.add_argument(
+        '--test_subjects',
+        type=int,
+        default=1,
+        help='The number of subjects to test on.'
+    )
+
+    parser.add_argument(
+        '--validation_subjects',
+        type=int,
+        default=1,
+        help='The number of subjects held out for the early stopping of the gradient boosting.'
+    )
+
+    parser.add_argument(
+        '--feature_bins',
+        type=int,
+        default=255,
+        help='The number of quantile bins per feature (float32 features if 0).'
+    )
+
+    parser.add_argument(
+        '--n_jobs',
+        type=int,
+        default=1,
+        help='The number of jobs of the classifiers.'
+    )
+
+    args = parser.parse_args()
+    main(args.cache_dir, args.test_subjects, args.validation_subjects, args.feature_bins or None, args.n_jobs)
@@ -0,0 +1,85 @@
+"""Benchmarks the flat forest inference against the scikit-learn forest.
+
+Fits a forest with the pipeline's parameters on random features and predicts the probabilities of as many samples as
+a test subject has brain voxels with both engines. The times and whether the probabilities are identical are printed.
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+try:
+    import mialab.classifier.classifiers as clf
+    import mialab.classifier.flat_forest as flat
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.classifier.classifiers as clf
+    import mialab.classifier.flat_forest as flat
+
+
+def main(no_samples: int, no_features: int, max_depth: int, n_jobs: int):
+
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((100000, no_features)).astype(np.float32)
+    labels = np.digitize(data[:, 0] + data[:, 1] * data[:, -1] + 0.3 * rng.standard_normal(len(data)),
+                         [-1, 0, 0.7, 1.5, 2.5])
+    forest = clf.create_classifier('forest', no_features, max_depth=max_depth, random_state=0, n_jobs=n_jobs)
+    forest.fit(data, labels)
+    test_data = rng.standard_normal((no_samples, no_features)).astype(np.float32)
+
+    print(f'Samples: {no_samples}, features: {no_features}, trees: {forest.n_estimators}, max. depth: {max_depth}, '
+          f'jobs: {n_jobs}')
+
+    start_time = timeit.default_timer()
+    expected = forest.predict_proba(test_data)
+    print(f' scikit-learn: {timeit.default_timer() - start_time:8.2f} s')
+
+    start_time = timeit.default_timer()
+    flat_forest = flat.FlatForest.from_forest(forest)
+    print(f' Flattening:   {timeit.default_timer() - start_time:8.2f} s')
+
+    start_time = timeit.default_timer()
+    actual = flat_forest.predict_proba(test_data)
+    print(f' Flat forest:  {timeit.default_timer() - start_time:8.2f} s')
+    print(f' Identical probabilities: {np.array_equal(actual, expected)}')
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    parser = argparse.ArgumentParser(description='Flat forest inference benchmark')
+
+    parser.add_argument(
+        '--samples',
+        type=int,
+        default=1500000,
+        help='The number of samples (about the brain voxels of a subject).'
+    )
+
+    parser.add_argument(
+        '--features',
+        type=int,
+        default=5,
+        help='The number of features.'
+    )
+
+    parser.add_argument(
+        '--max_depth',
+        type=int,
+        default=clf.FOREST_PARAMS['max_depth'],
+        help='The maximum depth of the trees.'
+    )
+
+    parser.add_argument(
+        '--n_jobs',
+        type=int,
+        default=1,
+        help='The number of jobs of both engines.'
+    )
+
+    args = parser.parse_args()
+    main(args.samples, args.features, args.max_depth, args.n_jobs)
@@ -0,0 +1,63 @@
+"""Benchmarks the Wiener denoising against the reference implementation :func:`scipy.signal.wiener`.
+
+Denoises a skull-stripped image of the atlas' size with kernel sizes 3 to 9 and prints the execution times.
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+import scipy.signal as signal
+
+try:
+    import mialab.filtering.preprocessing as fltr_prep
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.filtering.preprocessing as fltr_prep
+
+
+def main(shape: tuple, repeat: int):
+
+    rng = np.random.default_rng(0)
+    grid = np.indices(shape, sparse=True)
+    center = [n / 2 for n in shape]
+    mask = sum(((g - c) / (c * 0.8)) ** 2 for g, c in zip(grid, center)) <= 1
+    image = (rng.integers(0, 256, shape, dtype=np.uint8) * mask).astype(np.uint8)
+    bounding_box = fltr_prep.get_bounding_box(mask)
+
+    print(f'Image shape: {shape}')
+    print(f'{"kernel":>6} {"scipy [s]":>10} {"box [s]":>10} {"box+bbox [s]":>13} {"speed-up":>9}')
+    for kernel_size in range(3, 10):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_scipy = min(timeit.repeat(lambda: signal.wiener(image, kernel_size), number=1, repeat=repeat))
+        t_box = min(timeit.repeat(lambda: fltr_prep.wiener_denoising(image, kernel_size), number=1, repeat=repeat))
+        t_bbox = min(timeit.repeat(lambda: fltr_prep.wiener_denoising(image, kernel_size, bounding_box=bounding_box),
+                                   number=1, repeat=repeat))
+        print(f'{kernel_size:>6} {t_scipy:>10.3f} {t_box:>10.3f} {t_bbox:>13.3f} {t_scipy / t_bbox:>8.1f}x')
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    parser = argparse.ArgumentParser(description='Wiener denoising benchmark')
+
+    parser.add_argument(
+        '--shape',
+        type=int,
+        nargs=3,
+        default=(181, 217, 181),
+        help='The image shape (z, y, x).'
+    )
+
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='The number of repetitions per measurement.'
+    )
+
+    args = parser.parse_args()
+    main(tuple(args.shape), args.repeat)
@@ -0,0 +1,62 @@
+"""Tests the broadcast atlas coordinates against the homogeneous transformation of all voxel indices."""
+
+import os
+import sys
+
+import numpy as np
+import SimpleITK as sitk
+
+try:
+    import mialab.filtering.feature_extraction as fltr_feat
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.filtering.feature_extraction as fltr_feat
+
+
+def _get_test_image() -> sitk.Image:
+    """Gets a test image with a rotated direction."""
+    image = sitk.Image((7, 5, 6), sitk.sitkFloat32)
+    image.SetOrigin((-90.5, 12.25, -72.0))
+    image.SetSpacing((1.0, 1.5, 2.0))
+    image.SetDirection(sitk.VersorTransform((0.2, 0.3, 0.9), 0.4).GetMatrix())
+    return image
+
+
+def _get_reference(image: sitk.Image, origin: tuple, offset: tuple) -> np.ndarray:
+    """Gets the coordinates (z, y, x, 3) by the homogeneous transformation matrix of all voxel indices."""
+    x, y, z = image.GetSize()
+    indices = np.stack(np.meshgrid(np.arange(x), np.arange(y), np.arange(z), indexing='ij'), axis=-1) + offset
+    tfm = np.reshape(image.GetDirection() + tuple(origin), [3, 4], order='F')
+    coords = indices.reshape(-1, 3) @ tfm[:, :3].T + tfm[:, 3]
+    return np.transpose(coords.reshape(x, y, z, 3), (2, 1, 0, 3))
+
+
+def test_atlas_coordinates():
+    image = _get_test_image()
+    for params in [None, fltr_feat.AtlasCoordinatesParameters((-100.0, 0.0, -80.0), (3, 4, 5))]:
+        origin, offset = (image.GetOrigin(), (0, 0, 0)) if params is None else (params.origin, params.offset)
+        expected = _get_reference(image, origin, offset)
+        img_out = fltr_feat.AtlasCoordinates().execute(image, params)
+
+        assert img_out.GetNumberOfComponentsPerPixel() == 3
+        assert img_out.GetPixelID() == sitk.sitkVectorFloat32
+        np.testing.assert_allclose(sitk.GetArrayFromImage(img_out), expected, rtol=1e-6, atol=1e-4)
+
+
+def test_atlas_coordinates_at_indices():
+    image = _get_test_image()
+    params = fltr_feat.AtlasCoordinatesParameters((-100.0, 0.0, -80.0), (3, 4, 5))
+    indices = np.random.default_rng(0).choice(np.prod(image.GetSize()), 50, replace=False)
+
+    expected = sitk.GetArrayFromImage(fltr_feat.AtlasCoordinates().execute(image, params)).reshape(-1, 3)[indices]
+    actual = fltr_feat.AtlasCoordinates().execute_at(image, indices, params)
+    np.testing.assert_array_equal(actual, expected)
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_atlas_coordinates()
+    test_atlas_coordinates_at_indices()
+    print('Everything seems to work fine!')
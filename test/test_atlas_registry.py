@@ -0,0 +1,77 @@
+"""Tests the registry of the atlas images, i.e. the pickling of references, the lazy loading, and the invalidation."""
+
+import os
+import pickle
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+try:
+    import mialab.utilities.atlas_registry as atlas_registry
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.utilities.atlas_registry as atlas_registry
+
+
+def _write_atlas(path: str, seed: int) -> np.ndarray:
+    """Writes a random atlas image and gets its array."""
+    array = np.random.default_rng(seed).random((10, 12, 14)).astype(np.float32)
+    image = sitk.GetImageFromArray(array)
+    image.SetOrigin((-1.0, 2.0, 3.5))
+    image.SetSpacing((1.0, 0.8, 1.2))
+    sitk.WriteImage(image, path)
+    return array
+
+
+def _assert_atlas_equal(image: sitk.Image, array: np.ndarray):
+    """Asserts that an atlas image has the array and the properties of the written atlas."""
+    np.testing.assert_array_equal(sitk.GetArrayFromImage(image), array)
+    np.testing.assert_allclose(image.GetOrigin(), (-1.0, 2.0, 3.5))
+    np.testing.assert_allclose(image.GetSpacing(), (1.0, 0.8, 1.2))
+
+
+def test_atlas_registry():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'atlas.nii.gz')
+        copy_directory = os.path.join(directory, 'copies')
+        array = _write_atlas(path, 0)
+
+        reference = atlas_registry.register('test', path, copy_directory)
+        assert atlas_registry.get('test') is reference
+        with pytest.raises(KeyError):
+            atlas_registry.get('unknown')
+
+        # the reference pickles without the image, which is loaded lazily
+        data = pickle.dumps(reference)
+        assert len(data) < array.nbytes // 10
+        assert not os.path.exists(copy_directory)
+        unpickled = pickle.loads(data)
+        assert (unpickled.key, unpickled.fingerprint) == ('test', reference.fingerprint)
+        _assert_atlas_equal(unpickled.get_image(), array)
+        assert len(os.listdir(copy_directory)) == 2  # the uncompressed copy and its header
+        assert reference.get_image() is unpickled.get_image()  # loaded once per process
+
+        # further processes load the uncompressed copy instead of the original file
+        atlas_registry._images.clear()
+        os.rename(path, path + '.bak')
+        _assert_atlas_equal(reference.get_image(), array)
+        os.rename(path + '.bak', path)
+
+        # a changed atlas file changes the fingerprint, such that neither the loaded image nor the copy are reused
+        changed_array = _write_atlas(path, 1)
+        changed_reference = atlas_registry.register('test', path, copy_directory)
+        assert changed_reference.fingerprint != reference.fingerprint
+        assert atlas_registry.get('test') is changed_reference
+        _assert_atlas_equal(changed_reference.get_image(), changed_array)
+        assert len(os.listdir(copy_directory)) == 4
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_atlas_registry()
+    print('Everything seems to work fine!')
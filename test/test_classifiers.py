@@ -0,0 +1,80 @@
+"""Tests the creation, the thread limits, and the early stopping of the classifiers."""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+try:
+    import mialab.classifier.classifiers as clf
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.classifier.classifiers as clf
+
+
+def _get_test_data(n_samples: int, seed: int) -> tuple:
+    """Gets uint8 codes of two features, where the label is the quadrant of the features."""
+    data = np.random.default_rng(seed).integers(0, 255, (n_samples, 2)).astype(np.uint8)
+    return data, ((data[:, 0] > 127) + 2 * (data[:, 1] > 127)).astype(np.int16)
+
+
+def test_create_classifier():
+    forest = clf.create_classifier('forest', 4)
+    assert forest.max_features == 4 and forest.n_estimators == clf.FOREST_PARAMS['n_estimators']
+    assert clf.create_classifier('forest', 4, n_estimators=3).n_estimators == 3
+
+    with clf.limit_threads(forest, 3):
+        assert forest.n_jobs == 3
+    assert forest.n_jobs is None  # the number of jobs is restored, also if the block raises
+    with pytest.raises(RuntimeError):
+        with clf.limit_threads(forest, 3):
+            raise RuntimeError('failing fit')
+    assert forest.n_jobs is None
+
+    with pytest.raises(ValueError):
+        clf.create_classifier('unknown', 4)
+
+
+def test_hist_gradient_boosting_early_stopping():
+    data, labels = _get_test_data(2000, 0)
+    data_val, labels_val = _get_test_data(500, 1)
+
+    classifier = clf.create_classifier('hist_gradient_boosting', 2, max_iter=500, random_state=0)
+    with clf.limit_threads(classifier, 1):
+        clf.fit_classifier(classifier, data, labels, data_val, labels_val)
+    assert classifier.n_iter_ == classifier.max_iter < 500
+    assert classifier.score(data_val, labels_val) > 0.95
+
+    classifier = clf.create_classifier('hist_gradient_boosting', 2, max_iter=20)
+    clf.fit_classifier(classifier, data, labels)
+    assert classifier.n_iter_ == 20
+
+
+def test_predict():
+    data, labels = _get_test_data(2000, 0)
+    test_data, _ = _get_test_data(500, 1)
+    for name in clf.CLASSIFIERS:
+        classifier = clf.fit_classifier(clf.create_classifier(name, 2, random_state=0), data, labels + 1)
+        predictions, probabilities = clf.predict(classifier, test_data)
+        np.testing.assert_array_equal(predictions, classifier.predict(test_data))
+        assert probabilities.dtype == np.uint8
+        np.testing.assert_allclose(probabilities / 255, classifier.predict_proba(test_data), atol=0.5 / 255)
+
+
+def test_quantize_probabilities():
+    probabilities = np.array([0.0, 0.001, 0.002, 0.5, 1.0])
+    np.testing.assert_array_equal(clf.quantize_probabilities(probabilities), [0, 0, 1, 128, 255])
+    assert clf.quantize_probabilities(probabilities, np.uint16)[-1] == 65535
+    assert clf.quantize_probabilities(probabilities, np.float32).dtype == np.float32
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_create_classifier()
+    test_hist_gradient_boosting_early_stopping()
+    test_predict()
+    test_quantize_probabilities()
+    print('Everything seems to work fine!')
@@ -0,0 +1,76 @@
+"""Tests the cropping of images to the brain mask's bounding box and the restoring of the uncropped image grid."""
+
+import os
+import sys
+
+import numpy as np
+import pymia.data.conversion as conversion
+import SimpleITK as sitk
+
+try:
+    import mialab.data.structure as structure
+    import mialab.filtering.preprocessing as fltr_prep
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.data.structure as structure
+    import mialab.filtering.preprocessing as fltr_prep
+
+
+def _get_test_images(shape=(20, 24, 18)) -> tuple:
+    """Gets a random image, which is zero outside the padded brain, and the brain mask on a rotated grid."""
+    rng = np.random.default_rng(0)
+    mask = np.zeros(shape, np.uint8)
+    mask[5:12, 8:15, 3:9] = 1  # (z, y, x)
+    image = np.zeros(shape, np.float32)
+    image[3:14, 6:17, 1:11] = rng.random((11, 11, 10))  # the brain padded by two voxels
+
+    images = [sitk.GetImageFromArray(image), sitk.GetImageFromArray(mask)]
+    for img in images:
+        img.SetOrigin((10.0, -5.0, 2.5))
+        img.SetSpacing((0.9, 1.1, 1.3))
+        img.SetDirection((0.0, -1.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0))
+    return images[0], images[1]
+
+
+def _crop(image: sitk.Image, img_mask: sitk.Image) -> tuple:
+    """Crops an image and gets the cropped image and its properties."""
+    cropped = fltr_prep.BrainMaskCropping().execute(image, fltr_prep.BrainMaskCroppingParameters(img_mask))
+    return cropped, structure.CroppedImageProperties(cropped, conversion.ImageProperties(image))
+
+
+def test_cropping_round_trip():
+    image, img_mask = _get_test_images()
+    cropped, image_properties = _crop(image, img_mask)
+
+    # the cropped image is the padded bounding box (x, y, z) and keeps its physical location
+    assert cropped.GetSize() == (10, 11, 11)
+    assert image_properties.offset == (1, 6, 3)
+    np.testing.assert_allclose(cropped.GetOrigin(), image.TransformIndexToPhysicalPoint((1, 6, 3)))
+    assert image_properties.uncropped.size == image.GetSize()
+
+    uncropped = fltr_prep.ImageUncropping().execute(cropped, fltr_prep.ImageUncroppingParams(image_properties))
+    assert conversion.ImageProperties(uncropped) == conversion.ImageProperties(image)
+    np.testing.assert_array_equal(sitk.GetArrayFromImage(uncropped), sitk.GetArrayFromImage(image))
+
+    # vector images, e.g. probabilities, are restored with zeros outside the cropped image
+    vector_image = sitk.Compose([cropped, cropped * 2])
+    uncropped = fltr_prep.ImageUncropping().execute(vector_image, fltr_prep.ImageUncroppingParams(image_properties))
+    assert uncropped.GetNumberOfComponentsPerPixel() == 2
+    np.testing.assert_array_equal(sitk.GetArrayFromImage(uncropped)[..., 1], 2 * sitk.GetArrayFromImage(image))
+
+
+def test_cropping_empty_mask():
+    # without a brain, the image is not cropped
+    image, img_mask = _get_test_images()
+    cropped, image_properties = _crop(image, img_mask * 0)
+    assert cropped.GetSize() == image.GetSize()
+    assert image_properties.offset == (0, 0, 0)
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_cropping_round_trip()
+    test_cropping_empty_mask()
+    print('Everything seems to work fine!')
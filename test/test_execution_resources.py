@@ -0,0 +1,87 @@
+"""Tests the execution resources, i.e. the split of the core budget per phase, its overrides and their application."""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+import SimpleITK as sitk
+import threadpoolctl
+
+try:
+    import mialab.utilities.execution_resources as exec_res
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.utilities.execution_resources as exec_res
+
+
+def _get_blas_threads() -> list:
+    """Gets the number of threads of the loaded BLAS libraries."""
+    np.dot(np.ones((2, 2)), np.ones((2, 2)))  # ensures that numpy's BLAS is loaded
+    return [info['num_threads'] for info in threadpoolctl.threadpool_info() if info['user_api'] == 'blas']
+
+
+def test_parse_overrides():
+    assert exec_res.parse_overrides(None) == {}
+    assert exec_res.parse_overrides(['pre_process:processes=8,sitk_threads=16', 'training:n_jobs=64',
+                                      ' testing : n_jobs = 2']) == \
+        {'pre_process': {'processes': 8, 'sitk_threads': 16}, 'training': {'n_jobs': 64}, 'testing': {'n_jobs': 2}}
+
+    for spec in ('pre_process', 'pre_process:', 'pre_process:processes', 'pre_process:processes=',
+                 'pre_process:processes=two', 'pre_process:processes=-1', 'pre_process:processes=8,'):
+        with pytest.raises(ValueError):
+            exec_res.parse_overrides([spec])
+
+
+def test_execution_resources():
+    resources = exec_res.ExecutionResources(8)
+    pre_process = resources.get('pre_process')
+    assert (pre_process.processes, pre_process.sitk_threads, pre_process.blas_threads, pre_process.n_jobs) == \
+        (8, 1, 1, 1)
+    pre_process = resources.get('pre_process', no_tasks=3)
+    assert (pre_process.processes, pre_process.sitk_threads, pre_process.blas_threads) == (3, 2, 2)
+    pre_process = resources.get('pre_process', multi_process=False)
+    assert (pre_process.processes, pre_process.sitk_threads) == (1, 8)
+    training = resources.get('training')
+    assert (training.processes, training.sitk_threads, training.blas_threads, training.n_jobs) == (1, 8, 1, 8)
+
+    # the threads are shared among the overridden number of processes, unless they are overridden as well
+    resources = exec_res.ExecutionResources(8, {'pre_process': {'processes': 2}, 'training': {'n_jobs': 3}})
+    assert (resources.get('pre_process').processes, resources.get('pre_process').sitk_threads) == (2, 4)
+    assert resources.get('training').n_jobs == 3
+    resources = exec_res.ExecutionResources(8, {'post_process': {'processes': 2, 'blas_threads': 1}})
+    assert (resources.get('post_process').sitk_threads, resources.get('post_process').blas_threads) == (4, 1)
+
+    with pytest.raises(ValueError):
+        exec_res.ExecutionResources(8, {'segmentation': {'processes': 2}})
+    with pytest.raises(ValueError):
+        exec_res.ExecutionResources(8, {'training': {'threads': 2}})
+
+
+def test_execution_resources_phase():
+    sitk_threads = sitk.ProcessObject.GetGlobalDefaultNumberOfThreads()
+    blas_threads = _get_blas_threads()
+    resources = exec_res.ExecutionResources(4, {'pre_process': {'sitk_threads': 3, 'blas_threads': 2}})
+    with resources.phase('pre_process') as phase_resources:
+        assert sitk.ProcessObject.GetGlobalDefaultNumberOfThreads() == phase_resources.sitk_threads == 3
+        assert all(threads == 2 for threads in _get_blas_threads())
+
+    # the threads are restored, also if the phase fails
+    assert sitk.ProcessObject.GetGlobalDefaultNumberOfThreads() == sitk_threads
+    assert _get_blas_threads() == blas_threads
+    with pytest.raises(RuntimeError):
+        with resources.phase('training'):
+            assert sitk.ProcessObject.GetGlobalDefaultNumberOfThreads() == 4
+            raise RuntimeError('failing phase')
+    assert sitk.ProcessObject.GetGlobalDefaultNumberOfThreads() == sitk_threads
+    assert _get_blas_threads() == blas_threads
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_parse_overrides()
+    test_execution_resources()
+    test_execution_resources_phase()
+    print('Everything seems to work fine!')
@@ -0,0 +1,74 @@
+"""Tests the quantization of features to the quantile bins of the training data."""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+try:
+    import mialab.classifier.quantization as quant
+    import mialab.utilities.cache as cache_
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.classifier.quantization as quant
+    import mialab.utilities.cache as cache_
+
+
+def _get_test_data(n_samples: int = 4800) -> np.ndarray:
+    """Gets test features with a continuous, a discrete, and a constant column."""
+    rng = np.random.default_rng(0)
+    return np.stack([rng.standard_normal(n_samples), rng.integers(0, 5, n_samples), np.full(n_samples, 3.0)],
+                    axis=-1).astype(np.float32)
+
+
+def test_feature_quantizer():
+    data = _get_test_data()
+    quantizer = quant.FeatureQuantizer(n_bins=16)
+    codes = quantizer.fit_transform(data)
+
+    assert codes.dtype == np.uint8
+    assert codes[:, 0].max() == 15 and np.all(np.bincount(codes[:, 0]) == len(data) // 16)
+    # the codes preserve the order and equal values share a bin
+    order = np.argsort(data[:, 0])
+    assert np.all(np.diff(codes[order, 0].astype(int)) >= 0)
+    np.testing.assert_array_equal(codes[:, 1], data[:, 1])
+    assert not codes[:, 2].any()
+
+    # values outside the training range fall into the first or last bin
+    test_codes = quantizer.transform(np.array([[-100, -1, 2], [100, 10, 4], [np.nan, 2.5, 3]], np.float32))
+    np.testing.assert_array_equal(test_codes, [[0, 0, 0], [15, 4, 0], [15, 3, 0]])
+
+    assert quant.FeatureQuantizer(n_bins=1000).fit_transform(data).dtype == np.uint16
+    with pytest.raises(ValueError):
+        quantizer.transform(data[:, :2])
+
+
+def test_feature_store_quantized():
+    data = _get_test_data(300)
+    with tempfile.TemporaryDirectory() as directory:
+        store = cache_.FeatureStore(directory)
+        keys = ['key0', 'key1']
+        for key, rows in zip(keys, [slice(0, 100), slice(100, 300)]):
+            store.store(key, key, (data[rows], np.zeros((len(data[rows]), 1), np.int16),
+                                   np.arange(len(data[rows])), np.array(['a', 'b', 'c'])))
+
+        sample = store.sample(keys, 50)
+        assert sample.shape == (50, 3)
+        assert all(any(np.array_equal(row, data_row) for data_row in data) for row in sample)
+        np.testing.assert_array_equal(store.sample(keys, 1000), data)
+
+        quantizer = quant.FeatureQuantizer(n_bins=8).fit(data)
+        codes, labels = store.assemble(keys, quantizer.transform, quantizer.dtype)
+        assert codes.dtype == np.uint8 and labels.shape == (300,)
+        np.testing.assert_array_equal(codes, quantizer.transform(data))
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_feature_quantizer()
+    test_feature_store_quantized()
+    print('Everything seems to work fine!')
@@ -0,0 +1,63 @@
+"""Tests the assembly of the design matrix from the memory-mapped feature store."""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+try:
+    import mialab.utilities.cache as cache_
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.utilities.cache as cache_
+
+
+def _get_feature_matrix(n_samples: int, seed: int, columns=('a', 'b', 'c')) -> tuple:
+    """Gets a random feature matrix with the layout of the feature extractor."""
+    rng = np.random.default_rng(seed)
+    return (rng.random((n_samples, len(columns))).astype(np.float32),
+            rng.integers(0, 3, (n_samples, 1)).astype(np.int16),
+            np.sort(rng.choice(10 * n_samples, n_samples, replace=False)),
+            np.array(columns))
+
+
+def test_feature_store():
+    feature_matrices = [_get_feature_matrix(n, seed) for seed, n in enumerate([7, 0, 12])]
+    with tempfile.TemporaryDirectory() as directory:
+        store = cache_.FeatureStore(directory)
+        keys = ['key{}'.format(i) for i in range(len(feature_matrices))]
+        for key, feature_matrix in zip(keys, feature_matrices):
+            store.store(key, key, feature_matrix)
+
+        loaded = store.load(keys[0])
+        assert isinstance(loaded[0], np.memmap)
+        for expected, actual in zip(feature_matrices[0], loaded):
+            np.testing.assert_array_equal(actual, expected)
+        del loaded
+
+        data, labels = store.assemble(keys)
+        assert data.dtype == np.float32 and labels.dtype == np.int16
+        np.testing.assert_array_equal(data, np.concatenate([f[0] for f in feature_matrices]))
+        np.testing.assert_array_equal(labels, np.concatenate([f[1] for f in feature_matrices]).squeeze())
+
+        chunks = list(store.iter_chunks(keys, chunk_size=5))
+        assert [len(chunk_labels) for _, chunk_labels in chunks] == [5, 2, 5, 5, 2]
+        np.testing.assert_array_equal(np.concatenate([chunk_data for chunk_data, _ in chunks]), data)
+        np.testing.assert_array_equal(np.concatenate([chunk_labels for _, chunk_labels in chunks]), labels)
+
+        with pytest.raises(KeyError):
+            store.assemble(keys + ['missing'])
+
+        store.store('other', 'other', _get_feature_matrix(3, 4, ('a', 'c', 'b')))
+        with pytest.raises(ValueError):
+            store.assemble(keys + ['other'])
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_feature_store()
+    print('Everything seems to work fine!')
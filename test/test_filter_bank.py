@@ -0,0 +1,83 @@
+"""Tests the filter bank features against the corresponding SimpleITK filters of the smoothed image."""
+
+import os
+import sys
+
+import numpy as np
+import SimpleITK as sitk
+
+try:
+    import mialab.filtering.feature_extraction as fltr_feat
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.filtering.feature_extraction as fltr_feat
+
+
+def _get_test_images() -> list:
+    """Gets two random test images with an anisotropic spacing."""
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(2):
+        image = sitk.GetImageFromArray(rng.random((12, 14, 13)).astype(np.float32))
+        image.SetSpacing((1.0, 1.5, 2.0))
+        images.append(image)
+    return images
+
+
+def test_filter_bank():
+    images = _get_test_images()
+    filter_bank = fltr_feat.FilterBankFeatureExtractor((1.0, 2.0))
+    features = sitk.GetArrayFromImage(filter_bank.execute(sitk.Compose(*images)))
+
+    assert features.shape[-1] == len(filter_bank.get_column_names(('T1w', 'T2w'))) == 24
+    assert len(filter_bank.times) == 2
+    for scale, sigma in enumerate(filter_bank.sigmas):
+        for channel, image in enumerate(images):
+            column = (scale * 2 + channel) * 6
+            smoothed = sitk.SmoothingRecursiveGaussian(image, sigma)
+            np.testing.assert_allclose(features[..., column], sitk.GetArrayFromImage(smoothed), atol=1e-6)
+            np.testing.assert_allclose(features[..., column + 1],
+                                       sitk.GetArrayFromImage(sitk.GradientMagnitude(smoothed)), atol=1e-6)
+            np.testing.assert_allclose(features[..., column + 2],
+                                       sitk.GetArrayFromImage(sitk.Laplacian(smoothed)), atol=1e-6)
+            # the eigenvalues are ascending and sum up to the Laplacian
+            assert np.all(np.diff(features[..., column + 3:column + 6], axis=-1) >= 0)
+            np.testing.assert_allclose(features[..., column + 3:column + 6].sum(axis=-1), features[..., column + 2],
+                                       atol=1e-5)
+
+
+def test_filter_bank_at_indices():
+    image = sitk.Compose(*_get_test_images())
+    indices = np.random.default_rng(1).choice(np.prod(image.GetSize()), 100, replace=False)
+    filter_bank = fltr_feat.FilterBankFeatureExtractor((1.0, 2.0))
+
+    expected = sitk.GetArrayFromImage(filter_bank.execute(image)).reshape(-1, 24)[indices]
+    out = np.zeros((len(indices), 30), np.float32)
+    filter_bank.execute_at(image, indices, out[:, 3:27])
+    np.testing.assert_array_equal(out[:, 3:27], expected)
+    assert not out[:, :3].any() and not out[:, 27:].any()
+
+
+def test_symmetric_eigenvalues():
+    rng = np.random.default_rng(2)
+    matrix = {(a, b): rng.standard_normal(1000) for a in range(3) for b in range(a, 3)}
+    for key in [(0, 1), (0, 2), (1, 2)]:
+        matrix[key][:10] = 0  # diagonal matrices with repeated eigenvalues
+    matrix[1, 1][:5] = matrix[0, 0][:5]
+    matrix[2, 2][:3] = matrix[0, 0][:3]
+
+    full = np.empty((1000, 3, 3))
+    for (a, b), entries in matrix.items():
+        full[:, a, b] = full[:, b, a] = entries
+    actual = np.stack(fltr_feat._get_symmetric_eigenvalues(matrix), axis=-1)
+    np.testing.assert_allclose(actual, np.linalg.eigvalsh(full), atol=1e-10)
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_filter_bank()
+    test_filter_bank_at_indices()
+    test_symmetric_eigenvalues()
+    print('Everything seems to work fine!')
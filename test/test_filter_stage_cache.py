@@ -0,0 +1,62 @@
+"""Tests the memoization of filter stages and their invalidation by changes of the filter code."""
+
+import importlib.util
+import os
+import sys
+import tempfile
+
+import SimpleITK as sitk
+
+try:
+    import mialab.utilities.cache as cache_
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.utilities.cache as cache_
+
+_FILTER_CODE = '''
+import pymia.filtering.filter as fltr
+
+
+class AddFilter(fltr.Filter):
+
+    def execute(self, image, params=None):
+        return image + {}
+'''
+
+
+def _import_filter_module(path: str, summand: int):
+    """Writes and imports a module with a filter, which adds a summand to the image."""
+    with open(path, 'w') as f:
+        f.write(_FILTER_CODE.format(summand))
+    spec = importlib.util.spec_from_file_location('add_filter_module', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_filter_stage_cache():
+    image = sitk.Image(4, 4, 4, sitk.sitkFloat32)
+    with tempfile.TemporaryDirectory() as directory:
+        cache = cache_.FilterStageCache(directory)
+        path = os.path.join(directory, 'add_filter_module.py')
+
+        module = _import_filter_module(path, 1)
+        pipeline = cache_.MemoizedFilterPipeline([module.AddFilter(), module.AddFilter()], cache)
+        assert sitk.GetArrayViewFromImage(pipeline.execute(image)).max() == 2
+        assert sitk.GetArrayViewFromImage(pipeline.execute(image)).max() == 2
+        assert cache.misses['AddFilter'] == 2 and cache.hits['AddFilter'] == 2
+
+        # changing the filter's code invalidates the cached stages
+        module = _import_filter_module(path, 10)
+        pipeline = cache_.MemoizedFilterPipeline([module.AddFilter(), module.AddFilter()], cache)
+        assert sitk.GetArrayViewFromImage(pipeline.execute(image)).max() == 20
+        assert cache.misses['AddFilter'] == 4
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_filter_stage_cache()
+    print('Everything seems to work fine!')
@@ -0,0 +1,73 @@
+"""Tests the flat forest inference against the probabilities of the scikit-learn forest."""
+
+import os
+import sys
+
+import numpy as np
+import sklearn.ensemble as sk_ensemble
+
+try:
+    import mialab.classifier.flat_forest as flat
+    import mialab.classifier.persistence as pers
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.classifier.flat_forest as flat
+    import mialab.classifier.persistence as pers
+
+
+def _get_test_data(n_samples: int, seed: int, missing: bool = False) -> tuple:
+    """Gets random features and labels of four classes, optionally with missing values."""
+    rng = np.random.default_rng(seed)
+    data = rng.standard_normal((n_samples, 4)).astype(np.float32)
+    labels = np.digitize(data[:, 0] + data[:, 1] * data[:, 2], [-1, 0, 1])
+    if missing:
+        data[::7, 1] = np.nan
+        data[::11, 3] = np.nan
+    return data, labels
+
+
+def test_flat_forest():
+    for max_depth, missing in [(5, False), (None, False), (4, True)]:
+        data, labels = _get_test_data(3000, 0, missing)
+        forest = sk_ensemble.RandomForestClassifier(n_estimators=15, max_depth=max_depth, random_state=0,
+                                                    n_jobs=1).fit(data, labels)
+        test_data, _ = _get_test_data(5000, 1, True)
+
+        flat_forest = flat.FlatForest.from_forest(forest, chunk_size=1000)
+        np.testing.assert_array_equal(flat_forest.predict_proba(test_data), forest.predict_proba(test_data))
+        np.testing.assert_array_equal(flat_forest.predict(test_data), forest.predict(test_data))
+        np.testing.assert_array_equal(flat_forest.apply(test_data),
+                                      forest.apply(test_data).T + flat_forest.roots)
+
+        for n_jobs in (3, -1, None):
+            flat_forest.n_jobs = n_jobs
+            np.testing.assert_array_equal(flat_forest.predict_proba(test_data), forest.predict_proba(test_data))
+
+    # the forest's n_jobs as in scikit-learn
+    forest.set_params(n_jobs=-1)
+    flat_forest = flat.FlatForest.from_forest(forest, chunk_size=1000)
+    np.testing.assert_array_equal(flat_forest.predict_proba(test_data), forest.predict_proba(test_data))
+
+
+def test_flat_forest_codes_and_counts():
+    data, labels = _get_test_data(3000, 0)
+    codes = np.clip(data * 40 + 128, 0, 255).astype(np.uint8)
+    forest = sk_ensemble.RandomForestClassifier(n_estimators=10, max_depth=6, random_state=0).fit(codes, labels)
+    flat_forest = flat.FlatForest.from_forest(forest)
+    np.testing.assert_array_equal(flat_forest.predict_proba(codes), forest.predict_proba(codes))
+    assert flat_forest.predict_proba(codes[:0]).shape == (0, 4)
+
+    # class counts instead of fractions in the nodes are normalized
+    arrays = pers.get_flat_forest_arrays(forest)
+    arrays['value'] = arrays['value'] * np.random.default_rng(0).integers(1, 100, (len(arrays['value']), 1))
+    np.testing.assert_allclose(flat.FlatForest(arrays, forest.classes_).predict_proba(codes),
+                               forest.predict_proba(codes), rtol=1e-12)
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_flat_forest()
+    test_flat_forest_codes_and_counts()
+    print('Everything seems to work fine!')
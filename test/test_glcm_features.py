@@ -0,0 +1,76 @@
+"""Tests the vectorized and the sparse GLCM texture features against co-occurrence matrices counted voxel by voxel."""
+
+import itertools
+import os
+import sys
+
+import numpy as np
+import SimpleITK as sitk
+
+try:
+    import mialab.filtering.feature_extraction as fltr_feat
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.filtering.feature_extraction as fltr_feat
+
+
+def _get_test_array(shape=(7, 9, 8)) -> np.ndarray:
+    """Gets a test array in [0, 1) with a constant region."""
+    array = np.random.default_rng(0).random(shape)
+    array[:2] = 0.5
+    return array
+
+
+def _get_reference(array: np.ndarray, levels: int, kernel: tuple, offsets: tuple) -> np.ndarray:
+    """Gets the features from the co-occurrence matrices counted voxel by voxel."""
+    grey_levels = fltr_feat.quantize(array, levels)
+    radius = np.array(kernel[::-1]) // 2
+    features = np.zeros(array.shape + (4,))
+    for center in itertools.product(*[range(n) for n in array.shape]):
+        low = np.maximum(np.array(center) - radius, 0)
+        high = np.minimum(np.array(center) + radius, np.array(array.shape) - 1)
+        for offset in offsets:
+            offset = np.array(offset[::-1])
+            counts = np.zeros((levels, levels))
+            for voxel in itertools.product(*[range(lo, hi + 1) for lo, hi in zip(low, high)]):
+                neighbor = np.array(voxel) + offset
+                if np.all(neighbor >= low) and np.all(neighbor <= high):
+                    counts[grey_levels[voxel], grey_levels[tuple(neighbor)]] += 1
+
+            p = (counts + counts.T) / (2 * counts.sum())
+            i, j = np.indices(p.shape)
+            mean = (p * i).sum()
+            variance = (p * (i - mean) ** 2).sum()
+            covariance = (p * (i - mean) * (j - mean)).sum()
+            features[center] += [(p * (i - j) ** 2).sum(), (p / (1 + (i - j) ** 2)).sum(), (p ** 2).sum(),
+                                 covariance / variance if variance > 1e-12 else 1]
+    return features / len(offsets)
+
+
+def test_glcm_features():
+    array = _get_test_array()
+    image = sitk.GetImageFromArray(array)
+    indices = np.random.default_rng(1).choice(array.size, 50, replace=False)
+    for kernel, offsets in [((3, 3, 3), ((1, 0, 0), (0, 1, 0), (0, 0, 1))), ((5, 3, 3), ((1, 1, 0), (1, -1, 0)))]:
+        extractor = fltr_feat.CooccurrenceTextureFeatureExtractor(levels=4, kernel=kernel, offsets=offsets)
+        expected = _get_reference(array, 4, kernel, offsets)
+
+        actual = sitk.GetArrayFromImage(extractor.execute(image))
+        np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-6)
+
+        actual_at = extractor.execute_at(image, indices)
+        np.testing.assert_array_equal(actual_at, actual.reshape(-1, 4)[indices])
+
+
+def test_quantize():
+    np.testing.assert_array_equal(fltr_feat.quantize(np.array([-0.5, 0.0, 0.24, 0.25, 0.99, 1.0, 2.0]), 4),
+                                  [0, 0, 0, 1, 3, 3, 3])
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_glcm_features()
+    test_quantize()
+    print('Everything seems to work fine!')
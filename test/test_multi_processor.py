@@ -0,0 +1,179 @@
+"""Tests the multi-processor, i.e. the streaming of tasks and the transport of arrays and images between processes."""
+
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import SimpleITK as sitk
+
+try:
+    import mialab.data.structure as structure
+    import mialab.utilities.execution_resources as exec_res
+    import mialab.utilities.multi_processor as mproc
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.data.structure as structure
+    import mialab.utilities.execution_resources as exec_res
+    import mialab.utilities.multi_processor as mproc
+
+
+def _get_test_brain_image(id_: str, seed: int) -> structure.BrainImage:
+    """Gets a brain image with random T1w and ground truth images and a feature matrix."""
+    rng = np.random.default_rng(seed)
+    images = {structure.BrainImageTypes.T1w: sitk.GetImageFromArray(rng.random((5, 6, 7)).astype(np.float32)),
+              structure.BrainImageTypes.GroundTruth: sitk.GetImageFromArray(
+                  rng.integers(0, 5, (5, 6, 7)).astype(np.uint8))}
+    for image in images.values():
+        image.SetOrigin((1.0, 2.0, 3.0))
+        image.SetSpacing((0.5, 1.0, 1.5))
+    img = structure.BrainImage(id_, '', images, sitk.AffineTransform(3))
+    img.feature_matrix = (rng.random((10, 3)).astype(np.float32), rng.integers(0, 5, (10, 1)).astype(np.int16),
+                          np.arange(10), np.array(['a', 'b', 'c']))
+    return img
+
+
+def _assert_brain_images_equal(actual: structure.BrainImage, expected: structure.BrainImage):
+    """Asserts that the images, their properties, and the feature matrices of two brain images are equal."""
+    assert actual.id_ == expected.id_
+    for key, image in expected.images.items():
+        np.testing.assert_array_equal(sitk.GetArrayFromImage(actual.images[key]), sitk.GetArrayFromImage(image))
+        assert actual.images[key].GetOrigin() == image.GetOrigin()
+        assert actual.images[key].GetSpacing() == image.GetSpacing()
+    for actual_array, expected_array in zip(actual.feature_matrix, expected.feature_matrix):
+        np.testing.assert_array_equal(actual_array, expected_array)
+
+
+def _get_transport_directories() -> set:
+    """Gets the directories of the shared memory transports on shared memory and in the temporary directory."""
+    return set(glob.glob(os.path.join('/dev/shm', 'mialab-*')) +
+               glob.glob(os.path.join(tempfile.gettempdir(), 'mialab-*')))
+
+
+def test_shared_memory_array_transport():
+    transport = mproc.SharedMemoryArrayTransport.create()
+    try:
+        if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+            assert os.path.dirname(transport.directory) == '/dev/shm'
+
+        for array in (np.arange(24, dtype=np.int16).reshape(2, 3, 4), np.array(['a', 'bc']), np.zeros((0, 3))):
+            descriptor = transport.put(array)
+            assert os.path.isfile(descriptor.path)
+            recovered = transport.get(descriptor)
+            np.testing.assert_array_equal(recovered, array)
+            assert recovered.dtype == array.dtype
+            # the file is removed as soon as the receiving process has mapped it
+            assert not os.path.exists(descriptor.path)
+
+        image = sitk.GetImageFromArray(np.arange(60, dtype=np.float32).reshape(3, 4, 5))
+        np.testing.assert_array_equal(transport.get(transport.put_image(image)), sitk.GetArrayFromImage(image))
+        assert os.listdir(transport.directory) == []
+    finally:
+        transport.cleanup()
+    assert not os.path.exists(transport.directory)
+
+    # without shared memory, the transport falls back to the temporary directory
+    with tempfile.TemporaryDirectory() as directory:
+        transport = mproc.SharedMemoryArrayTransport.create(os.path.join(directory, 'missing'))
+        try:
+            assert os.path.dirname(transport.directory) == tempfile.gettempdir()
+            np.testing.assert_array_equal(transport.get(transport.put(np.arange(3))), np.arange(3))
+        finally:
+            transport.cleanup()
+
+
+def test_shared_memory_multi_processor():
+    directories = _get_transport_directories()
+    params = [('subject{}'.format(i), i) for i in range(3)]
+    for shared_memory in (False, True):
+        images = mproc.MultiProcessor.run(_get_test_brain_image, params,
+                                          pickle_helper_cls=mproc.PreProcessingPickleHelper,
+                                          shared_memory=shared_memory)
+        for img, (id_, seed) in zip(images, params):
+            _assert_brain_images_equal(img, _get_test_brain_image(id_, seed))
+    # the transport's directory with the array files is removed after the run
+    assert _get_transport_directories() == directories
+
+
+def _sleep(index: int, delay: float) -> int:
+    """Sleeps and gets the index."""
+    time.sleep(delay)
+    return index
+
+
+def _fail_if_odd(index: int) -> int:
+    """Gets the index or raises an error for odd indices."""
+    if index % 2 == 1:
+        raise ValueError('odd index {}'.format(index))
+    return index
+
+
+def _get_generator(index: int):
+    """Gets a generator, which cannot be pickled as return value."""
+    return (i for i in range(index))
+
+
+def test_run_iter_order():
+    # the first task takes longer than the second one
+    params = [(0, 0.5), (1, 0.0)]
+    resources = exec_res.PhaseResources(processes=2)
+    assert [index for index, _ in mproc.MultiProcessor.run_iter(_sleep, params, phase_resources=resources)] == [0, 1]
+    results = list(mproc.MultiProcessor.run_iter(_sleep, params, ordered=False, phase_resources=resources))
+    assert [index for index, _ in results] == [1, 0]
+    assert all(index == ret_val for index, ret_val in results)
+
+
+def test_run_iter_max_in_flight():
+    no_submitted = [0]
+
+    def get_params():
+        for i in range(10):
+            no_submitted[0] += 1
+            yield i, 0.0
+
+    resources = exec_res.PhaseResources(processes=2)
+    for ordered in (True, False):
+        no_submitted[0] = 0
+        indices = []
+        for index, _ in mproc.MultiProcessor.run_iter(_sleep, get_params(), max_in_flight=3, ordered=ordered,
+                                                      phase_resources=resources):
+            # the tasks submitted before a return value is yielded include at most three not yielded ones
+            assert no_submitted[0] <= len(indices) + 3
+            indices.append(index)
+        assert sorted(indices) == list(range(10))
+
+
+def test_run_iter_capture_errors():
+    params = [(i,) for i in range(4)]
+    try:
+        list(mproc.MultiProcessor.run_iter(_fail_if_odd, params))
+        assert False, 'the error of the task is raised'
+    except ValueError:
+        pass
+
+    results = list(mproc.MultiProcessor.run_iter(_fail_if_odd, params, capture_errors=True))
+    assert [index for index, _ in results] == [0, 1, 2, 3]
+    assert [ret_val for _, ret_val in results[::2]] == [0, 2]
+    for index, ret_val in results[1::2]:
+        assert isinstance(ret_val, mproc.TaskError) and ret_val.index == index
+        assert isinstance(ret_val.exception, ValueError)
+        assert '_fail_if_odd' in ret_val.traceback
+
+    # errors outside of the task, e.g. of sending the return value, are captured with their traceback as well
+    index, ret_val = next(mproc.MultiProcessor.run_iter(_get_generator, [(3,)], capture_errors=True))
+    assert isinstance(ret_val, mproc.TaskError) and ret_val.index == 0
+    assert 'MaybeEncodingError' in ret_val.traceback
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_shared_memory_array_transport()
+    test_shared_memory_multi_processor()
+    test_run_iter_order()
+    test_run_iter_max_in_flight()
+    test_run_iter_capture_errors()
+    print('Everything seems to work fine!')
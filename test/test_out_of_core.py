@@ -0,0 +1,76 @@
+"""Tests the out-of-core training of a decision forest on the subjects of a feature store."""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+import sklearn.ensemble as sk_ensemble
+
+try:
+    import mialab.classifier.out_of_core as ooc
+    import mialab.utilities.cache as cache_
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.classifier.out_of_core as ooc
+    import mialab.utilities.cache as cache_
+
+
+def _store_subjects(store: cache_.FeatureStore, n_subjects: int, n_samples: int = 200) -> list:
+    """Stores subjects with two features, where the label is the quadrant of the features."""
+    rng = np.random.default_rng(0)
+    keys = []
+    for i in range(n_subjects):
+        data = rng.standard_normal((n_samples, 2)).astype(np.float32)
+        labels = ((data[:, 0] > 0) + 2 * (data[:, 1] > 0)).astype(np.int16)[:, np.newaxis]
+        keys.append('subject{}'.format(i))
+        store.store(keys[-1], keys[-1], (data, labels, np.arange(n_samples), np.array(['x', 'y'])))
+    return keys
+
+
+def test_trees_per_chunk():
+    np.testing.assert_array_equal(ooc.get_trees_per_chunk([100, 100, 200], 8), [2, 2, 4])
+    np.testing.assert_array_equal(ooc.get_trees_per_chunk([100, 100, 100], 10), [3, 4, 3])
+    np.testing.assert_array_equal(ooc.get_trees_per_chunk([1000, 1, 1], 4), [2, 1, 1])
+
+    # skewed chunks get one tree each, and the forest keeps its number of trees
+    for chunk_sizes, n_estimators in (([1000, 1, 1, 1, 1], 3), ([1000, 1, 1, 1, 1], 5), ([1, 1, 1, 1, 1000], 7),
+                                      ([5000, 3, 2000, 1, 7], 100)):
+        if len(chunk_sizes) > n_estimators:
+            with pytest.raises(ValueError):
+                ooc.get_trees_per_chunk(chunk_sizes, n_estimators)
+            continue
+        trees_per_chunk = ooc.get_trees_per_chunk(chunk_sizes, n_estimators)
+        assert trees_per_chunk.sum() == n_estimators
+        assert trees_per_chunk.min() >= 1
+
+
+def test_fit_forest_out_of_core():
+    with tempfile.TemporaryDirectory() as directory:
+        store = cache_.FeatureStore(directory)
+        keys = _store_subjects(store, 5)
+        assert store.get_subject_chunks(keys, 400) == [keys[:2], keys[2:4], keys[4:]]
+
+        forest = sk_ensemble.RandomForestClassifier(n_estimators=10, max_depth=3, random_state=0)
+        ooc.fit_forest_out_of_core(forest, store, keys, 400)
+        assert len(forest.estimators_) == 10 and not forest.warm_start
+        np.testing.assert_array_equal(forest.classes_, [0, 1, 2, 3])
+
+        data, labels = store.assemble(keys)
+        assert np.mean(forest.predict(data) == labels) > 0.95
+
+        store.store('single_class', 'single_class',
+                    (np.ones((10, 2), np.float32), np.zeros((10, 1), np.int16), np.arange(10), np.array(['x', 'y'])))
+        with pytest.raises(ValueError):
+            ooc.fit_forest_out_of_core(sk_ensemble.RandomForestClassifier(n_estimators=10), store,
+                                       keys + ['single_class'], 200)
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_trees_per_chunk()
+    test_fit_forest_out_of_core()
+    print('Everything seems to work fine!')
@@ -0,0 +1,61 @@
+"""Tests saving and loading a forest in the array-backed model format."""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+import sklearn.ensemble as sk_ensemble
+
+try:
+    import mialab.classifier.persistence as pers
+    import mialab.classifier.quantization as quant
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.classifier.persistence as pers
+    import mialab.classifier.quantization as quant
+
+
+def _get_test_forest() -> tuple:
+    """Gets a forest fitted on random data with labels 0, 2, and 5."""
+    rng = np.random.default_rng(0)
+    data = rng.random((1000, 3)).astype(np.float32)
+    labels = np.choose((data[:, 0] > 0.5).astype(int) + (data[:, 1] > 0.7), [0, 2, 5])
+    forest = sk_ensemble.RandomForestClassifier(n_estimators=10, max_depth=5, random_state=0).fit(data, labels)
+    return forest, data
+
+
+def test_save_load_model():
+    forest, data = _get_test_forest()
+    quantizer = quant.FeatureQuantizer(n_bins=16).fit(data)
+    columns = ['a', 'b', 'c']
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'model.npz')
+        pers.save_model(path, forest, columns, 'fingerprint', quantizer)
+
+        for mmap in (True, False):
+            loaded, loaded_quantizer, loaded_columns = pers.load_model(path, 'fingerprint', columns, mmap)
+            assert loaded_columns == columns
+            np.testing.assert_array_equal(loaded.classes_, [0, 2, 5])
+            np.testing.assert_array_equal(loaded.predict_proba(data), forest.predict_proba(data))
+            np.testing.assert_array_equal(loaded.feature_importances_, forest.feature_importances_)
+            np.testing.assert_array_equal(loaded_quantizer.transform(data), quantizer.transform(data))
+            assert isinstance(loaded_quantizer.edges[0], np.memmap) == mmap
+            del loaded, loaded_quantizer
+
+        with pytest.raises(ValueError):
+            pers.load_model(path, 'other fingerprint')
+        with pytest.raises(ValueError):
+            pers.load_model(path, 'fingerprint', ['a', 'c', 'b'])
+
+        pers.save_model(path, forest, columns, 'fingerprint')
+        assert pers.load_model(path)[1] is None
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_save_load_model()
+    print('Everything seems to work fine!')
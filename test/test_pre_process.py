@@ -0,0 +1,84 @@
+"""Tests the selection of the pre-processing filters by the pre-processing parameters."""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+pytest.importorskip('pydensecrf')  # required by the post-processing, which the pipeline utilities import
+
+try:
+    import mialab.data.structure as structure
+    import mialab.utilities.pipeline_utilities as putil
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.data.structure as structure
+    import mialab.utilities.pipeline_utilities as putil
+
+
+def _write_test_subject(directory: str, shape=(32, 36, 28)) -> dict:
+    """Writes atlas images and a noisy subject with a spherical brain and gets the paths of the subject's images."""
+    rng = np.random.default_rng(0)
+    grid = np.indices(shape)
+    center = np.array(shape).reshape(-1, 1, 1, 1) / 2
+    radius = np.sqrt((((grid - center) / (center * 0.4)) ** 2).sum(axis=0))
+    labels = (radius < 1).astype(np.uint8) + (radius < 0.5)
+
+    atlas = sitk.GetImageFromArray(((1 - radius).clip(0) * 200).astype(np.float32))
+    for file_name in ('mni_icbm152_t1_tal_nlin_sym_09a_mask.nii.gz', 'mni_icbm152_t2_tal_nlin_sym_09a.nii.gz'):
+        sitk.WriteImage(atlas, os.path.join(directory, file_name))
+
+    subject_dir = os.path.join(directory, 'subject')
+    os.makedirs(subject_dir)
+    arrays = {structure.BrainImageTypes.T1w: (labels * 40 + rng.normal(0, 10, shape) + 20).astype(np.int16),
+              structure.BrainImageTypes.T2w: (200 - labels * 40 + rng.normal(0, 10, shape)).astype(np.int16),
+              structure.BrainImageTypes.GroundTruth: labels,
+              structure.BrainImageTypes.BrainMask: (radius < 1.1).astype(np.uint8)}
+    paths = {'subject': subject_dir}
+    for image_type, array in arrays.items():
+        paths[image_type] = os.path.join(subject_dir, image_type.name + '.nii.gz')
+        sitk.WriteImage(sitk.GetImageFromArray(array), paths[image_type])
+    paths[structure.BrainImageTypes.RegistrationTransform] = os.path.join(subject_dir, 'affine.txt')
+    sitk.WriteTransform(sitk.AffineTransform(3), paths[structure.BrainImageTypes.RegistrationTransform])
+    return paths
+
+
+def test_pre_process_wiener_denoising():
+    params = {'skullstrip_pre': True, 'intensity_feature': True, 'training': False}
+    with tempfile.TemporaryDirectory() as directory:
+        paths = _write_test_subject(directory)
+        putil.load_atlas_images(directory, os.path.join(directory, 'atlas'))
+        stage_cache = putil.init_stage_cache(directory)
+        try:
+            img = putil.pre_process('subject', dict(paths), **params)
+            assert stage_cache.misses['WienerDenoisingFilter'] == 0
+            assert list(img.feature_matrix[3]) == putil.get_feature_columns(**params)
+
+            img_denoised = putil.pre_process('subject', dict(paths), **params, wiener_denoising_pre=True)
+            assert stage_cache.misses['WienerDenoisingFilter'] == 2
+            for image_type in (structure.BrainImageTypes.T1w, structure.BrainImageTypes.T2w):
+                image = sitk.GetArrayFromImage(img.images[image_type])
+                denoised = sitk.GetArrayFromImage(img_denoised.images[image_type])
+                assert denoised.std() < image.std()
+
+            # the crop keeps all voxels the denoising spreads intensities to
+            img_cropped = putil.pre_process('subject', dict(paths), **params, wiener_denoising_pre=True,
+                                            cropping_pre=True)
+            for image_type in (structure.BrainImageTypes.T1w, structure.BrainImageTypes.T2w):
+                np.testing.assert_array_equal(
+                    sitk.GetArrayFromImage(putil.uncrop(img_cropped.images[image_type],
+                                                        img_cropped.image_properties)),
+                    sitk.GetArrayFromImage(img_denoised.images[image_type]))
+        finally:
+            putil.stage_cache = None
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_pre_process_wiener_denoising()
+    print('Everything seems to work fine!')
@@ -0,0 +1,134 @@
+"""Tests the subject-level pre-processing cache, the eviction of the disk cache, and the cache's command line."""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import SimpleITK as sitk
+
+try:
+    import mialab.data.structure as structure
+    import mialab.utilities.cache as cache_
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.data.structure as structure
+    import mialab.utilities.cache as cache_
+
+_ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def _write_test_subject(directory: str) -> dict:
+    """Writes the images of a random subject and gets their paths."""
+    rng = np.random.default_rng(0)
+    paths = {}
+    for image_type in (structure.BrainImageTypes.T1w, structure.BrainImageTypes.GroundTruth):
+        paths[image_type] = os.path.join(directory, image_type.name + '.nii.gz')
+        sitk.WriteImage(sitk.GetImageFromArray(rng.integers(0, 5, (6, 7, 8)).astype(np.int16)), paths[image_type])
+    return paths
+
+
+def _get_test_image(paths: dict, id_: str = 'subject') -> structure.BrainImage:
+    """Gets a pre-processed image with a feature matrix."""
+    img = structure.BrainImage(id_, '', {key: sitk.ReadImage(path) for key, path in paths.items()},
+                               sitk.AffineTransform(3))
+    img.feature_matrix = (np.arange(12, dtype=np.float32).reshape(4, 3), np.ones((4, 1), np.int16),
+                          np.arange(4), np.array(['a', 'b', 'c']))
+    return img
+
+
+def _set_last_access(cache: cache_.DiskCache, key: str, last_access: float):
+    """Sets the time of an entry's last access."""
+    os.utime(os.path.join(cache.get_entry_directory(key), 'meta.json'), (last_access, last_access))
+
+
+def test_pre_process_cache():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = _write_test_subject(directory)
+        cache = cache_.PreProcessCache(os.path.join(directory, 'cache'), code_fingerprint='code')
+        params = {'skullstrip_pre': True}
+        key = cache.get_key(paths, params)
+        assert cache.load(key, 'subject', '') is None
+
+        img = _get_test_image(paths)
+        cache.store(key, img)
+        loaded = cache.load(key, 'subject', '')
+        assert (cache.hits, cache.misses) == (1, 1)
+        for image_type, image in img.images.items():
+            np.testing.assert_array_equal(sitk.GetArrayFromImage(loaded.images[image_type]),
+                                          sitk.GetArrayFromImage(image))
+        for expected, actual in zip(img.feature_matrix, loaded.feature_matrix):
+            np.testing.assert_array_equal(actual, expected)
+        assert loaded.image_properties == img.image_properties
+
+        # a parameter, the filter code, or an input file change the key
+        assert cache.get_key(paths, {'skullstrip_pre': False}) != key
+        assert cache_.PreProcessCache(os.path.join(directory, 'cache'), code_fingerprint='other').get_key(
+            paths, params) != key
+        sitk.WriteImage(sitk.Image(6, 7, 8, sitk.sitkInt16), paths[structure.BrainImageTypes.T1w])
+        assert cache.get_key(paths, params) != key
+        assert cache.load(cache.get_key(paths, params), 'subject', '') is None
+        assert cache.misses == 2
+
+        # entries are committed atomically, i.e. no temporary directories remain, also if stored concurrently
+        cache.store(key, img)
+        assert [entry.key for entry in cache.entries()] == [key]
+        assert os.listdir(cache.directory) == [key]
+
+
+def test_disk_cache_eviction():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = _write_test_subject(directory)
+        cache = cache_.PreProcessCache(os.path.join(directory, 'cache'))
+        keys = ['key{}'.format(i) for i in range(4)]
+        for i, key in enumerate(keys[:3]):
+            cache.store(key, _get_test_image(paths))
+            _set_last_access(cache, key, 1000 + i)
+        entry_size = cache.entries()[0].size
+
+        # loading an entry marks it as recently accessed, such that the least recently accessed one is evicted
+        cache.load(keys[0], 'subject', '')
+        cache.max_size = 3 * entry_size
+        cache.store(keys[3], _get_test_image(paths))
+        assert sorted(entry.key for entry in cache.entries()) == [keys[0], keys[2], keys[3]]
+        assert cache.size() <= cache.max_size
+
+        # the entry, which has just been stored, is kept even if it exceeds the maximum size alone
+        cache.max_size = entry_size // 2
+        cache.store('large', _get_test_image(paths))
+        assert [entry.key for entry in cache.entries()] == ['large']
+
+
+def _run_cache_command(*args) -> str:
+    """Runs the cache's command line and gets its output."""
+    return subprocess.run([sys.executable, '-m', 'mialab.utilities.cache'] + list(args), cwd=_ROOT_DIR, check=True,
+                          capture_output=True, text=True).stdout
+
+
+def test_cache_command_line():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = _write_test_subject(directory)
+        cache = cache_.PreProcessCache(directory)
+        for key, last_access in (('old', 1000), ('new', 2e9)):
+            cache.store(key, _get_test_image(paths, key))
+            _set_last_access(cache, key, last_access)
+
+        assert '2 entries' in _run_cache_command('--cache_dir', directory, 'info')
+        assert [line.split()[0] for line in _run_cache_command('--cache_dir', directory, 'list').splitlines()
+                if line.startswith(('old', 'new'))] == ['old', 'new']
+
+        assert 'removed 1 entries' in _run_cache_command('--cache_dir', directory, 'purge', '--older_than', '1')
+        assert [entry.key for entry in cache.entries()] == ['new']
+        _run_cache_command('--cache_dir', directory, 'purge', '--max_size', '0')
+        assert cache.entries() == []
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_pre_process_cache()
+    test_disk_cache_eviction()
+    test_cache_command_line()
+    print('Everything seems to work fine!')
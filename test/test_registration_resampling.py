@@ -0,0 +1,99 @@
+"""Tests the registration fused with the resampling against the registration followed by the resampling."""
+
+import os
+import sys
+
+import numpy as np
+import SimpleITK as sitk
+
+try:
+    import mialab.filtering.preprocessing as fltr_prep
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.filtering.preprocessing as fltr_prep
+
+_NEW_SPACING = (0.9, 0.9, 0.9)
+
+
+def _get_test_images() -> tuple:
+    """Gets an atlas, a smooth subject image and its ground truth with another grid, and an affine transformation."""
+    shape = (36, 40, 32)
+    grid = np.indices(shape)
+    center = np.array(shape).reshape(-1, 1, 1, 1) / 2
+    radius = np.sqrt((((grid - center) / (center * 0.6)) ** 2).sum(axis=0))
+
+    atlas = sitk.GetImageFromArray(np.zeros(shape, np.float32))
+    atlas.SetOrigin((-2.0, 1.0, 3.0))
+
+    image = sitk.GetImageFromArray((100 * np.exp(-radius ** 2) + 20 * np.sin(grid[2] / 5)).astype(np.float32))
+    ground_truth = sitk.GetImageFromArray((radius < 1).astype(np.uint8) + (radius < 0.5))
+    for img in (image, ground_truth):
+        img.SetSpacing((1.1, 0.95, 1.2))
+        img.SetOrigin((-4.0, 0.0, 1.5))
+
+    transform = sitk.Euler3DTransform((10.0, 12.0, 11.0), 0.05, -0.03, 0.08, (0.8, -0.5, 0.3))
+    return atlas, image, ground_truth, transform
+
+
+def _get_inside_mask(image: sitk.Image, atlas: sitk.Image, transform: sitk.Transform) -> np.ndarray:
+    """Gets the voxels of the resampled atlas grid, which are mapped at least two voxels inside the subject image."""
+    inside = np.zeros(image.GetSize()[::-1], np.uint8)
+    inside[2:-2, 2:-2, 2:-2] = 1
+    inside = sitk.GetImageFromArray(inside)
+    inside.CopyInformation(image)
+    params = fltr_prep.ImageRegistrationParameters(atlas, transform, True)
+    return sitk.GetArrayFromImage(fltr_prep.ImageRegistrationResampling(_NEW_SPACING).execute(inside, params)) == 1
+
+
+def _register_two_step(image: sitk.Image, params: fltr_prep.ImageRegistrationParameters, method: str) -> sitk.Image:
+    """Registers an image to the atlas grid and resamples it to the new spacing afterwards."""
+    registered = fltr_prep.ImageRegistration().execute(image, params)
+    return fltr_prep.Resampling(_NEW_SPACING, method).execute(registered)
+
+
+def test_image_registration_resampling():
+    atlas, image, ground_truth, transform = _get_test_images()
+    params = fltr_prep.ImageRegistrationParameters(atlas, transform)
+    fused = fltr_prep.ImageRegistrationResampling(_NEW_SPACING, 'linear').execute(image, params)
+    two_step = _register_two_step(image, params, 'linear')
+
+    # both filters yield the same grid
+    assert fused.GetSize() == two_step.GetSize()
+    np.testing.assert_allclose(fused.GetOrigin(), two_step.GetOrigin())
+    np.testing.assert_allclose(fused.GetSpacing(), _NEW_SPACING)
+    assert fused.GetPixelID() == image.GetPixelID()
+
+    # the intensities differ only by the error of the second interpolation, except at the border of the subject image,
+    # where the registration interpolates with the default value outside the image
+    inside = _get_inside_mask(image, atlas, transform)
+    difference = np.abs(sitk.GetArrayFromImage(fused) - sitk.GetArrayFromImage(two_step))[inside]
+    assert inside.mean() > 0.5
+    assert difference.max() < 0.05 * np.ptp(sitk.GetArrayFromImage(two_step)[inside])
+    assert difference.mean() < 0.005 * np.ptp(sitk.GetArrayFromImage(two_step)[inside])
+
+    # the ground truth is interpolated by nearest neighbor, such that only voxels at the label borders differ
+    params_gt = fltr_prep.ImageRegistrationParameters(atlas, transform, True)
+    fused_gt = sitk.GetArrayFromImage(
+        fltr_prep.ImageRegistrationResampling(_NEW_SPACING, 'linear').execute(ground_truth, params_gt))
+    two_step_gt = sitk.GetArrayFromImage(_register_two_step(ground_truth, params_gt, 'NN'))
+    assert set(np.unique(fused_gt)) == {0, 1, 2}
+    assert np.mean(fused_gt[inside] == two_step_gt[inside]) > 0.97
+
+
+def test_image_registration_resampling_atlas_spacing():
+    # without a new spacing, the fused filter is the registration
+    atlas, image, _, transform = _get_test_images()
+    params = fltr_prep.ImageRegistrationParameters(atlas, transform)
+    fused = fltr_prep.ImageRegistrationResampling(atlas.GetSpacing(), 'linear').execute(image, params)
+    registered = fltr_prep.ImageRegistration().execute(image, params)
+    assert fused.GetSize() == registered.GetSize()
+    np.testing.assert_array_equal(sitk.GetArrayFromImage(fused), sitk.GetArrayFromImage(registered))
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_image_registration_resampling()
+    test_image_registration_resampling_atlas_spacing()
+    print('Everything seems to work fine!')
@@ -0,0 +1,71 @@
+"""Tests the vectorized and the sparse first-order texture features against the voxel-wise feature function."""
+
+import os
+import sys
+
+import numpy as np
+import SimpleITK as sitk
+
+try:
+    import mialab.filtering.feature_extraction as fltr_feat
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.filtering.feature_extraction as fltr_feat
+
+
+def _get_test_image(shape=(9, 11, 10)) -> sitk.Image:
+    """Gets a test image with a zero background, a constant region and a negative value."""
+    rng = np.random.default_rng(0)
+    image = rng.random(shape)
+    image[:3] = 0
+    image[7:, 7:, :] = 0.5
+    image[5, 5, 5] = -0.3
+    return sitk.GetImageFromArray(image)
+
+
+def _get_reference(image: sitk.Image, kernel: tuple) -> np.ndarray:
+    """Gets the features calculated voxel by voxel."""
+    def function_(values):
+        return fltr_feat.first_order_texture_features_function(values)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return sitk.GetArrayFromImage(fltr_feat.NeighborhoodFeatureExtractor(kernel, function_).execute(image))
+
+
+def test_first_order_texture_features():
+    image = _get_test_image()
+    for kernel in [(3, 3, 3), (5, 3, 4), (3, 4, 5)]:
+        expected = _get_reference(image, kernel)
+        actual = fltr_feat.first_order_texture_features(sitk.GetArrayFromImage(image), kernel, chunk_size=4)
+        np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-5, equal_nan=True)
+
+
+def test_neighborhood_feature_extractor():
+    image = _get_test_image()
+    image.SetSpacing((1.0, 1.5, 2.0))
+    expected = _get_reference(image, (3, 3, 3))
+    img_out = fltr_feat.NeighborhoodFeatureExtractor((3, 3, 3)).execute(image)
+
+    assert img_out.GetNumberOfComponentsPerPixel() == 16
+    assert img_out.GetSpacing() == image.GetSpacing()
+    np.testing.assert_allclose(sitk.GetArrayFromImage(img_out), expected, rtol=1e-4, atol=1e-5, equal_nan=True)
+
+
+def test_neighborhood_feature_extractor_at_indices():
+    image = _get_test_image()
+    indices = np.random.default_rng(1).choice(np.prod(image.GetSize()), 200, replace=False)
+    for kernel in [(3, 3, 3), (5, 3, 4)]:
+        expected = _get_reference(image, kernel).reshape(-1, 16)[indices]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            actual = fltr_feat.NeighborhoodFeatureExtractor(kernel).execute_at(image, indices)
+        np.testing.assert_array_equal(actual, expected)
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_first_order_texture_features()
+    test_neighborhood_feature_extractor()
+    test_neighborhood_feature_extractor_at_indices()
+    print('Everything seems to work fine!')
@@ -0,0 +1,74 @@
+"""Tests the Wiener denoising against the reference implementation :func:`scipy.signal.wiener`."""
+
+import os
+import sys
+
+import numpy as np
+import scipy.signal as signal
+import SimpleITK as sitk
+
+try:
+    import mialab.filtering.preprocessing as fltr_prep
+except ImportError:
+    # Append the MIALab root directory to Python path
+    sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), '..'))
+    import mialab.filtering.preprocessing as fltr_prep
+
+
+def _get_test_image(shape=(40, 48, 36)) -> tuple:
+    """Gets a noisy skull-stripped test image and its brain mask as arrays."""
+    rng = np.random.default_rng(42)
+    grid = np.indices(shape)
+    center = np.array(shape).reshape(-1, 1, 1, 1) / 2
+    mask = (((grid - center) / (center * 0.7)) ** 2).sum(axis=0) <= 1
+    image = 100 + 50 * np.sin(grid[0] / 4) + 20 * rng.standard_normal(shape)
+    image = np.clip(image, 0, 255).astype(np.uint8) * mask
+    return image, mask.astype(np.uint8)
+
+
+def _wiener(image: np.ndarray, kernel_size: int) -> np.ndarray:
+    """Gets the reference result of :func:`scipy.signal.wiener`."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return signal.wiener(image.astype(np.float64), kernel_size)
+
+
+def test_wiener_denoising():
+    image, _ = _get_test_image()
+    for kernel_size in (3, 4, 9):
+        expected = _wiener(image, kernel_size)
+        np.testing.assert_allclose(fltr_prep.wiener_denoising(image, kernel_size), expected, rtol=1e-4, atol=1e-2)
+
+
+def test_wiener_denoising_bounding_box():
+    image, mask = _get_test_image()
+    bounding_box = fltr_prep.get_bounding_box(mask)
+    for kernel_size in (3, 9):
+        expected = _wiener(image, kernel_size)
+        actual = fltr_prep.wiener_denoising(image, kernel_size, bounding_box=bounding_box)
+        np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-2)
+
+
+def test_wiener_denoising_filter():
+    image, mask = _get_test_image()
+    img = sitk.GetImageFromArray(image)
+    img.SetSpacing((1.0, 1.5, 2.0))
+    img_mask = sitk.GetImageFromArray(mask)
+    img_mask.CopyInformation(img)
+
+    fltr = fltr_prep.WienerDenoisingFilter(kernel_size=9)
+    denoised = fltr.execute(img)
+    denoised_cropped = fltr.execute(img, fltr_prep.WienerDenoisingParameters(img_mask))
+
+    assert denoised.GetSpacing() == img.GetSpacing()
+    expected = _wiener(image, 9)
+    np.testing.assert_allclose(sitk.GetArrayFromImage(denoised), expected, rtol=1e-4, atol=1e-2)
+    np.testing.assert_allclose(sitk.GetArrayFromImage(denoised_cropped), expected, rtol=1e-4, atol=1e-2)
+
+
+if __name__ == "__main__":
+    """The program's entry point."""
+
+    test_wiener_denoising()
+    test_wiener_denoising_bounding_box()
+    test_wiener_denoising_filter()
+    print('Everything seems to work fine!')